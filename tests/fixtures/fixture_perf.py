@@ -0,0 +1,105 @@
+from io import StringIO
+from types import SimpleNamespace
+
+import pytest
+from django.core.cache import cache
+from django.db import transaction
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('perf', 'Бюджеты производительности')
+    group.addoption(
+        '--perf-size', type=int, default=1000,
+        help='число постов в наборе данных для тестов производительности '
+             '(1000, 100000, 1000000)',
+    )
+    group.addoption(
+        '--perf-slack', type=float, default=1.0,
+        help='множитель бюджетов времени (для медленных машин)',
+    )
+    group.addoption(
+        '--perf-repeat', type=int, default=5,
+        help='повторов каждого замера времени',
+    )
+    group.addoption(
+        '--perf-time', action='store_true',
+        help='проверять бюджеты времени (perf_time): они зависят '
+             'от машины, поэтому по умолчанию выключены',
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'perf_time: бюджет времени ответа, только с --perf-time')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--perf-time'):
+        return
+    skip = pytest.mark.skip(reason='бюджеты времени включает --perf-time')
+    for item in items:
+        if 'perf_time' in item.keywords:
+            item.add_marker(skip)
+
+
+def seed(size):
+    """Набор данных на size постов командой seed (генераторы posts.seeding):
+    авторы по Ципфу, группы, комментарии с ответами, подписки и ленты.
+    Для страниц обсуждения к нему добавляется пост читателя с 60 ветками
+    и 60 ответами в последней."""
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from django.db.models import Count
+
+    from posts.models import Comment, Group, Post
+
+    User = get_user_model()
+    call_command(
+        'seed', '--until=2026-01-01', prefix='perf', stdout=StringIO(),
+        users=max(20, size // 10), authors=max(10, size // 100),
+        groups=max(5, size // 1000), posts=size, comments=size // 2,
+        follows=5, images=0, image_share=0, workers=0,
+    )
+    seeded = User.objects.filter(username__startswith='perf_')
+    reader = seeded.annotate(follows=Count('follower')).order_by(
+        '-follows', 'pk').first()
+    authors = list(seeded.filter(posts__isnull=False).distinct().order_by(
+        'pk'))
+    followed = set(reader.follower.values_list('author', flat=True))
+    group = Group.objects.filter(slug__startswith='perf-').order_by(
+        '-posts_count', 'pk').first()
+    post = Post.objects.create(
+        author=reader, group=group, text='Пост для замеров')
+    roots = [Comment.objects.create(
+        post=post, author=authors[i % len(authors)], text=f'Ветка {i}')
+        for i in range(60)]
+    for i in range(60):
+        Comment.objects.create(
+            post=post, author=reader, text=f'Ответ {i}', parent=roots[-1])
+    word = Post.objects.filter(author=authors[0]).latest(
+        'pub_date').text.split()[0].strip('.,;:!?')
+    return SimpleNamespace(
+        size=size, reader=reader, author=authors[0],
+        stranger=next(author for author in reversed(authors)
+                      if author.pk not in followed),
+        group=group, post=post, thread=roots[-1], word=word,
+    )
+
+
+@pytest.fixture(scope='module')
+def perf_data(request, django_db_setup, django_db_blocker):
+    """Данные для замеров создаются один раз на модуль во внешней
+    транзакции и откатываются после него: в остальные тесты сессии
+    не попадают ни строки, ни сдвинутые счётчики id. Транзакции тестов
+    вложены в неё точками сохранения."""
+    atomic = transaction.atomic()
+    with django_db_blocker.unblock():
+        atomic.__enter__()
+        data = seed(request.config.getoption('--perf-size'))
+    try:
+        yield data
+    finally:
+        with django_db_blocker.unblock():
+            transaction.set_rollback(True)
+            atomic.__exit__(None, None, None)
+        cache.clear()
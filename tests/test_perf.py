@@ -0,0 +1,92 @@
+from statistics import median
+from time import perf_counter
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import urls
+
+pytestmark = [pytest.mark.django_db]
+
+# имя адреса: (метод, аргументы адреса по набору данных, параметры
+#              или функция набора данных, запросов к базе, медиана
+#              времени в мс)
+BUDGETS = {
+    'index': ('get', lambda d: {}, {}, 3, 50),
+    'group_list': ('get', lambda d: {'slug': d.group.slug}, {}, 5, 50),
+    'profile': ('get', lambda d: {'username': d.author.username}, {}, 6, 50),
+    'post_detail': ('get', lambda d: {'post_id': d.post.pk}, {}, 6, 60),
+    'search': ('get', lambda d: {}, lambda d: {'q': d.word}, 5, 60),
+    'comments': ('get', lambda d: {'post_id': d.post.pk}, {}, 5, 50),
+    'replies': ('get', lambda d: {'post_id': d.post.pk,
+                                  'comment_id': d.thread.pk}, {}, 4, 50),
+    'post_create': ('get', lambda d: {}, {}, 3, 60),
+    'post_edit': ('get', lambda d: {'post_id': d.post.pk}, {}, 5, 60),
+    'add_comment': ('post', lambda d: {'post_id': d.post.pk},
+                    {'text': 'Замер'}, 8, 30),
+    'follow_index': ('get', lambda d: {}, {}, 4, 50),
+    'profile_follow': ('get', lambda d: {'username': d.stranger.username},
+                       {}, 4, 30),
+    'profile_unfollow': ('get', lambda d: {'username': d.author.username},
+                         {}, 4, 30),
+}
+
+
+@pytest.fixture
+def perf_client(client, perf_data):
+    client.force_login(perf_data.reader)
+    return client
+
+
+def request_view(client, name, data):
+    method, kwargs, params, _, _ = BUDGETS[name]
+    if callable(params):
+        params = params(data)
+    cache.clear()
+    response = getattr(client, method)(
+        reverse(f'posts:{name}', kwargs=kwargs(data)), params)
+    assert response.status_code in (200, 302), (
+        f'Страница `posts:{name}` вернула код {response.status_code}'
+    )
+    return response
+
+
+class TestPerformanceBudgets:
+
+    def test_every_view_has_budget(self):
+        names = {pattern.name for pattern in urls.urlpatterns}
+        assert names == set(BUDGETS), (
+            'У каждой страницы `posts.urls` должен быть бюджет в `BUDGETS`: '
+            f'нет бюджета у {sorted(names - set(BUDGETS))}, '
+            f'лишние бюджеты {sorted(set(BUDGETS) - names)}'
+        )
+
+    @pytest.mark.parametrize('name', sorted(BUDGETS))
+    def test_query_budget(self, perf_client, perf_data, name):
+        request_view(perf_client, name, perf_data)
+        with CaptureQueriesContext(connection) as queries:
+            request_view(perf_client, name, perf_data)
+        budget = BUDGETS[name][3]
+        assert len(queries) <= budget, (
+            f'Страница `posts:{name}` делает {len(queries)} запросов к базе '
+            f'при бюджете {budget} (постов: {perf_data.size}):\n'
+            + '\n'.join(query['sql'] for query in queries)
+        )
+
+    @pytest.mark.perf_time
+    @pytest.mark.parametrize('name', sorted(BUDGETS))
+    def test_time_budget(self, request, perf_client, perf_data, name):
+        request_view(perf_client, name, perf_data)
+        samples = []
+        for _ in range(request.config.getoption('--perf-repeat')):
+            start = perf_counter()
+            request_view(perf_client, name, perf_data)
+            samples.append((perf_counter() - start) * 1000)
+        budget = BUDGETS[name][4] * request.config.getoption('--perf-slack')
+        assert median(samples) <= budget, (
+            f'Страница `posts:{name}` отвечает за {median(samples):.1f} мс '
+            f'при бюджете {budget:.0f} мс (постов: {perf_data.size})'
+        )
@@ -0,0 +1,51 @@
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from core import metrics
+
+MISSING = object()
+
+
+class FragmentCache(BaseCache):
+    '''Кэш фрагментов шаблонов для тега {% cache %}: записи лежат
+    в кэше OPTIONS.CACHE (по умолчанию default) под теми же ключами,
+    а попадания и промахи чтения считаются в core.metrics.
+    '''
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._alias = options.get('CACHE', 'default')
+
+    @property
+    def _cache(self):
+        return caches[self._alias]
+
+    def get(self, key, default=None, version=None):
+        value = self._cache.get(key, MISSING, version=version)
+        metrics.record_fragment(value is not MISSING)
+        return default if value is MISSING else value
+
+    def get_many(self, keys, version=None):
+        return self._cache.get_many(keys, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._cache.add(key, value, timeout, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._cache.set(key, value, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._cache.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._cache.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        return self._cache.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._cache.incr(key, delta, version=version)
+
+    def clear(self):
+        self._cache.clear()
@@ -0,0 +1,249 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# время последнего обращения обновляется не чаще, чем раз в секунду
+ACCESS_RESOLUTION = 1.0
+CHUNK = 500
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE stats SET entries = entries + 1, bytes = bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE stats SET entries = entries - 1, bytes = bytes - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache BEGIN
+    UPDATE stats SET bytes = bytes - OLD.size + NEW.size;
+END;
+'''
+
+UPSERT = '''
+INSERT INTO cache (key, value, expires, accessed, size)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value,
+    expires = excluded.expires,
+    accessed = excluded.accessed,
+    size = excluded.size
+'''
+
+
+class SQLiteCache(BaseCache):
+    '''Кэш в файле SQLite, общий для всех процессов на одной машине.
+    LOCATION            - путь к файлу базы;
+    OPTIONS.MAX_ENTRIES - предел числа записей;
+    OPTIONS.MAX_SIZE    - предел суммарного размера значений в байтах
+                          (0 — без ограничения).
+    При превышении пределов вытесняются давно не читавшиеся записи (LRU).
+    '''
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 0))
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            # соединение не переживает fork воркера
+            local.db = sqlite3.connect(
+                self._path, timeout=10, isolation_level=None)
+            local.db.execute('PRAGMA journal_mode=WAL')
+            local.db.execute('PRAGMA synchronous=NORMAL')
+            local.db.executescript(SCHEMA)
+            local.pid = os.getpid()
+        return local.db
+
+    @contextmanager
+    def _write(self):
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _put(self, db, key, value, timeout, now):
+        expires = self.get_backend_timeout(timeout)
+        if expires is not None and expires <= now:
+            db.execute('DELETE FROM cache WHERE key = ?', (key,))
+            return
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        db.execute(UPSERT, (key, blob, expires, now, len(blob)))
+
+    def _over_limit(self, db):
+        entries, size = db.execute(
+            'SELECT entries, bytes FROM stats').fetchone()
+        return entries and (
+            entries > self._max_entries
+            or (self._max_size and size > self._max_size)
+        ), entries
+
+    def _cull(self, db, now):
+        over, entries = self._over_limit(db)
+        if not over:
+            return
+        db.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (now,))
+        over, entries = self._over_limit(db)
+        while over:
+            count = (entries // self._cull_frequency
+                     if self._cull_frequency else entries)
+            db.execute(
+                'DELETE FROM cache WHERE key IN '
+                '(SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                (max(count, 1),))
+            over, entries = self._over_limit(db)
+
+    def _touch_accessed(self, keys, now):
+        for start in range(0, len(keys), CHUNK):
+            chunk = keys[start:start + CHUNK]
+            self._db.execute(
+                'UPDATE cache SET accessed = ? WHERE accessed < ? AND key IN '
+                f'({",".join("?" * len(chunk))})',
+                (now, now - ACCESS_RESOLUTION, *chunk))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._write() as db:
+            row = db.execute(
+                'SELECT expires FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is not None and (row[0] is None or row[0] > now):
+                return False
+            self._put(db, key, value, timeout, now)
+            self._cull(db, now)
+        return True
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        row = self._db.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?',
+            (key,)).fetchone()
+        if row is None:
+            return default
+        value, expires, accessed = row
+        if expires is not None and expires <= now:
+            self._db.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now))
+            return default
+        if accessed < now - ACCESS_RESOLUTION:
+            self._touch_accessed([key], now)
+        return pickle.loads(value)
+
+    def get_many(self, keys, version=None):
+        names = {self._key(key, version): key for key in keys}
+        found = {}
+        now = time.time()
+        stored = list(names)
+        for start in range(0, len(stored), CHUNK):
+            chunk = stored[start:start + CHUNK]
+            rows = self._db.execute(
+                'SELECT key, value FROM cache WHERE '
+                '(expires IS NULL OR expires > ?) AND key IN '
+                f'({",".join("?" * len(chunk))})',
+                (now, *chunk)).fetchall()
+            for key, value in rows:
+                found[key] = pickle.loads(value)
+        if found:
+            self._touch_accessed(list(found), now)
+        return {names[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._write() as db:
+            self._put(db, key, value, timeout, now)
+            self._cull(db, now)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        with self._write() as db:
+            for key, value in data.items():
+                self._put(db, self._key(key, version), value, timeout, now)
+            self._cull(db, now)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        cursor = self._db.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, now))
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        '''Атомарное изменение числа: чтение и запись в одной транзакции.'''
+        name = self._key(key, version)
+        now = time.time()
+        with self._write() as db:
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (name, now)).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            db.execute(
+                'UPDATE cache SET value = ?, size = ?, accessed = ? '
+                'WHERE key = ?', (blob, len(blob), now, name))
+        return value
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_many(self, keys, version=None):
+        stored = [self._key(key, version) for key in keys]
+        with self._write() as db:
+            for start in range(0, len(stored), CHUNK):
+                chunk = stored[start:start + CHUNK]
+                db.execute(
+                    'DELETE FROM cache WHERE key IN '
+                    f'({",".join("?" * len(chunk))})', chunk)
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time())).fetchone()
+        return row is not None
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
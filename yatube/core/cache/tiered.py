@@ -0,0 +1,202 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SEQUENCE_KEY = 'tiered:sequence'
+LOG_KEY = 'tiered:log:{}'
+CLEAR = '*'  # запись журнала: сбросить L1 целиком
+# неизменяемые значения хранятся в L1 как есть, остальные — копией
+IMMUTABLE = (str, bytes, int, float, bool, type(None))
+MISSING = object()
+
+
+class TieredCache(BaseCache):
+    '''Двухуровневый кэш: LRU в памяти процесса (L1) перед общим
+    кэшем (L2).
+    OPTIONS.SHARED        - алиас общего кэша в settings.CACHES;
+    OPTIONS.MAX_ENTRIES   - предел записей L1;
+    OPTIONS.L1_TIMEOUT    - сколько секунд запись живёт в L1;
+    OPTIONS.SYNC_INTERVAL - как часто L1 читает журнал изменений из L2;
+    OPTIONS.LOG_SIZE      - сколько записей журнала может отстать
+                            процесс, прежде чем сбросит L1 целиком;
+    OPTIONS.LOG_TIMEOUT   - сколько секунд живёт запись журнала.
+    incr и delete дописывают ключ в журнал в L2 (номер записи —
+    счётчик через incr), остальные процессы при сверке выбрасывают
+    из L1 только эти ключи. Поэтому сброс версий контента
+    (posts.versions) доходит до всех воркеров, не вычищая их L1,
+    а set существующего ключа виден в чужом L1 не позже L1_TIMEOUT.
+    Если записи журнала уже нет (вытеснена, устарела или ещё не
+    записана), процесс сбрасывает L1 целиком.
+    '''
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._l1_timeout = float(options.get('L1_TIMEOUT', 5))
+        self._sync_interval = float(options.get('SYNC_INTERVAL', 1))
+        self._log_size = int(options.get('LOG_SIZE', 1000))
+        self._log_timeout = int(options.get('LOG_TIMEOUT', 60))
+        self._l1 = OrderedDict()
+        self._lock = threading.Lock()
+        self._sequence = None
+        self._checked = 0.0
+
+    @property
+    def _l2(self):
+        return caches[self._shared_alias]
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self._checked < self._sync_interval:
+            return
+        self._checked = now
+        sequence = self._l2.get(SEQUENCE_KEY, 0)
+        seen, self._sequence = self._sequence, sequence
+        if seen is None or sequence == seen:
+            return
+        if not 0 < sequence - seen <= self._log_size:
+            self._l1_clear()
+            return
+        keys = [LOG_KEY.format(n) for n in range(seen + 1, sequence + 1)]
+        changed = self._l2.get_many(keys)
+        if len(changed) < len(keys) or CLEAR in changed.values():
+            self._l1_clear()
+            return
+        with self._lock:
+            for name in changed.values():
+                self._l1.pop(name, None)
+
+    def _publish(self, *names):
+        '''Запись изменённых ключей L1 в журнал для остальных процессов.'''
+        try:
+            last = self._l2.incr(SEQUENCE_KEY, len(names))
+        except ValueError:
+            self._l2.add(SEQUENCE_KEY, 0, None)
+            last = self._l2.incr(SEQUENCE_KEY, len(names))
+        first = last - len(names) + 1
+        self._l2.set_many({
+            LOG_KEY.format(n): name
+            for n, name in enumerate(names, start=first)
+        }, self._log_timeout)
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return MISSING
+            expires, value, pickled = entry
+            if expires <= time.monotonic():
+                del self._l1[key]
+                return MISSING
+            self._l1.move_to_end(key)
+        return pickle.loads(value) if pickled else value
+
+    def _l1_clear(self):
+        with self._lock:
+            self._l1.clear()
+
+    def _l1_set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        ttl = self._l1_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl <= 0:
+            self._l1_drop(key)
+            return
+        pickled = not isinstance(value, IMMUTABLE)
+        if pickled:
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._l1[key] = (time.monotonic() + ttl, value, pickled)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self._max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_drop(self, key):
+        with self._lock:
+            self._l1.pop(key, None)
+
+    def get(self, key, default=None, version=None):
+        self._sync()
+        name = self.make_key(key, version=version)
+        found = self._l1_get(name)
+        if found is not MISSING:
+            return found
+        value = self._l2.get(key, version=version)
+        if value is None:
+            return default
+        self._l1_set(name, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        found, missed = {}, []
+        for key in keys:
+            hit = self._l1_get(self.make_key(key, version=version))
+            if hit is MISSING:
+                missed.append(key)
+            else:
+                found[key] = hit
+        if missed:
+            loaded = self._l2.get_many(missed, version=version)
+            for key, value in loaded.items():
+                self._l1_set(self.make_key(key, version=version), value)
+            found.update(loaded)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l2.set(key, value, timeout, version=version)
+        self._l1_set(self.make_key(key, version=version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self._l2.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._l1_set(self.make_key(key, version=version), value,
+                             timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._l2.add(key, value, timeout, version=version)
+        if added:
+            self._l1_set(self.make_key(key, version=version), value, timeout)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        name = self.make_key(key, version=version)
+        self._l1_drop(name)
+        value = self._l2.incr(key, delta, version=version)
+        self._publish(name)
+        return value
+
+    def delete(self, key, version=None):
+        name = self.make_key(key, version=version)
+        self._l1_drop(name)
+        self._l2.delete(key, version=version)
+        self._publish(name)
+
+    def delete_many(self, keys, version=None):
+        names = [self.make_key(key, version=version) for key in keys]
+        for name in names:
+            self._l1_drop(name)
+        self._l2.delete_many(keys, version=version)
+        if names:
+            self._publish(*names)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._l2.touch(key, timeout, version=version)
+
+    def has_key(self, key, version=None):
+        self._sync()
+        if self._l1_get(self.make_key(key, version=version)) is not MISSING:
+            return True
+        return self._l2.has_key(key, version=version)
+
+    def clear(self):
+        self._l1_clear()
+        self._l2.clear()
+        self._publish(CLEAR)
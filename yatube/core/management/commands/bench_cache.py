@@ -0,0 +1,76 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from itertools import accumulate
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+
+def run_worker(conf, seed, ops, keys, exponent, payload):
+    '''Нагрузка одного воркера: чтение ключей по закону Ципфа,
+    промах записывает значение, как это делает {% cache %}.
+    '''
+    cache = import_string(conf['BACKEND'])(conf.get('LOCATION', ''), conf)
+    weights = accumulate(1 / rank ** exponent for rank in range(1, keys + 1))
+    sample = random.Random(seed).choices(
+        range(keys), cum_weights=list(weights), k=ops)
+    value = 'x' * payload
+    hits = 0
+    start = time.perf_counter()
+    for key in sample:
+        if cache.get(f'bench:{key}') is None:
+            cache.set(f'bench:{key}', value, None)
+        else:
+            hits += 1
+    return hits, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = ('Сравнение доли попаданий и скорости бэкендов кэша '
+            'при работе нескольких процессов-воркеров.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='число процессов')
+        parser.add_argument('--ops', type=int, default=5000,
+                            help='обращений на воркер')
+        parser.add_argument('--keys', type=int, default=2000,
+                            help='число различных ключей')
+        parser.add_argument('--exponent', type=float, default=1.1,
+                            help='показатель распределения Ципфа')
+        parser.add_argument('--payload', type=int, default=4096,
+                            help='размер значения в байтах')
+        parser.add_argument('--backends', nargs='+',
+                            default=['locmem', 'sqlite'],
+                            choices=sorted(settings.CACHE_BACKENDS),
+                            help='бэкенды из settings.CACHE_BACKENDS')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        context = multiprocessing.get_context('fork')
+        with tempfile.TemporaryDirectory() as directory:
+            for name in options['backends']:
+                conf = dict(settings.CACHE_BACKENDS[name])
+                if name == 'sqlite':
+                    conf['LOCATION'] = os.path.join(directory, 'bench.db')
+                conf.setdefault('OPTIONS', {})
+                conf['OPTIONS'] = dict(conf['OPTIONS'], MAX_ENTRIES=10 ** 6)
+                jobs = [
+                    (conf, seed, options['ops'], options['keys'],
+                     options['exponent'], options['payload'])
+                    for seed in range(workers)
+                ]
+                with context.Pool(workers) as pool:
+                    results = pool.starmap(run_worker, jobs)
+                hits = sum(hit for hit, _ in results)
+                total = workers * options['ops']
+                elapsed = max(seconds for _, seconds in results)
+                self.stdout.write(
+                    f'{name:10} воркеров: {workers}, '
+                    f'попаданий: {hits / total:.1%}, '
+                    f'операций в секунду: {total / elapsed:,.0f}'
+                )
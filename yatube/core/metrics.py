@@ -0,0 +1,205 @@
+'''Метрики запросов в памяти процесса и их вывод в текстовом формате
+Prometheus. Каждый процесс сервера копит свои гистограммы, поэтому
+Prometheus опрашивает процессы по отдельности и складывает ряды сам.
+
+Замеры одного запроса собираются в RequestStats текущего потока
+(core.middleware.MetricsMiddleware) и попадают в гистограммы по имени
+представления, когда ответ готов.
+'''
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+from django.conf import settings
+
+_local = threading.local()
+
+
+def escape(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def label_pairs(names, values):
+    return [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=('view',)):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        with self._lock:
+            series = sorted((labels, self.copy(value))
+                            for labels, value in self._series.items())
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.kind}']
+        for labels, value in series:
+            lines.extend(self.samples(label_pairs(self.labels, labels), value))
+        return lines
+
+
+class Counter(Metric):
+    '''Счётчик по значениям меток.'''
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def copy(self, value):
+        return value
+
+    def samples(self, pairs, value):
+        return [f'{self.name}_total{{{",".join(pairs)}}} {value}']
+
+
+class Histogram(Metric):
+    '''Гистограмма: число наблюдений не больше каждой границы buckets,
+    сумма и число наблюдений по значениям меток.'''
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labels=('view',)):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._series.get(labels)
+            if entry is None:
+                entry = self._series[labels] = [
+                    [0] * (len(self.buckets) + 1), 0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def copy(self, value):
+        counts, total, count = value
+        return list(counts), total, count
+
+    def samples(self, pairs, value):
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, observed in zip(self.buckets + ('+Inf',), counts):
+            cumulative += observed
+            le = ','.join(pairs + [f'le="{bound}"'])
+            lines.append(f'{self.name}_bucket{{{le}}} {cumulative}')
+        labels = ','.join(pairs)
+        lines.append(f'{self.name}_sum{{{labels}}} {total}')
+        lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+REGISTRY = []
+
+REQUEST_SECONDS = Histogram(
+    'yatube_request_duration_seconds', 'Время ответа на запрос.',
+    settings.METRICS_BUCKETS)
+SQL_QUERIES = Histogram(
+    'yatube_sql_queries', 'SQL-запросов на запрос.',
+    settings.METRICS_QUERY_BUCKETS)
+SQL_SECONDS = Histogram(
+    'yatube_sql_duration_seconds', 'Время SQL-запросов за запрос.',
+    settings.METRICS_BUCKETS)
+TEMPLATE_SECONDS = Histogram(
+    'yatube_template_render_seconds',
+    'Время отрисовки шаблонов за запрос (с запросами из шаблонов).',
+    settings.METRICS_BUCKETS)
+FRAGMENTS = Counter(
+    'yatube_template_fragment_cache',
+    'Обращения к кэшу фрагментов {% cache %}.', ('view', 'result'))
+THUMBNAIL_SECONDS = Histogram(
+    'yatube_thumbnail_seconds',
+    'Нарезка картинки: в запросе (inline) или в пуле воркеров '
+    '(worker, от постановки в очередь).',
+    settings.METRICS_BUCKETS, ('mode',))
+
+
+class RequestStats:
+    '''Замеры текущего запроса.'''
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.hits = 0
+        self.misses = 0
+
+
+def current():
+    return getattr(_local, 'stats', None)
+
+
+def start():
+    _local.stats = RequestStats()
+    return _local.stats
+
+
+def finish(view, seconds):
+    '''Замеры запроса — в гистограммы представления view.'''
+    stats, _local.stats = current(), None
+    if stats is None:
+        return
+    REQUEST_SECONDS.observe(seconds, view)
+    SQL_QUERIES.observe(stats.queries, view)
+    SQL_SECONDS.observe(stats.sql_seconds, view)
+    if stats.template_seconds:
+        TEMPLATE_SECONDS.observe(stats.template_seconds, view)
+    if stats.hits:
+        FRAGMENTS.inc(view, 'hit', amount=stats.hits)
+    if stats.misses:
+        FRAGMENTS.inc(view, 'miss', amount=stats.misses)
+
+
+def record_sql(execute, sql, params, many, context):
+    '''Обёртка connection.execute_wrapper: число и время запросов.'''
+    stats = current()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.sql_seconds += perf_counter() - started
+
+
+def record_template(seconds):
+    stats = current()
+    if stats is not None:
+        stats.template_seconds += seconds
+
+
+def record_fragment(hit):
+    stats = current()
+    if stats is None:
+        return
+    if hit:
+        stats.hits += 1
+    else:
+        stats.misses += 1
+
+
+def render():
+    '''Все метрики в текстовом формате Prometheus.'''
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    for metric in REGISTRY:
+        metric.reset()
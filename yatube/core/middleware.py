@@ -0,0 +1,48 @@
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.db import connections
+
+from . import metrics, profiling
+
+UNRESOLVED = 'unresolved'
+
+
+class MetricsMiddleware:
+    '''Замеры каждого запроса по имени представления (core.metrics):
+    полное время ответа, число и время SQL-запросов, время шаблонов
+    и кэш фрагментов. Стоит первым в MIDDLEWARE, чтобы время включало
+    остальные middleware. Запросы, выбранные core.profiling, идут под
+    cProfile от представления до готового ответа.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics.start()
+        started = perf_counter()
+        view = UNRESOLVED
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(
+                        metrics.record_sql))
+                try:
+                    response = self.get_response(request)
+                finally:
+                    view = self.view_name(request)
+                    profiler = getattr(request, '_profiler', None)
+                    if profiler is not None:
+                        profiling.dump(profiler, view)
+        finally:
+            metrics.finish(view, perf_counter() - started)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if profiling.wanted(self.view_name(request)):
+            request._profiler = profiling.start()
+
+    def view_name(self, request):
+        match = getattr(request, 'resolver_match', None)
+        return match.view_name if match is not None else UNRESOLVED
@@ -0,0 +1,94 @@
+'''Дампы cProfile отдельных запросов: выборочно с долей
+settings.METRICS_PROFILE_RATE и по требованию — следующие несколько
+запросов к представлению (arm). Дампы пишутся в METRICS_PROFILE_DIR,
+хранятся последние METRICS_PROFILE_KEEP; открываются pstats или snakeviz.
+Заявки по требованию живут в памяти процесса, который их принял.
+'''
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.urls import URLResolver, get_resolver
+
+SUFFIX = '.prof'
+UNSAFE = re.compile(r'[^\w.-]')
+
+_armed = {}
+_lock = threading.Lock()
+
+
+def arm(view, count):
+    '''Профилировать следующие count запросов к представлению view.'''
+    with _lock:
+        _armed[view] = _armed.get(view, 0) + count
+
+
+def view_names(patterns=None, namespace=''):
+    '''Имена адресов с пространствами имён, как resolver_match.view_name:
+    только их и можно заявить в arm.'''
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            names |= view_names(
+                pattern.url_patterns,
+                f'{namespace}{pattern.namespace}:' if pattern.namespace
+                else namespace)
+        elif pattern.name:
+            names.add(f'{namespace}{pattern.name}')
+    return names
+
+
+def wanted(view):
+    with _lock:
+        if _armed.get(view):
+            _armed[view] -= 1
+            return True
+    rate = settings.METRICS_PROFILE_RATE
+    return bool(rate) and random.random() < rate
+
+
+def start():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def dump(profiler, view):
+    '''Сохранение дампа и удаление самых старых сверх предела.'''
+    profiler.disable()
+    directory = settings.METRICS_PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = (f'{UNSAFE.sub("_", view)}-{time.time_ns()}-{os.getpid()}'
+            f'{SUFFIX}')
+    profiler.dump_stats(os.path.join(directory, name))
+    for stale in dumps()[settings.METRICS_PROFILE_KEEP:]:
+        try:
+            os.remove(os.path.join(directory, stale))
+        except FileNotFoundError:
+            pass
+    return name
+
+
+def dumps():
+    '''Имена дампов, новые первыми.'''
+    directory = settings.METRICS_PROFILE_DIR
+    try:
+        names = [name for name in os.listdir(directory)
+                 if name.endswith(SUFFIX)]
+    except FileNotFoundError:
+        return []
+    return sorted(names, key=lambda name: os.path.getmtime(
+        os.path.join(directory, name)), reverse=True)
+
+
+def path_of(name):
+    '''Путь дампа по имени из списка dumps(), иначе None.'''
+    if name not in dumps():
+        return None
+    return os.path.join(settings.METRICS_PROFILE_DIR, name)
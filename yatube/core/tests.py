@@ -1,6 +1,25 @@
-from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+import os
+import pstats
+import shutil
+import tempfile
 from http import HTTPStatus
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from core import metrics, profiling
+from core.cache.sqlite import SQLiteCache
+from core.cache.tiered import TieredCache
+from core.middleware import MetricsMiddleware
+from posts import renditions
+from posts.models import Post
 
 User = get_user_model()
 
@@ -22,3 +41,317 @@ class AboutURLTests(TestCase):
         address = '/unexisting_page/'
         response = self.guest_client.get(address)
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class SQLiteCacheTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.db')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_set_get_delete(self):
+        """Значения сохраняются, читаются и удаляются."""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertTrue(self.cache.has_key('key'))
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_shared_between_instances(self):
+        """Кэш в одном файле виден другим экземплярам (процессам)."""
+        self.cache.set('shared', 'value')
+        self.assertEqual(self.make_cache().get('shared'), 'value')
+
+    def test_expired_value_is_missing(self):
+        """Истёкшее значение не читается, add его перезаписывает."""
+        self.cache.set('key', 'old', timeout=0)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertFalse(self.cache.add('key', 'newer'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_incr(self):
+        """incr меняет число и падает на отсутствующем ключе."""
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 2), 3)
+        self.assertEqual(self.make_cache().get('counter'), 3)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_many(self):
+        """get_many и delete_many работают пачкой."""
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': 2})
+        self.cache.delete_many(['a', 'b'])
+        self.assertEqual(self.cache.get_many(['a', 'b']), {})
+
+    @mock.patch('core.cache.sqlite.time')
+    def test_lru_eviction_by_entries(self, mocked_time):
+        """При переполнении вытесняются давно не читавшиеся записи."""
+        cache = self.make_cache(MAX_ENTRIES=3, CULL_FREQUENCY=3)
+        for second, key in enumerate(['a', 'b', 'c']):
+            mocked_time.time.return_value = 100 + second * 10
+            cache.set(key, key)
+        mocked_time.time.return_value = 200
+        cache.get('a')
+        mocked_time.time.return_value = 210
+        cache.set('d', 'd')
+        self.assertEqual(cache.get_many(['a', 'b', 'c', 'd']),
+                         {'a': 'a', 'c': 'c', 'd': 'd'})
+
+    def test_eviction_by_size(self):
+        """Суммарный размер значений не превышает MAX_SIZE."""
+        cache = self.make_cache(MAX_SIZE=10000)
+        for i in range(10):
+            cache.set(f'key{i}', 'x' * 3000)
+        entries, size = cache._db.execute(
+            'SELECT entries, bytes FROM stats').fetchone()
+        self.assertLessEqual(size, 10000)
+        self.assertEqual(entries, len(cache.get_many(
+            [f'key{i}' for i in range(10)])))
+        self.assertIsNotNone(cache.get('key9'))
+
+
+class TieredCacheTests(TestCase):
+
+    def setUp(self):
+        self.shared = caches['shared']
+        self.shared.clear()
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        options = dict({'SHARED': 'shared', 'SYNC_INTERVAL': 0}, **options)
+        return TieredCache('', {'OPTIONS': options})
+
+    def test_hot_key_served_from_memory(self):
+        """Прочитанный ключ отдаётся из L1 без обращения к L2."""
+        self.cache.set('key', 'value')
+        self.shared.delete('key')
+        self.assertEqual(self.cache.get('key'), 'value')
+        other = self.make_cache()
+        self.assertIsNone(other.get('key'))
+
+    def test_version_bump_reaches_other_process(self):
+        """incr в одном процессе выбрасывает ключ из L1 остальных,
+        не трогая прочие записи."""
+        other = self.make_cache()
+        self.cache.set('version', 1)
+        self.cache.set('fragment', 'old')
+        self.assertEqual(other.get('version'), 1)
+        self.assertEqual(other.get('fragment'), 'old')
+        self.shared.set('fragment', 'new')
+        self.cache.incr('version')
+        self.assertEqual(other.get('version'), 2)
+        self.assertEqual(other.get('fragment'), 'old')
+        self.cache.delete_many(['fragment'])
+        self.assertIsNone(other.get('fragment'))
+
+    def test_lost_log_clears_l1(self):
+        """Процесс, отставший больше чем на LOG_SIZE записей или не
+        нашедший запись журнала, сбрасывает L1 целиком."""
+        other = self.make_cache(LOG_SIZE=2)
+        self.cache.set('version', 1)
+        self.cache.set('fragment', 'old')
+        self.assertEqual(other.get('fragment'), 'old')
+        self.shared.set('fragment', 'new')
+        for _ in range(3):
+            self.cache.incr('version')
+        self.assertEqual(other.get('fragment'), 'new')
+        self.shared.set('fragment', 'newer')
+        self.cache.incr('version')
+        self.shared.delete(
+            'tiered:log:{}'.format(self.shared.get('tiered:sequence')))
+        self.assertEqual(other.get('fragment'), 'newer')
+
+    def test_log_checked_by_interval(self):
+        """Между сверками журнала L1 не обращается к L2."""
+        other = self.make_cache(SYNC_INTERVAL=60)
+        self.cache.set('version', 1)
+        other.get('version')
+        self.cache.incr('version')
+        self.assertEqual(other.get('version'), 1)
+
+    def test_l1_expires(self):
+        """Запись живёт в L1 не дольше L1_TIMEOUT."""
+        cache = self.make_cache(L1_TIMEOUT=5)
+        cache.set('key', 'value')
+        self.shared.delete('key')
+        with mock.patch('core.cache.tiered.time.monotonic',
+                        return_value=10 ** 9):
+            self.assertIsNone(cache.get('key'))
+
+    def test_lru_limit_and_copies(self):
+        """L1 ограничен по числу записей и не отдаёт общий объект."""
+        cache = self.make_cache(MAX_ENTRIES=2)
+        cache.set_many({'a': [1], 'b': [2]})
+        cache.get('a')
+        cache.set('c', [3])
+        self.shared.delete_many(['a', 'b', 'c'])
+        self.assertEqual(cache.get('a'), [1])
+        self.assertIsNone(cache.get('b'))
+        cache.get('a').append(2)
+        self.assertEqual(cache.get('a'), [1])
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TOKEN = 'metrics-token'
+
+
+@override_settings(METRICS_TOKEN=TOKEN, MEDIA_ROOT=TEMP_MEDIA_ROOT,
+                   POSTS_RENDITION_WORKERS=0)
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        Post.objects.create(author=cls.user, text='Пост для метрик')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.profiles = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profiles, ignore_errors=True)
+        self.client.force_login(self.user)
+        self.token_client = Client(HTTP_AUTHORIZATION=f'Bearer {TOKEN}')
+
+    def scrape(self):
+        response = self.token_client.get(reverse('core:metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode()
+
+    def test_histogram_format(self):
+        """Гистограмма выводится с накопленными корзинами, суммой
+        и экранированными метками."""
+        histogram = metrics.Histogram('test_seconds', 'Тест.', (0.1, 1))
+        self.addCleanup(metrics.REGISTRY.remove, histogram)
+        histogram.observe(0.05, 'a"b')
+        histogram.observe(0.5, 'a"b')
+        histogram.observe(5, 'a"b')
+        self.assertEqual(histogram.render(), [
+            '# HELP test_seconds Тест.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{view="a\\"b",le="0.1"} 1',
+            'test_seconds_bucket{view="a\\"b",le="1"} 2',
+            'test_seconds_bucket{view="a\\"b",le="+Inf"} 3',
+            'test_seconds_sum{view="a\\"b"} 5.55',
+            'test_seconds_count{view="a\\"b"} 3',
+        ])
+
+    def test_access(self):
+        """Метрики закрыты от посторонних, открыты по токену
+        и сотрудникам."""
+        url = reverse('core:metrics')
+        self.assertEqual(self.client.get(url).status_code,
+                         HTTPStatus.FORBIDDEN)
+        self.assertEqual(Client(HTTP_AUTHORIZATION='Bearer wrong').get(
+            url).status_code, HTTPStatus.FORBIDDEN)
+        staff = Client()
+        staff.force_login(self.staff)
+        self.assertEqual(staff.get(url).status_code, HTTPStatus.OK)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(Client(HTTP_AUTHORIZATION='Bearer ').get(
+                url).status_code, HTTPStatus.FORBIDDEN)
+
+    def test_request_metrics(self):
+        """Запросы к представлению попадают в гистограммы по его имени:
+        время, SQL, шаблоны и кэш фрагментов."""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        text = self.scrape()
+        view = 'view="posts:index"'
+        for name in ('yatube_request_duration_seconds',
+                     'yatube_sql_queries', 'yatube_sql_duration_seconds',
+                     'yatube_template_render_seconds'):
+            self.assertIn(f'{name}_count{{{view}}} 2', text)
+        self.assertIn(f'yatube_template_fragment_cache_total{{{view},'
+                      f'result="miss"}} 1', text)
+        self.assertIn(f'yatube_template_fragment_cache_total{{{view},'
+                      f'result="hit"}} 1', text)
+        self.assertNotIn('yatube_sql_queries_bucket{view="posts:index",'
+                         'le="+Inf"} 0', text)
+        self.client.get('/unexisting_page/')
+        self.assertIn('yatube_request_duration_seconds_count'
+                      '{view="unresolved"} 1', self.scrape())
+
+    def test_thumbnail_seconds(self):
+        """Время нарезки картинки попадает в гистограмму."""
+        buffer = BytesIO()
+        Image.new('RGB', (120, 80), 'red').save(buffer, 'PNG')
+        post = Post.objects.create(
+            author=self.user, text='Пост с картинкой',
+            image=SimpleUploadedFile('metrics.png', buffer.getvalue()))
+        renditions.schedule(post)
+        self.assertIn('yatube_thumbnail_seconds_count{mode="inline"} 1',
+                      self.scrape())
+
+    def test_profile_on_demand(self):
+        """По заявке профилируется заданное число запросов
+        к представлению, дампы доступны для скачивания."""
+        url = reverse('core:profiles')
+        with override_settings(METRICS_PROFILE_DIR=self.profiles):
+            self.assertEqual(self.client.post(
+                url, {'view': 'posts:index'}).status_code,
+                HTTPStatus.FORBIDDEN)
+            response = self.token_client.post(
+                url, {'view': 'posts:index', 'count': 1})
+            self.assertEqual(response.status_code, HTTPStatus.ACCEPTED)
+            self.client.get(reverse('posts:index'))
+            self.client.get(reverse('posts:index'))
+            names = self.token_client.get(url).content.decode().split()
+            self.assertEqual(len(names), 1)
+            self.assertTrue(names[0].startswith('posts_index-'))
+            response = self.token_client.get(
+                reverse('core:profile_file', args=[names[0]]))
+            path = os.path.join(self.profiles, 'download.prof')
+            with open(path, 'wb') as dump:
+                dump.write(b''.join(response.streaming_content))
+            self.assertTrue(pstats.Stats(path).total_calls)
+            self.assertEqual(self.token_client.get(reverse(
+                'core:profile_file', args=['..%2Fdb.sqlite3'])).status_code,
+                HTTPStatus.NOT_FOUND)
+
+    def test_profile_unknown_view_rejected(self):
+        """Заявка на неизвестное представление отклоняется и не копится
+        в памяти процесса."""
+        url = reverse('core:profiles')
+        for view in ('posts:nothing', 'index', f'posts:index{"x" * 1000}'):
+            response = self.token_client.post(url, {'view': view})
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertNotIn('posts:nothing', profiling._armed)
+        self.assertIn('core:profiles', profiling.view_names())
+
+    def test_metrics_recorded_on_exception(self):
+        """Замеры запроса попадают в гистограммы и при исключении."""
+        def failing(request):
+            raise RuntimeError
+
+        middleware = MetricsMiddleware(failing)
+        with self.assertRaises(RuntimeError):
+            middleware(RequestFactory().get('/'))
+        self.assertIsNone(metrics.current())
+        self.assertIn('yatube_request_duration_seconds_count'
+                      '{view="unresolved"} 1', self.scrape())
+
+    def test_profile_dumps_limited(self):
+        """Хранятся последние METRICS_PROFILE_KEEP дампов."""
+        with override_settings(METRICS_PROFILE_DIR=self.profiles,
+                               METRICS_PROFILE_KEEP=2,
+                               METRICS_PROFILE_RATE=1):
+            for _ in range(4):
+                self.client.get(reverse('posts:index'))
+            self.assertEqual(len(os.listdir(self.profiles)), 2)
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('', views.metrics_view, name='metrics'),
+    path('profiles/', views.profiles, name='profiles'),
+    path('profiles/<str:name>', views.profile_file, name='profile_file'),
+]
@@ -1,4 +1,17 @@
+from hmac import compare_digest
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseBadRequest)
 from django.shortcuts import render
+from django.views.decorators.csrf import csrf_exempt
+
+from . import metrics, profiling
+
+PROMETHEUS = 'text/plain; version=0.0.4; charset=utf-8'
+PROFILE_MAX_COUNT = 100
 
 
 def page_not_found(request, exception):
@@ -19,3 +32,56 @@ def server_error(request):
 def permission_denied(request, exception):
     '''Ошибка 403'''
     return render(request, 'core/403.html', status=403)
+
+
+def metrics_allowed(request):
+    '''Метрики доступны сотрудникам и по токену settings.METRICS_TOKEN
+    в заголовке Authorization: Bearer <токен>.'''
+    return token_valid(request) or request.user.is_staff
+
+
+def token_valid(request):
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and compare_digest(header, f'Bearer {token}')
+
+
+def metrics_view(request):
+    '''Метрики процесса в текстовом формате Prometheus.'''
+    if not metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(metrics.render(), content_type=PROMETHEUS)
+
+
+@csrf_exempt
+def profiles(request):
+    '''Список дампов cProfile (GET) и заявка профилировать следующие
+    count запросов к представлению view (POST, только по токену).'''
+    if request.method == 'POST':
+        if not token_valid(request):
+            raise PermissionDenied
+        view = request.POST.get('view', '')
+        try:
+            count = int(request.POST.get('count', 1))
+        except ValueError:
+            count = 0
+        if (view not in profiling.view_names()
+                or not 1 <= count <= PROFILE_MAX_COUNT):
+            return HttpResponseBadRequest('view, count')
+        profiling.arm(view, count)
+        return HttpResponse(status=HTTPStatus.ACCEPTED)
+    if not metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(
+        ''.join(f'{name}\n' for name in profiling.dumps()),
+        content_type='text/plain; charset=utf-8')
+
+
+def profile_file(request, name):
+    '''Скачивание дампа cProfile.'''
+    if not metrics_allowed(request):
+        raise PermissionDenied
+    path = profiling.path_of(name)
+    if path is None:
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
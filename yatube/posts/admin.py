@@ -1,31 +1,365 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME, ActionForm
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Sum
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils.functional import cached_property
 
-from .models import Group, Post, Comment, Follow
+from . import bulk
+from .models import BulkJob, Group, Post, Comment, Follow
+from .search import get_backend
+from .utils import CursorPaginator
 
+CURSOR_VAR = 'cursor'
+COUNT_LIMIT = 1000  # точнее этого строки в отборе не пересчитываются
 
-class PostAdmin(admin.ModelAdmin):
+
+def table_estimate(model, using):
+    '''Оценка числа строк таблицы без COUNT(*): статистика планировщика
+    (reltuples PostgreSQL, sqlite_stat1 SQLite после ANALYZE), а без неё —
+    наибольший id (поиск по индексу первичного ключа).'''
+    connection = connections[using]
+    table = model._meta.db_table
+    estimate = None
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            estimate = row and row[0]
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                'SELECT 1 FROM sqlite_master '
+                'WHERE type = \'table\' AND name = \'sqlite_stat1\'')
+            if cursor.fetchone():
+                # первое число stat — строк в таблице или индексе
+                cursor.execute(
+                    'SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+                estimate = max((int(stat.split()[0])
+                                for stat, in cursor.fetchall()), default=None)
+    if estimate and estimate > 0:
+        return estimate
+    return model._base_manager.using(using).aggregate(
+        last=Max('pk'))['last'] or 0
+
+
+def estimated_count(queryset):
+    '''Число строк для админки: для всей таблицы — оценка,
+    для отбора — точный COUNT не дальше COUNT_LIMIT строк.'''
+    if not queryset.query.where:
+        return table_estimate(queryset.model, queryset.db)
+    return queryset.order_by()[:COUNT_LIMIT].count()
+
+
+class EstimatedCountPaginator(Paginator):
+    '''Пажинатор по номерам страниц с оценкой числа строк.'''
+
+    @cached_property
+    def count(self):
+        return estimated_count(self.object_list)
+
+
+class CursorChangeList(ChangeList):
+    '''Список объектов, который листается по курсору (posts.utils)
+    вместо OFFSET: глубокие страницы стоят столько же, сколько первая.
+    При сортировке по колонке работает обычный пажинатор
+    с оценкой числа строк.
+    '''
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        self.page = None
+        super().__init__(request, *args, **kwargs)
+        self.params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        if ORDER_VAR in self.params:
+            return super().get_results(request)
+        paginator = CursorPaginator(
+            self.queryset, self.list_per_page,
+            key=self.model_admin.cursor_key)
+        self.page = paginator.get_page(self.cursor)
+        self.paginator = paginator
+        self.result_list = self.page.object_list
+        if self.list_editable:
+            # формсету list_editable нужен QuerySet, а не список
+            self.result_list = self.queryset.filter(
+                pk__in=[obj.pk for obj in self.result_list]).order_by(
+                '-' + paginator.key, '-pk')
+        self.result_count = estimated_count(self.queryset)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = self.page.has_other_pages()
+
+    def first_page_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR])
+
+    def next_page_url(self):
+        return self.get_query_string(
+            {CURSOR_VAR: self.paginator.next_cursor})
+
+    def previous_page_url(self):
+        return self.get_query_string(
+            {CURSOR_VAR: self.paginator.previous_cursor})
+
+
+class AutocompleteFilter(admin.RelatedFieldListFilter):
+    '''Фильтр по связанному объекту с поиском вместо списка:
+    варианты подгружаются из autocomplete-представления админки
+    связанной модели, в страницу попадает только выбранный.'''
+    template = 'admin/autocomplete_filter.html'
+
+    def field_choices(self, field, request, model_admin):
+        if not self.lookup_val:
+            return []
+        model = field.remote_field.model
+        return [
+            (obj.pk, str(obj))
+            for obj in model._base_manager.filter(pk=self.lookup_val)
+        ]
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        opts = self.field.remote_field.model._meta
+        yield {
+            'query_string': changelist.get_query_string(
+                remove=[self.lookup_kwarg, self.lookup_kwarg_isnull]),
+            'param': self.lookup_kwarg,
+            'url': reverse(
+                f'admin:{opts.app_label}_{opts.model_name}_autocomplete'),
+            'selected': self.lookup_choices,
+        }
+
+
+class GroupActionForm(ActionForm):
+    group = forms.ModelChoiceField(
+        Group.objects.all(), required=False, label='Группа',
+        empty_label='без группы')
+
+
+def run_bulk(modeladmin, request, action, queryset, **params):
+    '''Массовая операция posts.bulk с сообщением о результате.'''
+    job = bulk.submit(action, queryset, request.user, **params)
+    if job is None:
+        modeladmin.message_user(request, 'Готово.')
+    else:
+        modeladmin.message_user(
+            request, f'Запущена фоновая задача №{job.pk} '
+                     f'({job.total} объектов), ход — в «Фоновых задачах».')
+
+
+def count_label(queryset):
+    '''Число строк для подтверждения: без полного COUNT(*).'''
+    count = estimated_count(queryset)
+    if not queryset.query.where:
+        return f'около {count}'
+    if count >= COUNT_LIMIT:
+        return f'не меньше {COUNT_LIMIT}'
+    return str(count)
+
+
+def authors_of(queryset):
+    '''id авторов отбора списком: отбор по автору не должен зависеть
+    от строк, которые операция удаляет по ходу.'''
+    return list(queryset.order_by().values_list(
+        'author_id', flat=True).distinct())
+
+
+class FastAdmin(admin.ModelAdmin):
+    '''Админка для больших таблиц: оценка числа строк, листание
+    по курсору (cursor_key — поле даты выдачи) и фильтры
+    с автодополнением.'''
+    cursor_key = None
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_changelist(self, request, **kwargs):
+        if self.cursor_key:
+            return CursorChangeList
+        return super().get_changelist(request, **kwargs)
+
+    def deletion_counts(self, queryset):
+        '''[(название, число)] для подтверждения удаления.'''
+        return [(self.model._meta.verbose_name_plural,
+                 count_label(queryset))]
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        if 'bulk_delete' in actions:
+            actions.pop('delete_selected', None)
+        return actions
+
+    def confirm_delete(self, request, queryset, action, question):
+        '''Удаление queryset после подтверждения числами: повторный
+        POST с post=yes передаёт тот же отбор в delete_queryset.'''
+        if request.POST.get('post') == 'yes':
+            self.delete_queryset(request, queryset)
+            return None
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Вы уверены?',
+            'opts': self.model._meta,
+            'media': self.media,
+            'question': question,
+            'counts': self.deletion_counts(queryset),
+            'selected': request.POST.getlist(ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across') == '1',
+            'action_checkbox_name': ACTION_CHECKBOX_NAME,
+            'action': action,
+        }
+        return TemplateResponse(
+            request, 'admin/posts/bulk_delete_confirmation.html', context)
+
+    def bulk_delete(self, request, queryset):
+        '''Удаление отобранного через delete_queryset вместо
+        delete_selected: подтверждение показывает только числа,
+        а стандартная страница собирает и выводит каждый связанный
+        объект.'''
+        return self.confirm_delete(
+            request, queryset, 'bulk_delete',
+            f'Удалить выбранные {self.model._meta.verbose_name_plural}?')
+    bulk_delete.allowed_permissions = ('delete',)
+    bulk_delete.short_description = (
+        'Удалить выбранные %(verbose_name_plural)s')
+
+    def delete_by_author(self, request, queryset):
+        '''Удаление всех записей авторов отобранного, с тем же
+        подтверждением числами.'''
+        return self.confirm_delete(
+            request,
+            self.model.objects.filter(author__in=authors_of(queryset)),
+            'delete_by_author',
+            f'Удалить все {self.model._meta.verbose_name_plural} авторов '
+            'выбранных записей?')
+    delete_by_author.allowed_permissions = ('delete',)
+    delete_by_author.short_description = (
+        'Удалить все %(verbose_name_plural)s их авторов')
+
+    @property
+    def media(self):
+        # select2 для AutocompleteFilter
+        field = self.model._meta.get_field(self.autocomplete_fields[0])
+        return super().media + AutocompleteSelect(
+            field.remote_field, self.admin_site).media
+
+
+class PostAdmin(FastAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
-    list_filter = ('pub_date',)
+    list_filter = ('pub_date', ('author', AutocompleteFilter))
+    autocomplete_fields = ('author',)
     empty_value_display = '-пусто-'
-    list_editable = ('group',)
+    cursor_key = 'pub_date'
+    action_form = GroupActionForm
+    actions = ('bulk_delete', 'move_to_group', 'delete_by_author')
+
+    def get_search_results(self, request, queryset, search_term):
+        '''Поиск по полнотекстовому индексу постов (posts.search).'''
+        if not search_term:
+            return queryset, False
+        return get_backend().filter(queryset, search_term, 'text'), False
+
+    def deletion_counts(self, queryset):
+        # по счётчикам постов: условие поиска (extra) не работает
+        # во вложенном запросе
+        comments = 'все'
+        if queryset.query.where:
+            comments = str(queryset.aggregate(
+                total=Sum('comments_count'))['total'] or 0)
+        return super().deletion_counts(queryset) + [
+            (Comment._meta.verbose_name_plural, comments)]
 
+    def delete_queryset(self, request, queryset):
+        run_bulk(self, request, 'delete_posts', queryset)
 
-class CommentAdmin(admin.ModelAdmin):
+    def move_to_group(self, request, queryset):
+        try:
+            group = self.action_form.base_fields['group'].clean(
+                request.POST.get('group'))
+        except ValidationError as error:
+            self.message_user(request, ' '.join(error.messages),
+                              messages.ERROR)
+            return
+        run_bulk(self, request, 'move_posts', queryset,
+                 group_id=group.pk if group else None)
+    move_to_group.short_description = 'Перенести в группу'
+
+
+class CommentAdmin(FastAdmin):
     list_display = ('pk', 'text', 'created', 'author', 'post')
+    list_select_related = ('author', 'post')
     search_fields = ('text',)
-    list_filter = ('created',)
+    list_filter = ('created', ('author', AutocompleteFilter))
+    autocomplete_fields = ('author',)
+    raw_id_fields = ('post',)
     empty_value_display = '-пусто-'
+    cursor_key = 'created'
+    actions = ('bulk_delete', 'delete_by_author')
+
+    def get_search_results(self, request, queryset, search_term):
+        '''Индекс отбирает посты с подходящими комментариями,
+        LIKE проверяет только их комментарии.'''
+        if not search_term:
+            return queryset, False
+        queryset = get_backend().filter(
+            queryset, search_term, 'comments', field='post_id')
+        return super().get_search_results(request, queryset, search_term)
 
+    def delete_queryset(self, request, queryset):
+        run_bulk(self, request, 'delete_comments', queryset)
 
-class FollowAdmin(admin.ModelAdmin):
+
+class FollowAdmin(FastAdmin):
     list_display = ('pk', 'user', 'author',)
-    search_fields = ('user',)
-    list_filter = ('user',)
+    list_select_related = ('user', 'author')
+    search_fields = ('^user__username', '^author__username')
+    list_filter = (
+        ('user', AutocompleteFilter),
+        ('author', AutocompleteFilter),
+    )
+    autocomplete_fields = ('user', 'author')
     empty_value_display = '-пусто-'
 
 
+class BulkJobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'action', 'status', 'progress', 'user',
+                    'created', 'finished')
+    list_filter = ('status',)
+    exclude = ('params',)
+    readonly_fields = ('action', 'status', 'total', 'done', 'user',
+                       'error', 'created', 'finished')
+
+    def progress(self, obj):
+        return f'{obj.done} / {obj.total}'
+    progress.short_description = 'Ход'
+
+    def has_add_permission(self, request):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        bulk.fail_stale()
+        return super().changelist_view(request, extra_context)
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(BulkJob, BulkJobAdmin)
@@ -0,0 +1,226 @@
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.serializers import PickleSerializer
+from django.core import signing
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import counters, media, search, versions
+from .models import BulkJob, Comment, Group, Post, Timeline, content_storage
+from .timeline import RECENT_KEY
+from .utils import POST_AUTHOR_KEY
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def executor():
+    '''Пул потоков для фоновых массовых операций, один на процесс
+    сервера. При запуске пула оборванные задачи помечаются ошибкой.'''
+    global _executor
+    if _executor is None:
+        fail_stale()
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.POSTS_BULK_WORKERS)
+    return _executor
+
+
+def fail_stale():
+    '''Задачи, которые давно не продвигались, выполнял процесс,
+    которого уже нет: пул потоков живёт только в памяти процесса.'''
+    deadline = timezone.now() - timedelta(seconds=settings.POSTS_BULK_STALE)
+    return BulkJob.objects.filter(
+        status__in=(BulkJob.PENDING, BulkJob.RUNNING),
+        updated__lt=deadline,
+    ).update(status=BulkJob.FAILED, error='Задача прервана',
+             finished=timezone.now())
+
+
+def chunks(queryset, size=None):
+    '''id отбора частями по возрастанию: каждая часть — новый запрос
+    от последнего id, отбор не держится в памяти и может меняться
+    по ходу операции.'''
+    size = size or settings.POSTS_BULK_CHUNK
+    ids = queryset.order_by('pk').values_list('pk', flat=True)
+    last = None
+    while True:
+        chunk = list((ids if last is None else ids.filter(
+            pk__gt=last))[:size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+
+
+def dump_query(queryset):
+    '''Отбор для задачи: запрос, подписанный SECRET_KEY, — из базы
+    не распакуется подменённый pickle.'''
+    return signing.dumps(queryset.query, serializer=PickleSerializer,
+                         compress=True)
+
+
+def load_query(model, value):
+    queryset = model._base_manager.all()
+    queryset.query = signing.loads(value, serializer=PickleSerializer)
+    return queryset
+
+
+def raw_delete(queryset):
+    '''DELETE одним запросом, без сбора объектов и сигналов на строку:
+    всё, что делают сигналы, массовая операция делает сама.'''
+    return queryset._raw_delete(queryset.db)
+
+
+def post_scopes(rows):
+    '''Области кэша постов по строкам (pk, author_id, group_id).'''
+    scopes = {versions.scope('index')}
+    for pk, author_id, group_id in rows:
+        scopes.add(versions.scope('post', pk))
+        scopes.add(versions.scope('profile', author_id))
+        if group_id is not None:
+            scopes.add(versions.scope('group', group_id))
+    return scopes
+
+
+def move_posts(ids, group_id=None):
+    '''Перенос постов в группу (None — без группы).'''
+    rows = list(Post.objects.filter(pk__in=ids).exclude(
+        group_id=group_id).values_list('pk', 'author_id', 'group_id'))
+    if not rows:
+        return
+    Post.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(
+        group_id=group_id)
+    scopes = post_scopes(rows)
+    groups = {group for _, _, group in rows if group is not None}
+    if group_id is not None:
+        groups.add(group_id)
+        scopes.add(versions.scope('group', group_id))
+    counters.repair_groups(Group.objects.filter(pk__in=groups))
+    versions.reset(*scopes)
+
+
+def delete_posts(ids):
+    '''Удаление постов вместе с комментариями и записями лент.'''
+    rows = list(Post.objects.filter(pk__in=ids).values_list(
+        'pk', 'author_id', 'group_id', 'image'))
+    if not rows:
+        return
+    ids = [row[0] for row in rows]
+    authors = {row[1] for row in rows}
+    groups = {row[2] for row in rows if row[2] is not None}
+    raw_delete(Timeline.objects.filter(post_id__in=ids))
+    raw_delete(Comment.objects.filter(post_id__in=ids))
+    raw_delete(Post.objects.filter(pk__in=ids))
+    counters.repair_users(User.objects.filter(pk__in=authors))
+    counters.repair_groups(Group.objects.filter(pk__in=groups))
+    for name, count in Counter(row[3] for row in rows if row[3]).items():
+        media.release(name, content_storage, count)
+    search.get_backend().remove_many(ids)
+    cache.delete_many(
+        [POST_AUTHOR_KEY.format(pk) for pk in ids]
+        + [RECENT_KEY.format(pk) for pk in authors])
+    versions.reset(*post_scopes(row[:3] for row in rows))
+
+
+def with_replies(ids):
+    '''id комментариев вместе со всеми ответами на них: запрос
+    на уровень ветки, а не на комментарий.'''
+    found, level = set(ids), list(ids)
+    while level:
+        level = list(Comment.objects.filter(
+            parent_id__in=level).values_list('pk', flat=True))
+        found.update(level)
+    return list(found)
+
+
+def delete_comments(ids):
+    '''Удаление комментариев вместе с ответами на них.'''
+    ids = with_replies(ids)
+    comments = list(Comment.objects.filter(pk__in=ids).values_list(
+        'post_id', 'pk'))
+    if not comments:
+        return
+    posts = {post_id for post_id, _ in comments}
+    raw_delete(Comment.objects.filter(pk__in=ids))
+    counters.repair_posts(Post.objects.filter(pk__in=posts))
+    search.get_backend().remove_comments(comments)
+    versions.reset(*post_scopes(Post.objects.filter(
+        pk__in=posts).values_list('pk', 'author_id', 'group_id')))
+
+
+# операция -> (модель отбора, функция над частью id)
+ACTIONS = {
+    'move_posts': (Post, move_posts),
+    'delete_posts': (Post, delete_posts),
+    'delete_comments': (Comment, delete_comments),
+}
+
+
+def run(action, queryset, job=None, **params):
+    '''Операция по частям POSTS_BULK_CHUNK: каждая часть — несколько
+    запросов над множеством строк в своей транзакции. Прогресс
+    пишется в задачу после каждой части.'''
+    _, operation = ACTIONS[action]
+    for chunk in chunks(queryset):
+        with transaction.atomic():
+            operation(chunk, **params)
+        if job is not None:
+            job.done += len(chunk)
+            BulkJob.objects.filter(pk=job.pk).update(
+                done=job.done, updated=timezone.now())
+
+
+def execute(job_id):
+    '''Выполнение фоновой задачи.'''
+    job = BulkJob.objects.get(pk=job_id)
+    BulkJob.objects.filter(pk=job_id).update(
+        status=BulkJob.RUNNING, updated=timezone.now())
+    params = dict(job.params)
+    model, _ = ACTIONS[job.action]
+    try:
+        queryset = load_query(model, params.pop('query'))
+        run(job.action, queryset, job, **params)
+    except Exception as error:
+        logger.exception('Фоновая задача %s не выполнена', job)
+        status, message = BulkJob.FAILED, str(error)
+    else:
+        status, message = BulkJob.DONE, ''
+    BulkJob.objects.filter(pk=job_id).update(
+        status=status, error=message, finished=timezone.now())
+
+
+def _execute(job_id):
+    try:
+        execute(job_id)
+    finally:
+        # задача выполняется в потоке пула
+        connection.close()
+
+
+def submit(action, queryset, user=None, **params):
+    '''Запуск массовой операции над отбором queryset. Небольшие
+    выполняются сразу, от POSTS_BULK_THRESHOLD объектов — фоновой
+    задачей после коммита (при POSTS_BULK_WORKERS = 0 — тоже сразу).
+    Задача хранит сам отбор, а не id объектов. Возвращает задачу
+    или None, если операция уже выполнена.'''
+    threshold = settings.POSTS_BULK_THRESHOLD
+    if queryset.order_by()[:threshold].count() < threshold:
+        run(action, queryset, **params)
+        return None
+    job = BulkJob.objects.create(
+        action=action, user=user, total=queryset.order_by().count(),
+        params=dict(params, query=dump_query(queryset)))
+    if not settings.POSTS_BULK_WORKERS:
+        execute(job.pk)
+    else:
+        transaction.on_commit(lambda: executor().submit(_execute, job.pk))
+    return job
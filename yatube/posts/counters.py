@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Group, Post, UserCounter
+
+User = get_user_model()
+
+
+def count_of(queryset, field, outer='pk'):
+    '''Подзапрос COUNT(*) строк queryset, у которых field = OuterRef(outer).'''
+    counted = queryset.filter(**{field: OuterRef(outer)}).order_by().values(
+        field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def user_counts():
+    '''Точные значения счётчиков UserCounter.'''
+    return {
+        'posts_count': count_of(Post.objects.all(), 'author', 'user'),
+        'followers_count': count_of(Follow.objects.all(), 'author', 'user'),
+        'following_count': count_of(Follow.objects.all(), 'user', 'user'),
+    }
+
+
+def ensure_user_counters(users=None):
+    '''Создание недостающих строк UserCounter.
+    Новые строки сразу получают точные значения.
+    '''
+    users = User.objects.all() if users is None else users
+    missing = users.filter(counter__isnull=True).values_list('pk', flat=True)
+    created = UserCounter.objects.bulk_create(
+        (UserCounter(user_id=pk) for pk in missing.iterator()),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    if created:
+        repair_users(users)
+    return len(created)
+
+
+def counter_for(user):
+    '''Счётчики пользователя; недостающая строка создаётся.'''
+    try:
+        return user.counter
+    except UserCounter.DoesNotExist:
+        ensure_user_counters(User.objects.filter(pk=user.pk))
+        return UserCounter.objects.get(user=user)
+
+
+def shifted(field, delta):
+    '''F(field) + delta. Уменьшение не уходит ниже нуля: разошедшийся
+    счётчик не должен ронять удаление на CHECK положительного поля,
+    точное значение вернёт repair_counters.'''
+    value = F(field) + delta
+    return Greatest(value, 0) if delta < 0 else value
+
+
+def bump_user(user_id, field, delta):
+    '''Атомарное изменение счётчика пользователя через F().
+    Отсутствующая строка не создаётся: её с точными значениями
+    заведёт counter_for при первом чтении.
+    '''
+    UserCounter.objects.filter(user_id=user_id).update(
+        **{field: shifted(field, delta)})
+
+
+def bump_user_read(user_id, field, delta):
+    '''bump_user с чтением нового значения в той же транзакции.
+    Обновление блокирует строку до коммита, поэтому каждый из
+    параллельных вызовов видит своё значение. None — строки нет.
+    '''
+    with transaction.atomic():
+        bump_user(user_id, field, delta)
+        return UserCounter.objects.filter(user_id=user_id).values_list(
+            field, flat=True).first()
+
+
+def bump_group(group_id, delta):
+    if group_id is not None:
+        Group.objects.filter(pk=group_id).update(
+            posts_count=shifted('posts_count', delta))
+
+
+def bump_post(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=shifted('comments_count', delta))
+
+
+def repair_users(users=None):
+    '''Пересчёт разошедшихся счётчиков пользователей.
+    Возвращает число исправленных строк.
+    '''
+    counters = UserCounter.objects.all()
+    if users is not None:
+        counters = counters.filter(user__in=users)
+    repaired = 0
+    for field, actual in user_counts().items():
+        repaired += counters.exclude(**{field: actual}).update(
+            **{field: actual})
+    # понижение популярных — только командой demote_authors,
+    # она рассылает посты по лентам
+    repaired += counters.filter(
+        popular=False, followers_count__gte=settings.POSTS_FANOUT_LIMIT,
+    ).update(popular=True)
+    return repaired
+
+
+def repair_groups(groups=None):
+    '''Пересчёт разошедшихся счётчиков постов в группах.'''
+    groups = Group.objects.all() if groups is None else groups
+    actual = count_of(Post.objects.all(), 'group')
+    return groups.exclude(posts_count=actual).update(posts_count=actual)
+
+
+def repair_posts(posts=None):
+    '''Пересчёт разошедшихся счётчиков комментариев постов.'''
+    posts = Post.objects.all() if posts is None else posts
+    actual = count_of(Comment.objects.all(), 'post')
+    return posts.exclude(comments_count=actual).update(comments_count=actual)
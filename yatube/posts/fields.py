@@ -0,0 +1,22 @@
+import json
+
+from django.db import models
+
+
+class JSONTextField(models.TextField):
+    '''JSON в текстовой колонке: в Django 2.2 JSONField есть
+    только для PostgreSQL.'''
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            return json.loads(value) if value else {}
+        return value
+
+    def get_prep_value(self, value):
+        return json.dumps(value)
+
+    def value_to_string(self, obj):
+        return self.get_prep_value(self.value_from_object(obj))
@@ -1,5 +1,6 @@
 from django import forms
 
+from . import renditions, uploads
 from .models import Post, Comment
 
 
@@ -8,6 +9,41 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, **kwargs):
+        '''Слишком большой файл или файл чужого формата не передаётся
+        в Pillow: ошибка выводится из clean_image.'''
+        super().__init__(*args, **kwargs)
+        self.image_error = None
+        upload = self.files.get('image')
+        if upload is not None:
+            self.image_error = uploads.screen(upload)
+            if self.image_error:
+                self.files = self.files.copy()
+                del self.files['image']
+
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if self.image_error:
+            raise forms.ValidationError(self.image_error)
+        # картинку из формы Pillow открыл только по заголовку
+        opened = getattr(image, 'image', None)
+        if opened is not None:
+            error = uploads.check_pixels(opened)
+            if error:
+                raise forms.ValidationError(error)
+        return image
+
+    def save(self, commit=True):
+        '''Новая картинка ставится в очередь на нарезку размеров,
+        до их готовности шаблоны показывают оригинал.'''
+        image_changed = 'image' in self.changed_data
+        if image_changed:
+            self.instance.renditions = {}
+        post = super().save(commit=commit)
+        if commit and image_changed:
+            renditions.schedule(post)
+        return post
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,107 @@
+'''Обработка картинок в процессах-воркерах.
+Модуль не импортирует Django: воркеры запускаются через spawn.
+'''
+import hashlib
+import os
+
+from PIL import Image, ImageOps
+
+try:
+    # AVIF в Pillow появляется вместе с плагином pillow-avif-plugin
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# формат Pillow -> (расширение, MIME-тип, параметры сохранения)
+FORMATS = {
+    'AVIF': ('avif', 'image/avif', {'quality': 60}),
+    'WEBP': ('webp', 'image/webp', {'quality': 80, 'method': 4}),
+    'PNG': ('png', 'image/png', {'optimize': True}),
+    'JPEG': ('jpg', 'image/jpeg',
+             {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+# место ключа содержимого в путях размеров: для уменьшенного оригинала
+# ключ — хэш уменьшенного файла, он известен только воркеру
+KEY = '{key}'
+CHUNK_SIZE = 64 * 1024
+
+
+def available(formats):
+    '''Форматы из списка, которые умеет сохранять установленный Pillow.'''
+    Image.init()
+    return [fmt for fmt in formats if fmt in FORMATS and fmt in Image.SAVE]
+
+
+def sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def downscale(source, max_side):
+    '''Уменьшение оригинала до max_side по большей стороне
+    с сохранением формата. Оригинал не меняется: копия пишется
+    рядом во временный файл. Возвращает (путь копии, её sha256)
+    или None, если оригинал не больше max_side.
+    '''
+    with Image.open(source) as image:
+        if max(image.size) <= max_side:
+            return None
+        fmt = image.format
+        # JPEG сразу декодируется в уменьшенном масштабе
+        image.draft('RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        if fmt == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+            image = image.convert('RGB')
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        options = FORMATS[fmt][2] if fmt in FORMATS else {}
+        target = f'{source}.{os.getpid()}.tmp'
+        image.save(target, fmt, **options)
+    return target, sha256(target)
+
+
+def process(source, max_side, jobs, key):
+    '''Задача воркера для новой загрузки: уменьшение оригинала
+    и нарезка размеров. В путях заданий KEY заменяется ключом
+    содержимого: key или хэшем уменьшенной копии. При max_side = None
+    оригинал не уменьшается. Возвращает (результат downscale,
+    результат render).
+    '''
+    downscaled = None
+    if max_side is not None:
+        downscaled = downscale(source, max_side)
+    if downscaled is not None:
+        source, key = downscaled
+    jobs = [(job, target.replace(KEY, key), width, height, fmt)
+            for job, target, width, height, fmt in jobs]
+    return downscaled, render(source, jobs)
+
+
+def render(source, jobs):
+    '''Нарезка картинки source по заданиям
+    (ключ, путь, ширина, высота, формат): картинка вписывается
+    в размер с обрезкой по центру, каждый размер уменьшается один раз
+    и сохраняется во всех форматах.
+    Возвращает {ключ: (ширина, высота)} готовых файлов.
+    '''
+    done, sized = {}, {}
+    with Image.open(source) as image:
+        if jobs:
+            # с запасом на поворот по EXIF
+            side = max(max(job[2], job[3]) for job in jobs)
+            image.draft('RGB', (side, side))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        for key, target, width, height, fmt in jobs:
+            if (width, height) not in sized:
+                sized[width, height] = ImageOps.fit(
+                    image, (width, height), Image.LANCZOS,
+                    centering=(0.5, 0.5))
+            result = sized[width, height]
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            result.save(target, fmt, **FORMATS[fmt][2])
+            done[key] = result.size
+    return done
@@ -0,0 +1,114 @@
+from statistics import median
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from posts import counters, timeline
+from posts.models import Follow, Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Замер записи поста и чтения ленты подписок при '
+            'распределении подписчиков по закону Ципфа. '
+            'Все данные откатываются после замера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=2000,
+                            help='число читателей')
+        parser.add_argument('--authors', type=int, default=50,
+                            help='число авторов')
+        parser.add_argument('--exponent', type=float, default=1.0,
+                            help='показатель распределения Ципфа')
+        parser.add_argument('--posts', type=int, default=20,
+                            help='постов у каждого автора')
+        parser.add_argument('--limit', type=int, default=500,
+                            help='порог подписчиков для гибридного режима')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='повторов каждого замера')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            authors, readers = self.seed(options)
+            for title, limit in (
+                ('fan-out', 10 ** 12),
+                ('hybrid', options['limit']),
+            ):
+                with override_settings(POSTS_FANOUT_LIMIT=limit,
+                                       DEBUG=False):
+                    timeline.mark_popular(authors)
+                    self.measure(title, authors, readers, options)
+            for author in authors:
+                cache.delete(timeline.RECENT_KEY.format(author.pk))
+            transaction.set_rollback(True)
+
+    def seed(self, options):
+        authors = User.objects.bulk_create(
+            User(username=f'bench_author_{i}')
+            for i in range(options['authors'])
+        )
+        readers = User.objects.bulk_create(
+            User(username=f'bench_reader_{i}')
+            for i in range(options['readers'])
+        )
+        if not authors[0].pk:
+            authors = list(User.objects.filter(
+                username__startswith='bench_author_').order_by('pk'))
+            readers = list(User.objects.filter(
+                username__startswith='bench_reader_').order_by('pk'))
+        follows = []
+        for rank, author in enumerate(authors, start=1):
+            size = max(1, int(len(readers) / rank ** options['exponent']))
+            follows.extend(
+                Follow(author=author, user=reader)
+                for reader in readers[:size]
+            )
+        Follow.objects.bulk_create(follows, batch_size=500)
+        counters.ensure_user_counters(
+            User.objects.filter(username__startswith='bench_'))
+        smallest = max(1, int(
+            len(readers) / len(authors) ** options['exponent']))
+        for author in authors:
+            for i in range(options['posts']):
+                Post.objects.create(author=author, text=f'Пост {i}')
+        self.stdout.write(
+            f'Подписок: {len(follows)}, самый популярный автор: '
+            f'{len(readers)} подписчиков, наименее популярный: '
+            f'{smallest}'
+        )
+        return authors, readers
+
+    def timed(self, func, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = perf_counter()
+            func()
+            samples.append((perf_counter() - start) * 1000)
+        return median(samples), max(samples)
+
+    def measure(self, title, authors, readers, options):
+        repeat = options['repeat']
+        for name, author in (('популярный', authors[0]),
+                             ('обычный', authors[-1])):
+            med, worst = self.timed(
+                lambda: Post.objects.create(author=author, text='Замер'),
+                repeat,
+            )
+            self.stdout.write(
+                f'{title:8} запись поста, {name} автор: '
+                f'медиана {med:.2f} мс, максимум {worst:.2f} мс'
+            )
+        client = Client()
+        client.force_login(readers[0])
+        url = reverse('posts:follow_index')
+        med, worst = self.timed(lambda: client.get(url), repeat)
+        self.stdout.write(
+            f'{title:8} чтение /follow/: '
+            f'медиана {med:.2f} мс, максимум {worst:.2f} мс'
+        )
@@ -0,0 +1,108 @@
+from statistics import median
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from posts.models import Comment, Post
+from posts.threads import MAX_DEPTH, subtree
+from posts.views import comment_page
+
+User = get_user_model()
+
+
+def naive_subtree(root):
+    '''Ветка через parent без пути: запрос на каждый комментарий.'''
+    found = []
+    for reply in root.replies.select_related('author').order_by('pk'):
+        found.append(reply)
+        found.extend(naive_subtree(reply))
+    return found
+
+
+def naive_levels(root):
+    '''Ветка через parent без пути: запрос на каждый уровень.'''
+    found, level = [], [root.pk]
+    while level:
+        replies = list(Comment.objects.filter(
+            parent_id__in=level).select_related('author'))
+        found.extend(replies)
+        level = [reply.pk for reply in replies]
+    return found
+
+
+class Command(BaseCommand):
+    help = ('Замер загрузки веток комментариев по материализованному '
+            'пути против рекурсии по parent на глубоких и широких ветках. '
+            'Все данные откатываются после замера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depth', type=int, default=MAX_DEPTH,
+                            help='глубина глубокой ветки')
+        parser.add_argument('--width', type=int, default=2000,
+                            help='ответов в широкой ветке')
+        parser.add_argument('--threads', type=int, default=200,
+                            help='веток у поста')
+        parser.add_argument('--replies', type=int, default=20,
+                            help='ответов в каждой из веток')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='повторов каждого замера')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.author = User.objects.create(username='bench_threads')
+            self.post = Post.objects.create(author=self.author, text='Замер')
+            deep, wide = self.seed(options)
+            with override_settings(DEBUG=False):
+                for title, root in (('глубокая', deep), ('широкая', wide)):
+                    for name, load in (
+                        ('путь', lambda: list(subtree(root))),
+                        ('parent, по уровням', lambda: naive_levels(root)),
+                        ('parent, рекурсия', lambda: naive_subtree(root)),
+                    ):
+                        self.measure(f'{title} ветка, {name}', load,
+                                     options['repeat'])
+                request = RequestFactory().get('/')
+                self.measure(
+                    'страница веток с первыми ответами',
+                    lambda: list(comment_page(request, self.post.pk)),
+                    options['repeat'],
+                )
+            transaction.set_rollback(True)
+
+    def comment(self, parent=None):
+        return Comment.objects.create(
+            post=self.post, author=self.author, text='Ответ', parent=parent)
+
+    def seed(self, options):
+        deep = parent = self.comment()
+        for _ in range(options['depth']):
+            parent = self.comment(parent)
+        wide = self.comment()
+        for _ in range(options['width']):
+            self.comment(wide)
+        for _ in range(options['threads']):
+            root = parent = self.comment()
+            for _ in range(options['replies']):
+                reply = self.comment(parent)
+                parent = reply if reply.depth < 3 else root
+        self.stdout.write(
+            f'Комментариев: {Comment.objects.filter(post=self.post).count()}')
+        return deep, wide
+
+    def measure(self, title, load, repeat):
+        with CaptureQueriesContext(connection) as queries:
+            load()
+        samples = []
+        for _ in range(repeat):
+            start = perf_counter()
+            load()
+            samples.append((perf_counter() - start) * 1000)
+        self.stdout.write(
+            f'{title}: запросов {len(queries)}, '
+            f'медиана {median(samples):.2f} мс, '
+            f'максимум {max(samples):.2f} мс'
+        )
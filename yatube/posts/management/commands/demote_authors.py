@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = ('Возврат к рассылке по лентам авторов, у которых подписчиков '
+            'стало меньше POSTS_FANOUT_LIMIT * POSTS_DEMOTE_SHARE: их '
+            'последние посты рассылаются подписчикам. Запускается '
+            'по расписанию.')
+
+    def handle(self, *args, **options):
+        demoted = 0
+        for author_id in list(timeline.demoted_authors()):
+            timeline.author_demoted(author_id)
+            demoted += 1
+        self.stdout.write(f'Понижено авторов: {demoted}')
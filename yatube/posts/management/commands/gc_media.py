@@ -0,0 +1,95 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from posts import media
+
+IMAGES_ROOT = 'posts'
+RENDITIONS_ROOT = 'renditions'
+
+
+class Command(BaseCommand):
+    help = ('Удаление файлов медиа, на которые не ссылается ни один пост: '
+            'картинок и устаревших размеров. Старый кэш sorl-thumbnail '
+            'удаляется явным --roots cache.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='только показать, что будет удалено')
+        parser.add_argument('--batch', type=int, default=1000,
+                            help='файлов в одной проверке по базе')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='потоков для удаления')
+        parser.add_argument('--min-age', type=int, default=60 * 60,
+                            help='не трогать файлы моложе стольких секунд')
+        parser.add_argument('--roots', nargs='+',
+                            default=[IMAGES_ROOT, RENDITIONS_ROOT],
+                            help='каталоги внутри MEDIA_ROOT; в других '
+                                 'каталогах, кроме posts и renditions, '
+                                 'удаляется всё')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.scanned = self.orphans = self.size = 0
+        deadline = time.time() - options['min_age']
+        with ThreadPoolExecutor(options['workers']) as self.pool:
+            for root in options['roots']:
+                batch = []
+                directory = os.path.join(settings.MEDIA_ROOT, root)
+                for path, stat in media.walk(directory):
+                    self.scanned += 1
+                    # свежий файл может ещё ждать коммита поста
+                    if stat.st_mtime > deadline:
+                        continue
+                    name = os.path.relpath(path, settings.MEDIA_ROOT)
+                    batch.append((name.replace(os.sep, '/'), stat.st_size))
+                    if len(batch) >= options['batch']:
+                        self.sweep(root, batch)
+                        batch = []
+                self.sweep(root, batch)
+        verb = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write(
+            f'Просмотрено файлов: {self.scanned}. {verb}: {self.orphans}, '
+            f'{filesizeformat(self.size)}')
+
+    def sweep(self, root, batch):
+        '''Удаление сирот из пачки файлов одного каталога.'''
+        if not batch:
+            return
+        if root == IMAGES_ROOT:
+            referenced = media.referenced_images([name for name, _ in batch])
+        elif root == RENDITIONS_ROOT:
+            referenced = media.referenced_renditions({
+                name.split('/')[1] for name, _ in batch
+                if name.count('/') > 1})
+        else:
+            referenced = set()
+        orphans = [(name, size) for name, size in batch
+                   if name not in referenced]
+        self.orphans += len(orphans)
+        self.size += sum(size for _, size in orphans)
+        if not self.dry_run:
+            paths = [os.path.join(settings.MEDIA_ROOT, name)
+                     for name, _ in orphans]
+            list(self.pool.map(self.remove, paths))
+        self.stdout.write(
+            f'Просмотрено: {self.scanned}, сирот: {self.orphans}...')
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        # опустевшие каталоги убираются вслед за файлами
+        directory = os.path.dirname(path)
+        while directory != os.path.normpath(settings.MEDIA_ROOT):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
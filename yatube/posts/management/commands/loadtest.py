@@ -0,0 +1,356 @@
+import http.client
+import json
+import math
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from io import BytesIO
+from time import perf_counter
+from urllib.parse import urlencode, urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY, get_user_model)
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post
+from posts.search import words
+
+User = get_user_model()
+
+# имя адреса posts.urls: (вес в смеси, только для вошедших)
+MIX = {
+    'index': (30, False),
+    'post_detail': (20, False),
+    'group_list': (10, False),
+    'profile': (10, False),
+    'follow_index': (10, True),
+    'search': (5, False),
+    'comments': (3, False),
+    'replies': (2, False),
+    'add_comment': (4, True),
+    'post_create': (1, True),
+    'post_edit': (1, True),
+    'profile_follow': (2, True),
+    'profile_unfollow': (2, True),
+}
+MUTATING = ('add_comment', 'profile_follow', 'profile_unfollow')
+SAMPLE = 1000  # постов, групп и веток, по которым ходит нагрузка
+FORM = 'application/x-www-form-urlencoded'
+
+
+def percentile(values, share):
+    '''Значение по рангу: share процентов значений не больше него.'''
+    values = sorted(values)
+    return values[max(math.ceil(share / 100 * len(values)) - 1, 0)]
+
+
+class WsgiClient:
+    '''Запросы прямо в yatube.wsgi.application, в этом же процессе:
+    та же цепочка middleware, что у сервера, и подсчёт SQL-запросов.'''
+    counts_queries = True
+
+    def __init__(self):
+        from yatube.wsgi import application
+        self.application = application
+
+    def request(self, method, path, query, body, headers):
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'wsgi.input': BytesIO(body),
+            'CONTENT_LENGTH': str(len(body)),
+            'CONTENT_TYPE': FORM if body else '',
+        }
+        for name, value in headers.items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        setup_testing_defaults(environ)
+        status = []
+        response = self.application(
+            environ, lambda line, headers, exc_info=None: status.append(line))
+        try:
+            for _ in response:
+                pass
+        finally:
+            response.close()
+        return int(status[0].split()[0])
+
+
+class HttpClient:
+    '''Запросы к запущенному серверу, соединение на поток.
+    Сессии создаются в базе команды: сервер должен работать с ней же.'''
+    counts_queries = False
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.local = threading.local()
+
+    def request(self, method, path, query, body, headers):
+        if getattr(self.local, 'connection', None) is None:
+            self.local.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=60)
+        headers = dict(headers, **({'Content-Type': FORM} if body else {}))
+        try:
+            self.local.connection.request(
+                method, path + (f'?{query}' if query else ''), body, headers)
+            response = self.local.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.local.connection.close()
+            self.local.connection = None
+            return 0
+        return response.status
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест страниц posts.urls: смесь запросов гостей и '
+            'вошедших пользователей по данным из базы (например, от '
+            'команды seed). Для каждого адреса — p50/p95/p99 времени '
+            'ответа, запросы в секунду и SQL-запросы на запрос (только '
+            'без --url). Результат можно сохранить и сравнить с прошлым.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000,
+                            help='число запросов')
+        parser.add_argument('--warmup', type=int, default=50,
+                            help='запросов до замера')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='одновременных запросов (потоков)')
+        parser.add_argument('--url', default=None,
+                            help='адрес запущенного сервера, например '
+                                 'http://127.0.0.1:8000; без него запросы '
+                                 'идут в WSGI-приложение в этом процессе')
+        parser.add_argument('--anonymous', type=float, default=0.5,
+                            help='доля гостей среди запросов к страницам, '
+                                 'открытым без входа')
+        parser.add_argument('--users', type=int, default=20,
+                            help='сколько пользователей входит на сайт')
+        parser.add_argument('--only', default='',
+                            help='только эти адреса, через запятую')
+        parser.add_argument('--read-only', action='store_true',
+                            help='без комментариев и подписок')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='зерно выбора адресов')
+        parser.add_argument('--save', default=None,
+                            help='сохранить результат в JSON-файл')
+        parser.add_argument('--compare', nargs='+', default=[],
+                            metavar='JSON',
+                            help='сравнить с сохранённым прогоном; с двумя '
+                                 'файлами — только сравнить их, без нагрузки')
+
+    def handle(self, *args, **options):
+        if len(options['compare']) > 2:
+            raise CommandError('--compare принимает один или два файла')
+        if len(options['compare']) == 2:
+            old, new = (self.load(path) for path in options['compare'])
+            self.compare(old, new)
+            return
+        self.options = options
+        self.mix = self.choose_mix(options)
+        self.client = (HttpClient(options['url']) if options['url']
+                       else WsgiClient())
+        self.sample()
+        self.sessions = [self.login(user) for user in self.readers]
+        self.samples = None
+        try:
+            self.run(options['warmup'])
+            self.samples = []
+            started = perf_counter()
+            self.run(options['requests'])
+            wall = perf_counter() - started
+        finally:
+            for session, _ in self.sessions:
+                session.delete()
+        result = self.summary(wall)
+        self.report(result)
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(self.load(options['compare'][0]), result)
+
+    def choose_mix(self, options):
+        names = [name for name in options['only'].split(',') if name]
+        unknown = set(names) - set(MIX)
+        if unknown:
+            raise CommandError(f'Нет таких адресов: {", ".join(unknown)}')
+        mix = {name: MIX[name] for name in names or MIX
+               if not (options['read_only'] and name in MUTATING)}
+        if not mix:
+            raise CommandError('Смесь запросов пуста')
+        return mix
+
+    def sample(self):
+        '''Случайные существующие посты, их авторы, группы и ветки.'''
+        rng = random.Random(self.options['seed'])
+        last = Post.objects.aggregate(last=Max('pk'))['last']
+        if last is None:
+            raise CommandError('В базе нет постов: заполните её командой '
+                               'seed')
+        self.posts = list(Post.objects.filter(
+            pk__in=[rng.randint(1, last) for _ in range(SAMPLE * 2)],
+        ).values_list('pk', 'author_id', 'author__username', 'text')[
+            :SAMPLE])
+        self.groups = list(Group.objects.values_list('slug', flat=True)[
+            :SAMPLE]) or [None]
+        self.threads = list(Comment.objects.filter(
+            parent__isnull=False).values_list('post_id', 'parent_id')[
+                :SAMPLE])
+        self.queries_words = [
+            word for *_, text in self.posts[:100] for word in words(text)
+            if len(word) > 3] or ['пост']
+        authors = {author for _, author, _, _ in self.posts}
+        self.readers = list(User.objects.filter(pk__in=authors).order_by(
+            'pk')[:self.options['users']]) or list(User.objects.order_by(
+                'pk')[:self.options['users']])
+        self.own_posts = {}
+        for pk, author, _, _ in self.posts:
+            self.own_posts.setdefault(author, pk)
+
+    def login(self, user):
+        '''Сессия вошедшего пользователя и cookie с CSRF-токеном.'''
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        request = HttpRequest()
+        token = get_token(request)
+        cookies = '; '.join((
+            f'{settings.SESSION_COOKIE_NAME}={session.session_key}',
+            f'{settings.CSRF_COOKIE_NAME}={request.META["CSRF_COOKIE"]}',
+        ))
+        return session, {'user': user, 'cookie': cookies, 'token': token}
+
+    def target(self, name, rng, user):
+        '''(аргументы адреса, параметры строки запроса, данные формы).'''
+        pk, _, username, _ = rng.choice(self.posts)
+        if name in ('post_detail', 'comments'):
+            return {'post_id': pk}, {}, {}
+        if name == 'group_list':
+            return {'slug': rng.choice(self.groups)}, {}, {}
+        if name in ('profile', 'profile_follow', 'profile_unfollow'):
+            return {'username': username}, {}, {}
+        if name == 'search':
+            return {}, {'q': rng.choice(self.queries_words)}, {}
+        if name == 'replies':
+            post_id, comment_id = rng.choice(self.threads)
+            return {'post_id': post_id, 'comment_id': comment_id}, {}, {}
+        if name == 'post_edit':
+            return {'post_id': self.own_posts.get(user['user'].pk, pk)}, {}, {}
+        if name == 'add_comment':
+            return {'post_id': pk}, {}, {
+                'text': 'Комментарий нагрузочного теста',
+                'csrfmiddlewaretoken': user['token'],
+            }
+        return {}, {}, {}
+
+    def run(self, count):
+        if self.options['concurrency'] <= 1:
+            for number in range(count):
+                self.run_one(number)
+            return
+        with ThreadPoolExecutor(self.options['concurrency']) as pool:
+            list(pool.map(self.run_one, range(count)))
+
+    def run_one(self, number):
+        rng = random.Random(f'{self.options["seed"]}:{number}')
+        names = list(self.mix)
+        name = rng.choices(names, [self.mix[name][0] for name in names])[0]
+        if name == 'replies' and not self.threads:
+            name = 'comments'
+        anonymous = (not self.mix.get(name, MIX[name])[1]
+                     and rng.random() < self.options['anonymous'])
+        user = None if anonymous else rng.choice(self.sessions)[1]
+        kwargs, params, data = self.target(name, rng, user)
+        headers = {} if anonymous else {'Cookie': user['cookie']}
+        queries = []
+        start = perf_counter()
+        with connection.execute_wrapper(
+                lambda execute, *args: queries.append(1) or execute(*args)):
+            status = self.client.request(
+                'POST' if data else 'GET', reverse(f'posts:{name}',
+                                                   kwargs=kwargs),
+                urlencode(params), urlencode(data).encode(), headers)
+        elapsed = (perf_counter() - start) * 1000
+        if self.samples is not None:
+            self.samples.append((name, elapsed, len(queries),
+                                 status not in (200, 302)))
+
+    def summary(self, wall):
+        views = {}
+        for name in self.mix:
+            rows = [row for row in self.samples if row[0] == name]
+            if rows:
+                views[name] = self.stats(rows, wall)
+        return {
+            'options': {key: self.options[key] for key in (
+                'requests', 'concurrency', 'url', 'anonymous', 'users',
+                'seed')},
+            'total': self.stats(self.samples, wall),
+            'views': views,
+        }
+
+    def stats(self, rows, wall):
+        times = [row[1] for row in rows]
+        return {
+            'requests': len(rows),
+            'errors': sum(row[3] for row in rows),
+            'p50': percentile(times, 50),
+            'p95': percentile(times, 95),
+            'p99': percentile(times, 99),
+            'rps': len(rows) / wall,
+            'queries': (sum(row[2] for row in rows) / len(rows)
+                        if self.client.counts_queries else None),
+        }
+
+    def report(self, result):
+        self.stdout.write(
+            f'{"адрес":18} {"запросов":>8} {"ошибок":>6} {"p50, мс":>8} '
+            f'{"p95, мс":>8} {"p99, мс":>8} {"в сек.":>8} {"SQL":>5}')
+        rows = list(result['views'].items()) + [('всего', result['total'])]
+        for name, stats in rows:
+            queries = stats.get('queries')
+            self.stdout.write(
+                f'{name:18} {stats["requests"]:8} {stats["errors"]:6} '
+                f'{stats["p50"]:8.1f} {stats["p95"]:8.1f} '
+                f'{stats["p99"]:8.1f} {stats["rps"]:8.1f} '
+                f'{"—" if queries is None else f"{queries:.1f}":>5}')
+
+    def load(self, path):
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Не прочитать {path}: {error}')
+
+    def compare(self, old, new):
+        '''Изменения по адресам: было → стало (разница в процентах).'''
+        self.stdout.write('Сравнение с прошлым прогоном:')
+        rows = [(name, old['views'].get(name), stats)
+                for name, stats in new['views'].items()]
+        rows.append(('всего', old['total'], new['total']))
+        for name, before, after in rows:
+            if before is None:
+                self.stdout.write(f'{name}: нет в прошлом прогоне')
+                continue
+            changes = []
+            for key, title in (('p50', 'p50'), ('p95', 'p95'),
+                               ('p99', 'p99'), ('rps', 'в сек.'),
+                               ('queries', 'SQL')):
+                if before.get(key) is None or after.get(key) is None:
+                    continue
+                delta = ((after[key] - before[key]) / before[key] * 100
+                         if before[key] else 0)
+                changes.append(f'{title} {before[key]:.1f} → '
+                               f'{after[key]:.1f} ({delta:+.0f}%)')
+            self.stdout.write(f'{name}: ' + ', '.join(changes))
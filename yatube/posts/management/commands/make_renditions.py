@@ -0,0 +1,62 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+
+from posts import imaging, renditions
+from posts.models import Post
+from posts.storage import content_key
+
+
+class Command(BaseCommand):
+    help = ('Нарезка размеров картинок для уже загруженных постов: '
+            'недостающие форматы и ширины из settings.POSTS_RENDITIONS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='нарезать заново и готовые картинки')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='число процессов')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').only(
+            'pk', 'image', 'renditions').order_by('pk')
+        workers = options['workers']
+        self.done = self.failed = 0
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            pending = {}
+            for post in posts.iterator():
+                if not options['all'] and renditions.is_complete(post):
+                    continue
+                if not os.path.exists(post.image.path):
+                    self.stderr.write(f'Нет файла {post.image.name}')
+                    self.failed += 1
+                    continue
+                names, jobs = renditions.plan(post)
+                future = pool.submit(
+                    imaging.process, post.image.path, None, jobs,
+                    content_key(post.image.name))
+                pending[future] = (post.pk, post.image.name, names)
+                # в очереди не больше нескольких задач на воркер
+                if len(pending) >= workers * 4:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    self.collect(finished, pending)
+            self.collect(wait(pending).done, pending)
+        self.stdout.write(
+            f'Готово постов: {self.done}, ошибок: {self.failed}')
+
+    def collect(self, finished, pending):
+        '''Запись результатов готовых задач и вывод прогресса.'''
+        for future in finished:
+            post_id, image, names = pending.pop(future)
+            try:
+                renditions.store(post_id, image, names, future.result())
+            except Exception as error:
+                self.stderr.write(f'Пост {post_id}: {error}')
+                self.failed += 1
+                continue
+            self.done += 1
+            if self.done % 100 == 0:
+                self.stdout.write(f'Готово постов: {self.done}...')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт денормализованных счётчиков постов, комментариев и '
+            'подписок. Исправляются только разошедшиеся значения.')
+
+    def handle(self, *args, **options):
+        created = counters.ensure_user_counters()
+        self.stdout.write(f'Создано счётчиков пользователей: {created}')
+        self.stdout.write(
+            f'Исправлено счётчиков пользователей: {counters.repair_users()}')
+        self.stdout.write(
+            f'Исправлено счётчиков групп: {counters.repair_groups()}')
+        self.stdout.write(
+            f'Исправлено счётчиков постов: {counters.repair_posts()}')
@@ -0,0 +1,355 @@
+import multiprocessing
+import os
+import random
+from array import array
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import partial
+from heapq import merge
+from io import BytesIO
+from itertools import groupby, islice
+from operator import itemgetter
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import F, Max
+from PIL import Image, ImageDraw
+
+from posts import counters, seeding, versions
+from posts.models import (Comment, Follow, Group, MediaFile, Post, Timeline,
+                          content_storage, path_segment)
+from posts.search import get_backend
+from posts.threads import MAX_DEPTH
+from posts.timeline import popular_authors
+
+User = get_user_model()
+
+IMAGE_SIZE = (1200, 800)
+
+
+def next_pk(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def day(value):
+    return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+
+@contextmanager
+def explicit_dates(*fields):
+    '''bulk_create пишет даты из объектов, а не время вставки.'''
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Синтетический набор данных для нагрузочного тестирования: '
+            'пользователи, группы, посты с картинками из пула, подписки '
+            'с лентами и комментарии с ответами. Подписчики авторов, '
+            'посты авторов и комментарии постов распределены по закону '
+            'Ципфа. Строки пишутся bulk_create частями по --chunk, '
+            'генерируются в --workers процессах; одинаковые --seed, '
+            '--chunk и --until дают одинаковые данные.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000,
+                            help='число пользователей')
+        parser.add_argument('--authors', type=int, default=1000,
+                            help='сколько первых пользователей пишут посты')
+        parser.add_argument('--groups', type=int, default=50,
+                            help='число групп')
+        parser.add_argument('--posts', type=int, default=100000,
+                            help='число постов')
+        parser.add_argument('--comments', type=int, default=300000,
+                            help='число комментариев (в среднем)')
+        parser.add_argument('--follows', type=int, default=20,
+                            help='подписок пользователя в среднем')
+        parser.add_argument('--exponent', type=float, default=1.0,
+                            help='показатель распределения Ципфа')
+        parser.add_argument('--replies', type=float, default=0.3,
+                            help='доля комментариев-ответов')
+        parser.add_argument('--group-share', type=float, default=0.7,
+                            help='доля постов в группах')
+        parser.add_argument('--images', type=int, default=20,
+                            help='картинок в пуле')
+        parser.add_argument('--image-share', type=float, default=0.2,
+                            help='доля постов с картинкой')
+        parser.add_argument('--timeline', type=int, default=50,
+                            help='записей в ленте подписок пользователя')
+        parser.add_argument('--days', type=int, default=365,
+                            help='за сколько дней написаны посты')
+        parser.add_argument('--until', type=day, default=None,
+                            help='день последнего поста, ГГГГ-ММ-ДД '
+                                 '(по умолчанию сегодня)')
+        parser.add_argument('--prefix', default='seed',
+                            help='префикс имён пользователей и адресов групп')
+        parser.add_argument('--password', default='seed-password',
+                            help='пароль всех пользователей')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='зерно генератора случайных чисел')
+        parser.add_argument('--chunk', type=int, default=5000,
+                            help='строк в одной части')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='процессов-генераторов (0 — без них)')
+
+    def handle(self, *args, **options):
+        self.options = options
+        if not 0 < options['authors'] <= options['users']:
+            raise CommandError('--authors должно быть от 1 до --users')
+        prefix = options['prefix']
+        if (User.objects.filter(username__startswith=f'{prefix}_').exists()
+                or Group.objects.filter(
+                    slug__startswith=f'{prefix}-').exists()):
+            raise CommandError(
+                f'Данные с префиксом «{prefix}» уже есть, задайте --prefix')
+        until = options['until'] or datetime.now(timezone.utc).replace(
+            hour=0, minute=0, second=0, microsecond=0)
+        self.last_date = until.timestamp()
+        self.first_date = self.last_date - options['days'] * 24 * 3600
+        self.workers = options['workers']
+        self.pool = None
+        if self.workers > 1:
+            self.pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context('spawn'))
+        started = perf_counter()
+        try:
+            with transaction.atomic(), explicit_dates(
+                Post._meta.get_field('pub_date'),
+                Comment._meta.get_field('created'),
+            ):
+                self.seed()
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+        # группы, профили и посты набора новые, их версии ещё не заведены;
+        # устаревает только главная
+        versions.bump(versions.scope('index'))
+        self.stdout.write(f'Готово за {perf_counter() - started:.1f} с. '
+                          'Размеры картинок нарежет make_renditions.')
+
+    def seed(self):
+        self.stage('Пользователи', self.seed_users)
+        self.stage('Группы', self.seed_groups)
+        self.stage('Посты', self.seed_posts)
+        self.stage('Подписки', self.seed_follows)
+        self.stage('Комментарии', self.seed_comments)
+        self.stage('Счётчики и ленты', self.finish)
+        self.stage('Поисковый индекс', lambda: get_backend().rebuild())
+        with connection.cursor() as cursor:
+            # id заданы явно: последовательности PostgreSQL отстали
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [User, Group, Post, Comment]):
+                cursor.execute(sql)
+
+    def stage(self, title, step):
+        start = perf_counter()
+        rows = step()
+        self.stdout.write(f'{title}: {rows if rows is not None else "—"} '
+                          f'за {perf_counter() - start:.1f} с')
+
+    def ranges(self, total):
+        chunk = self.options['chunk']
+        return [(start, min(start + chunk, total))
+                for start in range(0, total, chunk)]
+
+    def generate(self, func, parts):
+        '''Результаты func по частям, по порядку. С воркерами впереди
+        записи генерируется не больше двух частей на процесс.'''
+        if self.pool is None:
+            for part in parts:
+                yield func(*part)
+            return
+        pending = deque()
+        for part in parts:
+            pending.append(self.pool.submit(func, *part))
+            if len(pending) >= self.workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def date(self, timestamp):
+        return datetime.fromtimestamp(timestamp, timezone.utc)
+
+    def seed_users(self):
+        options = self.options
+        self.user_base = next_pk(User)
+        password = make_password(
+            options['password'], salt=f'{options["prefix"]}{options["seed"]}')
+        joined = self.date(self.first_date)
+        parts = self.ranges(options['users'])
+        func = partial(seeding.users, options['seed'])
+        for (start, _), rows in zip(parts, self.generate(func, parts)):
+            User.objects.bulk_create(
+                User(pk=self.user_base + number,
+                     username=f'{options["prefix"]}_{number}',
+                     first_name=first_name, last_name=last_name,
+                     password=password, date_joined=joined)
+                for number, (first_name, last_name) in enumerate(rows, start)
+            )
+        return options['users']
+
+    def seed_groups(self):
+        options = self.options
+        self.group_base = next_pk(Group)
+        _, fake = seeding.rng_for(options['seed'], 'groups', 0)
+        Group.objects.bulk_create(
+            Group(pk=self.group_base + number,
+                  title=f'{fake.word().capitalize()} {number}',
+                  slug=f'{options["prefix"]}-{number}',
+                  description=fake.sentence())
+            for number in range(options['groups'])
+        )
+        return options['groups']
+
+    def image_pool(self):
+        '''Картинки для постов: прямоугольник со случайными эллипсами.'''
+        rng = random.Random(f'{self.options["seed"]}:images')
+        names = []
+        for _ in range(self.options['images']):
+            image = Image.new('RGB', IMAGE_SIZE, self.color(rng))
+            draw = ImageDraw.Draw(image)
+            for _ in range(12):
+                x, y = rng.randrange(IMAGE_SIZE[0]), rng.randrange(
+                    IMAGE_SIZE[1])
+                draw.ellipse((x, y, x + rng.randrange(50, 400),
+                              y + rng.randrange(50, 400)),
+                             fill=self.color(rng))
+            buffer = BytesIO()
+            image.save(buffer, 'JPEG', quality=85)
+            names.append(content_storage.save(
+                Post._meta.get_field('image').upload_to + 'seed.jpg',
+                ContentFile(buffer.getvalue())))
+        return names
+
+    def color(self, rng):
+        return tuple(rng.randrange(256) for _ in range(3))
+
+    def seed_posts(self):
+        options = self.options
+        self.post_base = next_pk(Post)
+        self.author_weights = seeding.zipf_weights(
+            options['authors'], options['exponent'])
+        # последние посты авторов для лент подписок
+        self.recent = defaultdict(partial(deque, maxlen=options['timeline']))
+        self.post_dates = array('d')
+        refs = Counter()
+        func = partial(
+            seeding.posts, options['seed'],
+            authors=self.author_weights,
+            groups=seeding.zipf_weights(options['groups'],
+                                        options['exponent']),
+            group_share=options['group_share'] if options['groups'] else 0,
+            images=self.image_pool() if options['image_share'] else [],
+            image_share=options['image_share'],
+            first_date=self.first_date,
+            step=(self.last_date - self.first_date) / max(options['posts'], 1),
+        )
+        parts = self.ranges(options['posts'])
+        for (start, _), rows in zip(parts, self.generate(func, parts)):
+            posts = []
+            for number, (author, group, text, image, date) in enumerate(
+                    rows, start):
+                post = Post(
+                    pk=self.post_base + number,
+                    author_id=self.user_base + author,
+                    group_id=(None if group is None
+                              else self.group_base + group),
+                    text=text, image=image, pub_date=self.date(date),
+                )
+                posts.append(post)
+                self.recent[author].append((post.pub_date, post.pk))
+                self.post_dates.append(date)
+                if image:
+                    refs[image] += 1
+            Post.objects.bulk_create(posts)
+        for name, count in refs.items():
+            MediaFile.objects.get_or_create(name=name)
+            MediaFile.objects.filter(name=name).update(
+                refs=F('refs') + count)
+        return options['posts']
+
+    def seed_follows(self):
+        '''Подписки и ленты подписчиков: последние посты их авторов.'''
+        options = self.options
+        func = partial(seeding.follows, options['seed'],
+                       authors=self.author_weights,
+                       average=options['follows'])
+        total = 0
+        for rows in self.generate(func, self.ranges(options['users'])):
+            Follow.objects.bulk_create(
+                Follow(user_id=self.user_base + user,
+                       author_id=self.user_base + author)
+                for user, author in rows
+            )
+            Timeline.objects.bulk_create(self.timelines(rows))
+            total += len(rows)
+        return total
+
+    def timelines(self, rows):
+        for user, follows in groupby(rows, key=itemgetter(0)):
+            entries = merge(
+                *(reversed(self.recent[author]) for _, author in follows),
+                reverse=True)
+            for pub_date, pk in islice(entries, self.options['timeline']):
+                yield Timeline(user_id=self.user_base + user, post_id=pk,
+                               pub_date=pub_date)
+
+    def seed_comments(self):
+        options = self.options
+        posts = options['posts']
+        # ранг поста по числу комментариев не связан с его номером
+        ranks = list(range(posts))
+        random.Random(f'{options["seed"]}:ranks').shuffle(ranks)
+        expected = seeding.zipf_expected(
+            posts, options['exponent'], options['comments'])
+        func = partial(
+            seeding.comments, options['seed'],
+            users_count=options['users'], reply_share=options['replies'],
+            max_depth=MAX_DEPTH, last_date=self.last_date,
+        )
+        parts = [
+            (start, [expected[rank] for rank in ranks[start:stop]],
+             self.post_dates[start:stop])
+            for start, stop in self.ranges(posts)
+        ]
+        pk = base = next_pk(Comment)
+        for rows in self.generate(func, parts):
+            comments, paths = [], []
+            first = pk
+            for post, author, text, date, parent in rows:
+                path = path_segment(pk)
+                if parent is not None:
+                    path = paths[parent] + path
+                paths.append(path)
+                comments.append(Comment(
+                    pk=pk, post_id=self.post_base + post,
+                    author_id=self.user_base + author, text=text,
+                    created=self.date(date), path=path,
+                    parent_id=None if parent is None else first + parent,
+                ))
+                pk += 1
+            Comment.objects.bulk_create(comments)
+        return pk - base
+
+    def finish(self):
+        users = User.objects.filter(pk__gte=self.user_base)
+        counters.ensure_user_counters(users)
+        counters.repair_groups(Group.objects.filter(pk__gte=self.group_base))
+        counters.repair_posts(Post.objects.filter(pk__gte=self.post_base))
+        # посты популярных авторов подмешиваются в ленту при чтении
+        Timeline.objects.filter(
+            user__in=users,
+            post__author__in=popular_authors(users),
+        ).delete()
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = ('Обрезка лент подписок до settings.POSTS_TIMELINE_LENGTH '
+            'записей. Запускается по расписанию.')
+
+    def handle(self, *args, **options):
+        trimmed = 0
+        for user_id in timeline.overflowed_timelines().iterator():
+            timeline.trim_timeline(user_id)
+            trimmed += 1
+        self.stdout.write(f'Обрезано лент: {trimmed}')
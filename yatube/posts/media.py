@@ -0,0 +1,144 @@
+import logging
+import os
+import posixpath
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import MediaFile, Post
+from .storage import HASHED_NAME, content_key, hashed_name
+
+RENDITION_DIR = 'renditions/{key}'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+KEYS_PER_QUERY = 100
+
+logger = logging.getLogger(__name__)
+
+
+def acquire(name, count=1):
+    '''Ещё один пост (count постов) ссылается на файл.'''
+    if not name:
+        return
+    MediaFile.objects.get_or_create(name=name)
+    MediaFile.objects.filter(name=name).update(refs=F('refs') + count)
+
+
+def release(name, storage, count=1):
+    '''Пост (count постов) больше не ссылается на файл: последняя ссылка
+    удаляет файл и его размеры после коммита.'''
+    if not name:
+        return
+    MediaFile.objects.filter(name=name, refs__gte=count).update(
+        refs=F('refs') - count)
+    MediaFile.objects.filter(name=name, refs__lt=count).update(refs=0)
+    deleted, _ = MediaFile.objects.filter(name=name, refs=0).delete()
+    if deleted:
+        transaction.on_commit(lambda: remove(name, storage))
+
+
+def replace(name, path, digest, renditions):
+    '''Оригинал name уменьшен в файл path с хэшем digest: файл ложится
+    в хранилище под своим хэшем, посты с name переходят на него
+    с размерами renditions, а прежний файл теряет их ссылки.
+    Возвращает новое имя.'''
+    storage = Post._meta.get_field('image').storage
+    new = hashed_name(name, digest)
+    if storage.exists(new):
+        os.remove(path)
+    else:
+        os.makedirs(os.path.dirname(storage.path(new)), exist_ok=True)
+        os.replace(path, storage.path(new))
+    with transaction.atomic():
+        moved = Post.objects.filter(image=name).update(
+            image=new, renditions=renditions)
+        if moved:
+            acquire(new, moved)
+            release(name, storage, moved)
+    return new
+
+
+def remove(name, storage):
+    '''Удаление файла и каталога его размеров.'''
+    if MediaFile.objects.filter(name=name).exists():
+        # файл успели загрузить снова
+        return
+    try:
+        storage.delete(name)
+    except SuspiciousFileOperation:
+        # имя указывает за пределы хранилища: файл не наш
+        logger.warning('Файл %s вне хранилища', name)
+        return
+    directory = RENDITION_DIR.format(key=content_key(name))
+    try:
+        _, files = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for filename in files:
+        storage.delete(posixpath.join(directory, filename))
+    try:
+        os.rmdir(storage.path(directory))
+    except OSError:
+        logger.warning('Каталог %s не пуст', directory)
+
+
+def walk(root):
+    '''Файлы каталога root со всеми подкаталогами: (путь, stat).
+    Каталоги читаются потоком, список файлов в памяти не собирается.
+    '''
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry.path, entry.stat(follow_symlinks=False)
+
+
+def referenced_images(names):
+    '''Какие из файлов картинок используются постами.'''
+    return set(Post.objects.filter(image__in=names).values_list(
+        'image', flat=True)) | set(MediaFile.objects.filter(
+            name__in=names).values_list('name', flat=True))
+
+
+def referenced_renditions(keys):
+    '''Файлы размеров из каталогов keys, на которые ссылаются посты.
+    Каталог по sha256 картинки проверяется по имени картинки (индекс),
+    каталог картинки, загруженной до дедупликации, — по пути в индексе
+    размеров. Одна выборка на KEYS_PER_QUERY каталогов.
+    '''
+    keys = sorted(keys)
+    referenced = set()
+    for start in range(0, len(keys), KEYS_PER_QUERY):
+        query = Q()
+        for key in keys[start:start + KEYS_PER_QUERY]:
+            if HASHED_NAME.match(key):
+                query |= Q(image__in=hashed_images(key))
+            else:
+                prefix = RENDITION_DIR.format(key=key) + '/'
+                query |= Q(renditions__contains=prefix)
+        index = Post.objects.filter(query).values_list(
+            'renditions', flat=True)
+        referenced.update(
+            path
+            for renditions in index.iterator()
+            for entry in renditions.values()
+            for files in entry.get('formats', {}).values()
+            for path, _ in files
+        )
+    return referenced
+
+
+def hashed_images(key):
+    '''Возможные имена картинки с хэшем key.'''
+    directory = Post._meta.get_field('image').upload_to
+    return [
+        posixpath.join(directory, key[:2], key[2:4], key + extension)
+        for extension in IMAGE_EXTENSIONS
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.functions
+import django.db.models.deletion
+
+
+def count_of(queryset, field, outer='pk'):
+    counted = queryset.filter(**{field: models.OuterRef(outer)}).order_by(
+    ).values(field).annotate(total=models.Count('pk')).values('total')
+    return models.functions.Coalesce(
+        models.Subquery(counted, output_field=models.IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserCounter = apps.get_model('posts', 'UserCounter')
+    UserCounter.objects.bulk_create(
+        [UserCounter(user_id=pk)
+         for pk in User.objects.values_list('pk', flat=True)],
+        batch_size=500,
+    )
+    UserCounter.objects.update(
+        posts_count=count_of(Post.objects.all(), 'author', 'user'),
+        followers_count=count_of(Follow.objects.all(), 'author', 'user'),
+        following_count=count_of(Follow.objects.all(), 'user', 'user'),
+    )
+    Group.objects.update(posts_count=count_of(Post.objects.all(), 'group'))
+    Post.objects.update(
+        comments_count=count_of(Comment.objects.all(), 'post'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0015_auto_20261018_0744'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.CreateModel(
+            name='UserCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Число постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Число подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Число подписок')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='counter', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Счётчики пользователя',
+                'verbose_name_plural': 'Счётчики пользователей',
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:00
+
+from django.db import migrations
+import posts.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_auto_20261018_0748'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='renditions',
+            field=posts.fields.JSONTextField(default=dict, editable=False, verbose_name='Размеры картинки'),
+        ),
+    ]
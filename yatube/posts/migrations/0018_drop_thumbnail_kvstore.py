@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    '''Размеры картинок хранятся в Post.renditions: таблица
+    ключ-значение sorl-thumbnail больше не нужна.'''
+
+    dependencies = [
+        ('posts', '0017_post_renditions'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'DROP TABLE IF EXISTS thumbnail_kvstore',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:06
+
+from django.db import migrations, models
+import posts.storage
+
+
+def fill_media_files(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    MediaFile = apps.get_model('posts', 'MediaFile')
+    MediaFile.objects.bulk_create(
+        [MediaFile(name=row['image'], refs=row['refs'])
+         for row in Post.objects.exclude(image='').order_by().values(
+             'image').annotate(refs=models.Count('pk'))],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_drop_thumbnail_kvstore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл',
+                'verbose_name_plural': 'Файлы',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(fill_media_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# схема индекса на момент миграции: бэкенд posts.search может меняться,
+# а миграция должна создавать ту же таблицу, что и всегда
+CREATE = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS posts_search '
+    'USING fts5(text, comments, prefix=\'2 3\', '
+    'tokenize=\'unicode61 remove_diacritics 2\')'
+)
+FILL = (
+    'INSERT INTO posts_search (rowid, text, comments) '
+    'SELECT p.id, p.text, (SELECT group_concat(c.text, char(10)) '
+    'FROM posts_comment c WHERE c.post_id = p.id) '
+    'FROM posts_post p'
+)
+DROP = 'DROP TABLE IF EXISTS posts_search'
+
+
+def install(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE)
+    schema_editor.execute(FILL)
+
+
+def uninstall(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_auto_20261018_0806'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+PATH_SEGMENT = 6
+PATH_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def path_segment(pk):
+    digits = ''
+    while pk:
+        pk, digit = divmod(pk, len(PATH_DIGITS))
+        digits = PATH_DIGITS[digit] + digits
+    return digits.rjust(PATH_SEGMENT, '0')
+
+
+def fill_paths(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    comments = Comment.objects.filter(path='').only('pk')
+    Comment.objects.bulk_update(
+        [Comment(pk=comment.pk, path=path_segment(comment.pk))
+         for comment in comments.iterator()],
+        ['path'], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_comment_post_created_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comment_post_created_idx',
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.Comment', verbose_name='Ответ на'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, verbose_name='Путь в ветке'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'parent', '-created'], name='comment_thread_created_idx'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:13
+
+from django.db import migrations, models
+import posts.storage
+import posts.uploads
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_comment_threads'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', validators=[posts.uploads.validate_upload], verbose_name='Картинка'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+# пост и каждый комментарий — отдельные строки индекса:
+# rowid = id поста << 32 | id комментария, у самого поста — 0
+FILL = (
+    'INSERT INTO posts_search (rowid, text, comments) '
+    'SELECT p.id << 32, p.text, \'\' FROM posts_post p',
+    'INSERT INTO posts_search (rowid, text, comments) '
+    'SELECT c.post_id << 32 | c.id, \'\', c.text FROM posts_comment c',
+)
+FILL_GROUPED = (
+    'INSERT INTO posts_search (rowid, text, comments) '
+    'SELECT p.id, p.text, (SELECT group_concat(c.text, char(10)) '
+    'FROM posts_comment c WHERE c.post_id = p.id) '
+    'FROM posts_post p',
+)
+
+
+def refill(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        schema_editor.execute('DELETE FROM posts_search')
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_post_image_validate_upload'),
+    ]
+
+    operations = [
+        migrations.RunPython(refill(FILL), refill(FILL_GROUPED)),
+    ]
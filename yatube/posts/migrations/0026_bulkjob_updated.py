@@ -0,0 +1,19 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0025_search_comment_rows'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkjob',
+            name='updated',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Обновлена'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_popular(apps, schema_editor):
+    UserCounter = apps.get_model('posts', 'UserCounter')
+    UserCounter.objects.filter(
+        followers_count__gte=settings.POSTS_FANOUT_LIMIT).update(popular=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0026_bulkjob_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercounter',
+            name='popular',
+            field=models.BooleanField(default=False, verbose_name='Популярный автор'),
+        ),
+        migrations.RunPython(mark_popular, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,47 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .fields import JSONTextField
+from .imaging import FORMATS
+from .storage import ContentAddressedStorage
+from .uploads import validate_upload
+
+content_storage = ContentAddressedStorage()
+
+PATH_SEGMENT = 6  # символов base36 на отрезок пути комментария
+PATH_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+PATH_END = '~'  # больше любой цифры base36: верхняя граница ветки
 
 User = get_user_model()
 
 
+def path_segment(pk):
+    '''Номер комментария отрезком пути фиксированной длины: пути
+    сортируются строкой в порядке обхода ветки в глубину.'''
+    digits = ''
+    while pk:
+        pk, digit = divmod(pk, len(PATH_DIGITS))
+        digits = PATH_DIGITS[digit] + digits
+    return digits.rjust(PATH_SEGMENT, '0')
+
+
+def thread_prefix(comment):
+    '''Путь комментария как префикс путей его ответов. У корня ветки
+    путь — его id, поэтому годится и корень из bulk_create без пути.'''
+    if comment.parent_id is None:
+        return path_segment(comment.pk)
+    return comment.path
+
+
 class Group(models.Model):
     """Модель группы сообщества:
     title       - Имя,
     slug        - Адрес,
-    description - Описание.
+    description - Описание,
+    posts_count - Число постов (счётчик).
     """
     title = models.CharField(
         max_length=200,
@@ -21,6 +54,11 @@ class Group(models.Model):
     description = models.TextField(
         verbose_name='Описание группы',
     )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов',
+        default=0,
+        editable=False,
+    )
 
     def __str__(self):
         return self.title
@@ -31,12 +69,43 @@ class Group(models.Model):
         verbose_name_plural = 'Группы'
 
 
+class PostQuerySet(models.QuerySet):
+    '''Выборки постов под конкретную страницу: связанные объекты
+    подтягиваются одним JOIN, колонки, которых шаблоны не читают
+    (пароль автора, описание группы и прочее), не загружаются.
+    Число комментариев берётся из счётчика comments_count.
+    '''
+    LISTING = (
+        'text', 'pub_date', 'image', 'renditions', 'comments_count',
+        'author', 'author__username', 'author__first_name',
+        'author__last_name', 'group', 'group__title', 'group__slug',
+    )
+    DETAIL = LISTING + ('author__counter__posts_count',)
+
+    @classmethod
+    def fields(cls, shape, prefix=''):
+        '''Поля выборки для only() через связь prefix (post__).'''
+        return [prefix + field for field in shape]
+
+    def for_listing(self):
+        '''Посты для лент: главная, группа, профиль, поиск.'''
+        return self.select_related('author', 'group').only(*self.LISTING)
+
+    def for_detail(self):
+        '''Пост для своей страницы: ещё и счётчик постов автора.'''
+        return self.select_related(
+            'author__counter', 'group').only(*self.DETAIL)
+
+
 class Post(models.Model):
     """Модель запись сообщества:
     text       - Текст поста,
     pub_date   - Дата публикации,
     author     - Автор,
-    group      - Сообщество.
+    group      - Сообщество,
+    image      - Картинка,
+    renditions - Индекс готовых размеров картинки (posts.renditions),
+    comments_count - Число комментариев (счётчик).
     """
     text = models.TextField(
         verbose_name='Текст поста',
@@ -65,16 +134,69 @@ class Post(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
-        blank=True
+        storage=content_storage,
+        blank=True,
+        db_index=True,
+        validators=[validate_upload],
+    )
+    renditions = JSONTextField(
+        verbose_name='Размеры картинки',
+        default=dict,
+        editable=False,
     )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Число комментариев',
+        default=0,
+        editable=False,
+    )
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:15]
 
+    @cached_property
+    def images(self):
+        '''Готовые размеры картинки для <picture>:
+        {имя: {url, width, height, srcset, sizes, sources}}.
+        Последний формат из settings.POSTS_RENDITION_FORMATS (JPEG)
+        идёт в <img>, остальные — в <source>.
+        '''
+        storage = self.image.storage
+        images = {}
+        for name, entry in self.renditions.items():
+            if not entry.get('formats'):
+                continue
+            srcsets = [
+                (fmt, ', '.join(f'{storage.url(path)} {width}w'
+                                for path, width in files))
+                for fmt, files in entry['formats'].items()
+            ]
+            largest = list(entry['formats'].values())[-1][-1][0]
+            images[name] = {
+                'url': storage.url(largest),
+                'width': entry['width'],
+                'height': entry['height'],
+                'srcset': srcsets[-1][1],
+                'sizes': settings.POSTS_RENDITIONS.get(
+                    name, {}).get('sizes', ''),
+                'sources': [
+                    {'type': FORMATS[fmt][1], 'srcset': srcset}
+                    for fmt, srcset in srcsets[:-1]
+                ],
+            }
+        return images
+
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(fields=['author', '-pub_date'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date'],
+                         name='post_group_pub_date_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -83,7 +205,10 @@ class Comment(models.Model):
     author — автор комментария,
     text — текст комментария,
     created — дата и время публикации,
-
+    parent — комментарий, на который это ответ,
+    path — материализованный путь в ветке отрезками PATH_SEGMENT
+           символов (posts.threads): id корня, затем номера ответов
+           по уровням. Путь корня может быть пустым: его отрезок — id.
     """
     post = models.ForeignKey(
         Post,
@@ -107,14 +232,58 @@ class Comment(models.Model):
         verbose_name='Дата публикации',
         db_index=True
     )
+    parent = models.ForeignKey(
+        'self',
+        verbose_name='Ответ на',
+        blank=True,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name='replies',
+    )
+    path = models.CharField(
+        verbose_name='Путь в ветке',
+        max_length=255,
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def depth(self):
+        return max(len(self.path) // PATH_SEGMENT - 1, 0)
+
+    def save(self, *args, **kwargs):
+        '''Путь ответа известен до вставки: отрезок — следующий номер
+        после последнего ответа родителя. Блокировка строки родителя
+        не даёт двум ответам взять один номер.'''
+        if self.path or self.parent_id is None:
+            return super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get('using')):
+            parent = Comment.objects.select_for_update().only(
+                'pk', 'parent_id', 'path').get(pk=self.parent_id)
+            prefix = thread_prefix(parent)
+            # последний путь ветки начинается с отрезка последнего ответа
+            last = Comment.objects.filter(
+                path__gt=prefix, path__lt=prefix + PATH_END,
+            ).order_by('-path').values_list('path', flat=True).first()
+            number = 1
+            if last:
+                segment = last[len(prefix):len(prefix) + PATH_SEGMENT]
+                number = int(segment, len(PATH_DIGITS)) + 1
+            self.path = prefix + path_segment(number)
+            return super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-created']
         verbose_name = 'Коммент'
         verbose_name_plural = 'Комменты'
+        indexes = [
+            models.Index(fields=['post', 'parent', '-created'],
+                         name='comment_thread_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -143,3 +312,179 @@ class Follow(models.Model):
                 fields=['author', 'user'],
                 name='unique_follow')
         ]
+
+
+class UserCounter(models.Model):
+    """Модель счётчиков пользователя:
+    user            — пользователь,
+    posts_count     — число постов пользователя,
+    followers_count — число подписчиков,
+    following_count — число авторов, на которых подписан пользователь,
+    popular         — популярный автор: посты не рассылаются по лентам,
+                      а подмешиваются при чтении (posts.timeline).
+    """
+    user = models.OneToOneField(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='counter',
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков',
+        default=0,
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Число подписок',
+        default=0,
+    )
+    popular = models.BooleanField(
+        verbose_name='Популярный автор',
+        default=False,
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+
+class Timeline(models.Model):
+    """Модель записи ленты подписок пользователя:
+    user     — владелец ленты,
+    post     — пост автора, на которого подписан пользователь,
+    pub_date — дата публикации поста (копия для чтения ленты по индексу).
+    """
+    user = models.ForeignKey(
+        User,
+        verbose_name='Владелец ленты',
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        verbose_name='Пост',
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_post')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+
+class MediaFile(models.Model):
+    """Модель файла в хранилище с адресацией по содержимому:
+    name — имя файла (posts/ab/cd/<sha256>.<расширение>),
+    refs — число постов, которые на него ссылаются.
+    """
+    name = models.CharField(
+        verbose_name='Файл',
+        max_length=255,
+        unique=True,
+    )
+    refs = models.PositiveIntegerField(
+        verbose_name='Число ссылок',
+        default=0,
+    )
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+
+class BulkJob(models.Model):
+    """Модель фоновой массовой операции админки (posts.bulk):
+    action   — операция,
+    params   — параметры операции (отбор объектов и прочее),
+    user     — кто запустил,
+    status   — состояние,
+    total    — число объектов,
+    done     — сколько уже обработано,
+    error    — текст ошибки,
+    created  — время запуска,
+    updated  — когда задача последний раз продвинулась,
+    finished — время окончания.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+    action = models.CharField(
+        verbose_name='Операция',
+        max_length=50,
+    )
+    params = JSONTextField(
+        verbose_name='Параметры',
+        default=dict,
+    )
+    user = models.ForeignKey(
+        User,
+        verbose_name='Кто запустил',
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+    )
+    status = models.CharField(
+        verbose_name='Состояние',
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING,
+    )
+    total = models.PositiveIntegerField(
+        verbose_name='Всего',
+        default=0,
+    )
+    done = models.PositiveIntegerField(
+        verbose_name='Обработано',
+        default=0,
+    )
+    error = models.TextField(
+        verbose_name='Ошибка',
+        blank=True,
+    )
+    created = models.DateTimeField(
+        verbose_name='Запущена',
+        auto_now_add=True,
+    )
+    updated = models.DateTimeField(
+        verbose_name='Обновлена',
+        default=timezone.now,
+    )
+    finished = models.DateTimeField(
+        verbose_name='Закончена',
+        null=True,
+        blank=True,
+    )
+
+    def __str__(self):
+        return f'{self.action} #{self.pk}'
+
+    class Meta:
+        ordering = ['-created']
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
@@ -0,0 +1,147 @@
+import hashlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.http import parse_http_date_safe
+from django.views.decorators.http import condition
+
+from . import versions
+from .utils import author_id_by_username, group_id_by_slug, post_author_id
+
+PAGE_KEY = 'posts:page:{}:{}'
+
+
+def cache_for_anonymous(scopes_for):
+    '''Страница целиком кэшируется для анонимных читателей.
+    scopes_for получает аргументы из URL и возвращает области
+    (posts.versions), при смене версии которых страница устаревает.
+    '''
+    def decorator(view_func):
+        view_func.page_scopes = scopes_for
+        return view_func
+    return decorator
+
+
+def index_scopes():
+    return [versions.scope('index')]
+
+
+def group_scopes(slug):
+    return [versions.scope('group', group_id_by_slug(slug))]
+
+
+def profile_scopes(username):
+    return [versions.scope('profile', author_id_by_username(username))]
+
+
+def detail_scopes(post_id):
+    return [
+        versions.scope('post', post_id),
+        versions.scope('profile', post_author_id(post_id)),
+    ]
+
+
+def thread_scopes(post_id, comment_id):
+    return detail_scopes(post_id)
+
+
+def conditional_page(scopes_for):
+    '''Условный GET: 304 без рендера страницы, без запросов к базе.
+    ETag собирается из версий областей страницы, id пользователя
+    (шапка и кнопки у каждого свои) и, у вошедших, хэша CSRF-токена:
+    после повторного входа токен в формах новый, и старая копия
+    страницы не подходит.
+    Last-Modified — время последней смены версий областей
+    (posts.versions.last_modified); по RFC 7232 при If-None-Match
+    дата не сравнивается, поэтому и не вычисляется.
+    '''
+    def etag(request, **kwargs):
+        try:
+            current = versions.get_versions(*scopes_for(**kwargs))
+        except Http404:
+            return None
+        csrf = ''
+        if request.user.is_authenticated:
+            # формы (и токен в них) есть только у вошедших: токен
+            # заводится сразу, чтобы ETag совпал со следующим запросом
+            get_token(request)
+            csrf = hashlib.md5(
+                request.META['CSRF_COOKIE'].encode()).hexdigest()[:8]
+        return '{}-{}-{}'.format(
+            request.user.pk or 0, '.'.join(map(str, current)), csrf)
+
+    def last_modified(request, **kwargs):
+        if 'HTTP_IF_NONE_MATCH' in request.META:
+            return None
+        try:
+            modified = versions.last_modified(*scopes_for(**kwargs))
+        except Http404:
+            return None
+        return datetime.fromtimestamp(modified, timezone.utc)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def page_key(request, scopes):
+    '''Ключ страницы: путь, строка запроса и версии её областей.'''
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    current = '.'.join(map(str, versions.get_versions(*scopes)))
+    return PAGE_KEY.format(path, current)
+
+
+class PageCacheMiddleware(MiddlewareMixin):
+    '''Готовые ответы страниц для анонимных читателей.
+    Авторизованные пользователи видят свою шапку и переключатель лент,
+    поэтому их запросы идут мимо кэша. Смена контента меняет версию
+    области и тем самым ключ страницы; PAGE_CACHE_TIMEOUT ограничивает
+    жизнь ответа для изменений, не меняющих версий (например,
+    переименования группы на странице поста).
+    '''
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        scopes_for = getattr(view_func, 'page_scopes', None)
+        if (scopes_for is None or request.method != 'GET'
+                or request.user.is_authenticated):
+            return None
+        try:
+            key = page_key(request, scopes_for(**view_kwargs))
+        except Http404:
+            return None
+        cached = cache.get(key)
+        if cached is None:
+            request._page_cache_key = key
+            return None
+        status, content_type, content, etag, modified = cached
+        response = HttpResponse(
+            content, status=status, content_type=content_type)
+        response['X-Page-Cache'] = 'hit'
+        if etag:
+            response['ETag'] = etag
+        if modified:
+            response['Last-Modified'] = modified
+        return get_conditional_response(
+            request, etag=etag,
+            last_modified=parse_http_date_safe(modified or ''),
+            response=response,
+        )
+
+    def process_response(self, request, response):
+        key = getattr(request, '_page_cache_key', None)
+        if (key is None or response.status_code != 200
+                or response.streaming or response.cookies
+                or request.META.get('CSRF_COOKIE_USED')):
+            return response
+        cache.set(
+            key,
+            (response.status_code, response['Content-Type'],
+             response.content, response.get('ETag'),
+             response.get('Last-Modified')),
+            settings.PAGE_CACHE_TIMEOUT,
+        )
+        response['X-Page-Cache'] = 'miss'
+        return response
@@ -0,0 +1,181 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from core import metrics
+
+from . import imaging, media, versions
+from .media import RENDITION_DIR
+from .models import Post
+from .storage import content_key
+
+RENDITION_PATH = RENDITION_DIR + '/{name}-{width}.{ext}'
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def executor():
+    '''Пул процессов для нарезки картинок, один на процесс сервера.'''
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.POSTS_RENDITION_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _executor
+
+
+def widths(spec):
+    '''Ширины размера по возрастанию: не больше основной.'''
+    width = spec['size'][0]
+    return sorted({w for w in spec.get('widths', ()) if w < width} | {width})
+
+
+def plan(post):
+    '''Файлы размеров картинки: {ключ: путь в хранилище} и задания
+    для воркера. Ключ — (имя, формат, ширина). Каталог размеров
+    назван по хэшу содержимого: одинаковые картинки разных постов
+    делят размеры, а новая картинка не совпадёт по адресу со старой
+    в кэше браузера. Вместо хэша в путях стоит imaging.KEY: воркер
+    может уменьшить оригинал, и хэш станет другим.
+    '''
+    storage = post.image.storage
+    formats = imaging.available(settings.POSTS_RENDITION_FORMATS)
+    names, jobs = {}, []
+    for name, spec in settings.POSTS_RENDITIONS.items():
+        base_width, base_height = spec['size']
+        for width in widths(spec):
+            height = round(base_height * width / base_width)
+            for fmt in formats:
+                job = (name, fmt, width)
+                path = RENDITION_PATH.format(
+                    key=imaging.KEY, name=name, width=width,
+                    ext=imaging.FORMATS[fmt][0])
+                names[job] = path
+                jobs.append((job, storage.path(path), width, height, fmt))
+    return names, jobs
+
+
+def build_index(names, done):
+    '''Индекс размеров для Post.renditions:
+    {имя: {width, height, formats: {формат: [[путь, ширина], ...]}}},
+    форматы в порядке settings.POSTS_RENDITION_FORMATS,
+    ширины по возрастанию.
+    '''
+    index = {}
+    order = list(settings.POSTS_RENDITION_FORMATS)
+    for key in sorted(done, key=lambda key: (
+            key[0], order.index(key[1]), key[2])):
+        name, fmt, width = key
+        size = done[key]
+        entry = index.setdefault(name, {'formats': {}})
+        entry['formats'].setdefault(fmt, []).append([names[key], size[0]])
+        entry['width'], entry['height'] = size
+    return index
+
+
+def is_complete(post):
+    '''Все ли настроенные размеры и форматы картинки готовы.'''
+    names, _ = plan(post)
+    ready = {
+        (name, fmt, width)
+        for name, entry in post.renditions.items()
+        for fmt, files in entry.get('formats', {}).items()
+        for _, width in files
+    }
+    return set(names) <= ready
+
+
+def store(post_id, image, names, result):
+    '''Запись готовых размеров в пост, если картинку ещё не сменили.
+    Уменьшенный оригинал заменяет прежний у всех постов с ним.'''
+    downscaled, done = result
+    key = content_key(image)
+    if downscaled is not None:
+        key = downscaled[1]
+    names = {job: path.replace(imaging.KEY, key)
+             for job, path in names.items()}
+    index = build_index(names, done)
+    post = Post.objects.filter(pk=post_id, image=image).values(
+        'author_id', 'group_id').first()
+    if post is None:
+        if downscaled is not None:
+            os.remove(downscaled[0])
+        return
+    if downscaled is not None:
+        name = media.replace(image, *downscaled, index)
+        scopes = set()
+        for pk, author_id, group_id in Post.objects.filter(
+                image=name).values_list('pk', 'author_id', 'group_id'):
+            scopes.update(versions.post_scopes(
+                author_id, group_id, post_id=pk))
+        versions.bump(*scopes)
+        return
+    Post.objects.filter(pk=post_id, image=image).update(renditions=index)
+    versions.bump(*versions.post_scopes(
+        post['author_id'], post['group_id'], post_id=post_id))
+
+
+def share(post):
+    '''Та же картинка у другого поста уже нарезана: размеры общие.'''
+    for donor in Post.objects.filter(image=post.image.name).exclude(
+            pk=post.pk).only('pk', 'image', 'renditions')[:5]:
+        if donor.renditions and is_complete(donor):
+            Post.objects.filter(pk=post.pk).update(
+                renditions=donor.renditions)
+            post.renditions = donor.renditions
+            versions.bump(*versions.post_scopes(
+                post.author_id, post.group_id, post_id=post.pk))
+            return True
+    return False
+
+
+def _timed(submitted, future):
+    metrics.THUMBNAIL_SECONDS.observe(perf_counter() - submitted, 'worker')
+
+
+def _finished(post_id, image, names, future):
+    try:
+        store(post_id, image, names, future.result())
+    except Exception:
+        logger.exception('Не удалось нарезать картинку поста %s', post_id)
+    finally:
+        # колбэк выполняется в служебном потоке пула
+        connection.close()
+
+
+def schedule(post):
+    '''Уменьшение оригинала и нарезка картинки поста в пуле воркеров
+    после коммита.
+    При POSTS_RENDITION_WORKERS = 0 нарезка идёт сразу, в том же процессе.
+    '''
+    if not post.image:
+        return
+    if share(post):
+        return
+    names, jobs = plan(post)
+    source = post.image.path
+    args = (post.pk, post.image.name, names)
+    task = (source, settings.POSTS_IMAGE_MAX_SIDE, jobs,
+            content_key(post.image.name))
+    if not settings.POSTS_RENDITION_WORKERS:
+        started = perf_counter()
+        result = imaging.process(*task)
+        metrics.THUMBNAIL_SECONDS.observe(perf_counter() - started, 'inline')
+        store(*args, result)
+        return
+
+    def submit():
+        future = executor().submit(imaging.process, *task)
+        future.add_done_callback(partial(_timed, perf_counter()))
+        future.add_done_callback(partial(_finished, *args))
+
+    transaction.on_commit(submit)
@@ -0,0 +1,257 @@
+import re
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+from django.utils.module_loading import import_string
+
+from .models import Comment, Post
+
+WORD = re.compile(r'\w+')
+MAX_WORDS = 10
+
+
+def words(query):
+    '''Слова запроса без операторов и кавычек: ввод пользователя
+    не попадает в синтаксис MATCH как есть.'''
+    return WORD.findall(query.lower())[:MAX_WORDS]
+
+
+class BaseBackend(ABC):
+    '''Поисковый бэкенд: обновление индекса и выдача id постов
+    по релевантности. Схему индекса создают миграции. Бэкенд
+    без своего индекса оставляет методы обновления пустыми.
+    '''
+
+    def rebuild(self):
+        '''Переиндексация всех постов и комментариев.'''
+
+    def update(self, post_id):
+        '''Текст поста изменился.'''
+
+    def remove(self, post_id):
+        '''Пост удалён вместе с комментариями.'''
+
+    def update_comment(self, post_id, comment_id):
+        '''Комментарий добавлен или изменён.'''
+
+    def remove_comments(self, comments):
+        '''Комментарии удалены: пары (id поста, id комментария).'''
+
+    def remove_many(self, post_ids):
+        for post_id in post_ids:
+            self.remove(post_id)
+
+    @abstractmethod
+    def count(self, query):
+        '''Число постов, подходящих под запрос.'''
+
+    @abstractmethod
+    def ids(self, query, offset, limit):
+        '''id постов страницы выдачи, самые релевантные первыми.'''
+
+    @abstractmethod
+    def filter(self, queryset, query, column=None, field='pk'):
+        '''Отбор queryset по индексу: field — поле с id поста,
+        column — искать только в тексте (text) или комментариях.'''
+
+
+class SimpleBackend(BaseBackend):
+    '''Поиск без индекса через LIKE: для баз без полнотекстового поиска.
+    Каждый запрос — полный просмотр таблиц. Как и в FTS5, все слова
+    ищутся в тексте поста или в одном комментарии; совпадения в тексте
+    выше, дальше — по дате.'''
+
+    def words_in(self, query):
+        condition = Q()
+        for word in words(query):
+            condition &= Q(text__icontains=word)
+        return condition
+
+    def matching(self, query, column=None):
+        if not words(query):
+            return Post.objects.none()
+        in_text = self.words_in(query)
+        in_comments = Q(pk__in=Comment.objects.filter(
+            self.words_in(query)).values('post_id'))
+        condition = {'text': in_text, 'comments': in_comments}.get(
+            column, in_text | in_comments)
+        return Post.objects.filter(condition)
+
+    def queryset(self, query):
+        if not words(query):
+            return Post.objects.none()
+        return self.matching(query).annotate(
+            in_comments=Case(When(self.words_in(query), then=0), default=1,
+                             output_field=IntegerField()),
+        ).order_by('in_comments', '-pub_date', '-pk')
+
+    def count(self, query):
+        return self.matching(query).count()
+
+    def ids(self, query, offset, limit):
+        return list(self.queryset(query).values_list(
+            'pk', flat=True)[offset:offset + limit])
+
+    def filter(self, queryset, query, column=None, field='pk'):
+        posts = self.matching(query, column)
+        return queryset.filter(**{f'{field}__in': posts.values('pk')})
+
+
+class Fts5Backend(BaseBackend):
+    '''Инвертированный индекс SQLite FTS5 (таблица из миграций 0020
+    и 0025). Слова запроса ищутся по префиксу (падежные окончания),
+    выдача — по bm25, где совпадение в тексте поста весит больше,
+    чем в комментариях. Запрос читает только списки документов своих
+    слов, поэтому время поиска почти не зависит от числа постов.
+
+    Пост и каждый его комментарий — отдельные строки индекса:
+    rowid = id поста << SHIFT | id комментария, у самого поста — 0.
+    Новый комментарий добавляет одну строку, а строки поста идут
+    одним диапазоном rowid. Все слова запроса ищутся в одной строке:
+    в тексте поста или в одном комментарии.
+    '''
+    table = 'posts_search'
+    weights = (10.0, 1.0)  # текст поста, комментарии
+    SHIFT = 32  # id комментариев меньше 2 ** 32
+    posts = (
+        f'SELECT p.id << {SHIFT}, p.text, \'\' FROM posts_post p'
+    )
+    comments = (
+        f'SELECT c.post_id << {SHIFT} | c.id, \'\', c.text '
+        'FROM posts_comment c'
+    )
+
+    def execute(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def insert(self, select, params=()):
+        self.execute(
+            f'INSERT INTO {self.table} (rowid, text, comments) {select}',
+            params)
+
+    def rebuild(self):
+        self.execute(f'DELETE FROM {self.table}')
+        self.insert(self.posts)
+        self.insert(self.comments)
+
+    def update(self, post_id):
+        self.execute(f'DELETE FROM {self.table} WHERE rowid = %s',
+                     [post_id << self.SHIFT])
+        self.insert(f'{self.posts} WHERE p.id = %s', [post_id])
+
+    def remove(self, post_id):
+        self.remove_many([post_id])
+
+    def update_comment(self, post_id, comment_id):
+        self.execute(f'DELETE FROM {self.table} WHERE rowid = %s',
+                     [post_id << self.SHIFT | comment_id])
+        self.insert(f'{self.comments} WHERE c.id = %s', [comment_id])
+
+    def remove_comments(self, comments):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE rowid = %s',
+                [[post_id << self.SHIFT | comment_id]
+                 for post_id, comment_id in comments])
+
+    def remove_many(self, post_ids):
+        # диапазон rowid читается по индексу, без просмотра таблицы
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} '
+                'WHERE rowid >= %s AND rowid < %s',
+                [[post_id << self.SHIFT, (post_id + 1) << self.SHIFT]
+                 for post_id in post_ids])
+
+    def match(self, query, column=None):
+        match = ' '.join(f'"{word}"*' for word in words(query))
+        return f'{column} : ({match})' if column else match
+
+    def count(self, query):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(DISTINCT rowid >> {self.SHIFT}) '
+                f'FROM {self.table} WHERE {self.table} MATCH %s',
+                [self.match(query)]
+            )
+            return cursor.fetchone()[0]
+
+    def ids(self, query, offset, limit):
+        # bm25 нельзя считать внутри агрегата: LIMIT -1 не даёт SQLite
+        # развернуть подзапрос, пост получает оценку лучшей строки
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT post FROM (SELECT rowid >> {self.SHIFT} AS post, '
+                f'bm25({self.table}, %s, %s) AS score FROM {self.table} '
+                f'WHERE {self.table} MATCH %s LIMIT -1) '
+                'GROUP BY post ORDER BY min(score) LIMIT %s OFFSET %s',
+                [*self.weights, self.match(query), limit, offset]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter(self, queryset, query, column=None, field='pk'):
+        if not words(query):
+            return queryset.none()
+        # RawSQL в __in попадает в скобки второй раз: IN ((...)) читается
+        # как одно скалярное значение, поэтому условие задаётся через extra
+        opts = queryset.model._meta
+        target = opts.pk if field == 'pk' else opts.get_field(field)
+        return queryset.extra(
+            where=[f'{opts.db_table}.{target.column} IN '
+                   f'(SELECT rowid >> {self.SHIFT} FROM {self.table} '
+                   f'WHERE {self.table} MATCH %s)'],
+            params=[self.match(query, column)],
+        )
+
+
+BACKENDS = {
+    'sqlite': Fts5Backend,
+}
+
+_backend = None
+
+
+def backend_for(connection):
+    path = getattr(settings, 'POSTS_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return BACKENDS.get(connection.vendor, SimpleBackend)()
+
+
+def get_backend():
+    '''Бэкенд из settings.POSTS_SEARCH_BACKEND или по типу базы.'''
+    global _backend
+    if _backend is None:
+        _backend = backend_for(connection)
+    return _backend
+
+
+class SearchResults:
+    '''Выдача поиска для Paginator: число совпадений и срезы
+    считаются в индексе, из базы читаются только посты страницы.'''
+
+    def __init__(self, query, queryset=None):
+        self.query = query
+        self.queryset = queryset if queryset is not None else Post.objects
+        self.backend = get_backend()
+
+    def count(self):
+        if not words(self.query):
+            return 0
+        return self.backend.count(self.query)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        offset = index.start or 0
+        if not words(self.query):
+            return []
+        ids = self.backend.ids(self.query, offset, index.stop - offset)
+        posts = self.queryset.in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
@@ -0,0 +1,124 @@
+'''Генерация синтетических данных для команды seed.
+Модуль не импортирует Django: генераторы запускаются в процессах-воркерах
+через spawn и возвращают строки кортежами, в базу их пишет команда.
+
+Каждая часть данных получает свой генератор случайных чисел от
+(seed, вид, начало части), поэтому результат не зависит от числа
+воркеров и порядка, в котором они закончат работу.
+'''
+import random
+from bisect import bisect
+from itertools import accumulate
+
+from faker import Faker
+
+LOCALE = 'ru_RU'
+
+_faker = None
+
+
+def faker(seed):
+    '''Faker процесса, заново засеянный для очередной части.'''
+    global _faker
+    if _faker is None:
+        _faker = Faker(LOCALE)
+    _faker.seed_instance(seed)
+    return _faker
+
+
+def rng_for(seed, kind, start):
+    key = f'{seed}:{kind}:{start}'
+    return random.Random(key), faker(key)
+
+
+def zipf_weights(count, exponent):
+    '''Накопленные веса закона Ципфа для рангов 0..count-1:
+    вес ранга r пропорционален 1 / (r + 1) ** exponent.'''
+    return list(accumulate(1 / (rank + 1) ** exponent
+                           for rank in range(count)))
+
+
+def zipf_expected(count, exponent, total):
+    '''Ожидаемые значения рангов 0..count-1, в сумме total.'''
+    weights = [1 / (rank + 1) ** exponent for rank in range(count)]
+    scale = total / (sum(weights) or 1)
+    return [weight * scale for weight in weights]
+
+
+def pick(rng, cum_weights):
+    '''Ранг по накопленным весам.'''
+    return bisect(cum_weights, rng.random() * cum_weights[-1])
+
+
+def users(seed, start, stop):
+    '''[(имя, фамилия), ...] пользователей start..stop-1.'''
+    rng, fake = rng_for(seed, 'users', start)
+    return [(fake.first_name(), fake.last_name())
+            for _ in range(start, stop)]
+
+
+def posts(seed, start, stop, authors, groups, group_share, images,
+          image_share, first_date, step):
+    '''[(автор, группа или None, текст, картинка, дата), ...] постов
+    start..stop-1. authors и groups — накопленные веса Ципфа, даты
+    растут вместе с номером поста.'''
+    rng, fake = rng_for(seed, 'posts', start)
+    rows = []
+    for number in range(start, stop):
+        group = pick(rng, groups) if rng.random() < group_share else None
+        image = (images[rng.randrange(len(images))]
+                 if images and rng.random() < image_share else '')
+        rows.append((
+            pick(rng, authors),
+            group,
+            fake.paragraph(nb_sentences=rng.randint(1, 6)),
+            image,
+            first_date + (number + rng.random()) * step,
+        ))
+    return rows
+
+
+def follows(seed, start, stop, authors, average):
+    '''[(подписчик, автор), ...] пользователей start..stop-1: число
+    подписок пользователя равномерно от 0 до 2 * average, авторы
+    выбираются по весам Ципфа, поэтому и подписчики распределены
+    по закону Ципфа.'''
+    rng, _ = rng_for(seed, 'follows', start)
+    rows = []
+    most = min(2 * average, len(authors) - 1)
+    for user in range(start, stop):
+        wanted, chosen = rng.randint(0, most), set()
+        # популярные авторы выпадают часто: попыток с запасом
+        for _ in range(wanted * 4):
+            if len(chosen) >= wanted:
+                break
+            author = pick(rng, authors)
+            if author != user:
+                chosen.add(author)
+        rows.extend((user, author) for author in sorted(chosen))
+    return rows
+
+
+def comments(seed, start, expected, dates, users_count, reply_share,
+             max_depth, last_date):
+    '''Комментарии постов start, start+1, ...: expected — ожидаемое
+    число комментариев каждого поста (по его рангу Ципфа), dates — даты
+    постов. Строки (пост, автор, текст, дата, родитель), где родитель —
+    номер строки в этом же списке или None.'''
+    rng, fake = rng_for(seed, 'comments', start)
+    rows = []
+    for offset, (mean, date) in enumerate(zip(expected, dates)):
+        count = int(mean) + (rng.random() < mean % 1)
+        first, depths = len(rows), []
+        for number in range(count):
+            date = min(last_date, date + rng.expovariate(1 / 3600))
+            parent, depth = None, 0
+            if number and rng.random() < reply_share:
+                local = rng.randrange(number)
+                if depths[local] < max_depth:
+                    parent, depth = first + local, depths[local] + 1
+            depths.append(depth)
+            rows.append((start + offset, rng.randrange(users_count),
+                         fake.sentence(nb_words=rng.randint(3, 20)),
+                         date, parent))
+    return rows
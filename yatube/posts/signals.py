@@ -0,0 +1,208 @@
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import DEFERRED
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from . import counters, media, search, timeline, versions
+from .utils import AUTHOR_KEY, GROUP_KEY, POST_AUTHOR_KEY
+from .models import Comment, Follow, Group, Post, UserCounter
+
+User = get_user_model()
+
+# поля пользователя, которые показываются рядом с его постами
+USER_SHOWN_FIELDS = ('username', 'first_name', 'last_name')
+
+# id постов, которые удаляются в этом потоке: их комментарии уходят
+# каскадом, и счётчики, версии и поиск поста обновляет post_forget
+_deleting = threading.local()
+
+
+def deleting_posts():
+    if not hasattr(_deleting, 'ids'):
+        _deleting.ids = set()
+    return _deleting.ids
+
+
+def shown_fields(instance, fields):
+    return tuple(instance.__dict__.get(field, DEFERRED) for field in fields)
+
+
+@receiver(post_save, sender=User)
+def user_counter(sender, instance, created, **kwargs):
+    '''Новому пользователю заводятся счётчики.'''
+    if created:
+        UserCounter.objects.get_or_create(user=instance)
+
+
+@receiver(post_init, sender=User)
+def user_remember_name(sender, instance, **kwargs):
+    '''Имя пользователя при загрузке: оно закэшировано во фрагментах
+    с его постами. Отложенные поля не загружаются.'''
+    instance._loaded_name = shown_fields(instance, USER_SHOWN_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def user_renamed(sender, instance, created, **kwargs):
+    '''Смена имени пользователя сбрасывает главную, его профиль
+    (и страницы постов) и группы с его постами.'''
+    loaded = instance._loaded_name
+    instance._loaded_name = shown_fields(instance, USER_SHOWN_FIELDS)
+    if created or loaded == instance._loaded_name:
+        return
+    if loaded[0] not in (DEFERRED, instance.username):
+        cache.delete(AUTHOR_KEY.format(loaded[0]))
+    groups = instance.posts.exclude(group=None).order_by().values_list(
+        'group_id', flat=True).distinct()
+    versions.bump(
+        versions.scope('index'), versions.scope('profile', instance.pk),
+        *(versions.scope('group', group_id) for group_id in groups))
+
+
+@receiver(post_init, sender=Post)
+def post_remember_loaded(sender, instance, **kwargs):
+    '''Группа и картинка поста при загрузке: нужны для переноса
+    счётчиков, ссылок на файл и сброса кэша прежней группы.
+    Отложенные (only/defer) поля не загружаются.'''
+    instance._loaded_group_id = instance.__dict__.get('group_id', DEFERRED)
+    image = instance.__dict__.get('image', DEFERRED)
+    instance._loaded_image = getattr(image, 'name', image)
+
+
+@receiver(post_save, sender=Post)
+def post_fan_out(sender, instance, created, **kwargs):
+    '''Новый пост попадает в ленты подписчиков автора.'''
+    loaded_group_id = instance._loaded_group_id
+    loaded_image = instance._loaded_image
+    if created:
+        counters.bump_user(instance.author_id, 'posts_count', 1)
+        counters.bump_group(instance.group_id, 1)
+        timeline.push_post(instance)
+        media.acquire(instance.image.name)
+    else:
+        if loaded_group_id not in (DEFERRED, instance.group_id):
+            counters.bump_group(loaded_group_id, -1)
+            counters.bump_group(instance.group_id, 1)
+        if loaded_image not in (DEFERRED, instance.image.name):
+            media.acquire(instance.image.name)
+            media.release(loaded_image, instance.image.storage)
+    if loaded_group_id is DEFERRED:
+        loaded_group_id = None
+    instance._loaded_group_id = instance.group_id
+    instance._loaded_image = instance.image.name
+    search.get_backend().update(instance.pk)
+    versions.bump(*versions.post_scopes(
+        instance.author_id, instance.group_id, loaded_group_id,
+        post_id=instance.pk))
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_forget(sender, instance, **kwargs):
+    '''Удалённый пост убирается из кэша последних постов автора.'''
+    deleting_posts().discard(instance.pk)
+    counters.bump_user(instance.author_id, 'posts_count', -1)
+    counters.bump_group(instance.group_id, -1)
+    timeline.forget_post(instance)
+    media.release(instance.image.name, instance.image.storage)
+    cache.delete(POST_AUTHOR_KEY.format(instance.pk))
+    search.get_backend().remove(instance.pk)
+    versions.bump(*versions.post_scopes(
+        instance.author_id, instance.group_id, post_id=instance.pk))
+
+
+@receiver(post_save, sender=Comment)
+def comment_count(sender, instance, created, **kwargs):
+    search.get_backend().update_comment(instance.post_id, instance.pk)
+    if created:
+        counters.bump_post(instance.post_id, 1)
+        post = instance.post
+        versions.bump(*versions.post_scopes(
+            post.author_id, post.group_id, post_id=post.pk))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_uncount(sender, instance, **kwargs):
+    if instance.post_id in deleting_posts():
+        return
+    counters.bump_post(instance.post_id, -1)
+    search.get_backend().remove_comments([(instance.post_id, instance.pk)])
+    post = instance.post
+    versions.bump(*versions.post_scopes(
+        post.author_id, post.group_id, post_id=post.pk))
+
+
+@receiver(post_init, sender=Group)
+def group_remember_slug(sender, instance, **kwargs):
+    '''Slug и название группы при загрузке: кэш объекта лежит под прежним
+    ключом, а ссылка с названием — во фрагментах постов группы.'''
+    instance._loaded_shown = shown_fields(instance, ('slug', 'title'))
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    # посты теряют группу через UPDATE без сигналов: их области
+    # собираются до удаления
+    instance._post_scopes = group_post_scopes(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Group)
+def group_changed(sender, instance, created=False, **kwargs):
+    '''Изменение группы сбрасывает фрагменты с её постами. Новые slug
+    или название сбрасывают и профили авторов, и страницы постов группы.'''
+    loaded = instance._loaded_shown
+    instance._loaded_shown = shown_fields(instance, ('slug', 'title'))
+    cache.delete_many([
+        GROUP_KEY.format(slug) for slug in {instance.slug, loaded[0]}
+        if slug is not DEFERRED
+    ])
+    versions.bump(
+        versions.scope('index'), versions.scope('group', instance.pk))
+    post_scopes = getattr(instance, '_post_scopes', None)
+    if post_scopes is None and not created and (
+            loaded != instance._loaded_shown):
+        post_scopes = group_post_scopes(instance.pk)
+    if post_scopes:
+        versions.reset(*post_scopes)
+
+
+def group_post_scopes(group_id):
+    '''Профили авторов и страницы постов группы.'''
+    posts = Post.objects.filter(group_id=group_id).order_by()
+    authors = posts.values_list('author_id', flat=True).distinct()
+    return [versions.scope('profile', author_id) for author_id in authors] + [
+        versions.scope('post', pk)
+        for pk in posts.values_list('pk', flat=True).iterator()]
+
+
+@receiver(post_save, sender=Follow)
+def follow_backfill(sender, instance, created, **kwargs):
+    '''Подписка наполняет ленту последними постами автора. Автор,
+    набравший порог популярности, перестаёт рассылать посты.'''
+    if created:
+        followers = counters.bump_user_read(
+            instance.author_id, 'followers_count', 1)
+        if followers is not None and (
+                followers >= settings.POSTS_FANOUT_LIMIT):
+            timeline.author_promoted(instance.author_id)
+        counters.bump_user(instance.user_id, 'following_count', 1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        versions.bump(versions.scope('profile', instance.author_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_cleanup(sender, instance, **kwargs):
+    '''Отписка убирает посты автора из ленты. Автора, опустившегося
+    ниже порога популярности, понижает команда demote_authors.'''
+    counters.bump_user(instance.author_id, 'followers_count', -1)
+    counters.bump_user(instance.user_id, 'following_count', -1)
+    timeline.drop_author(instance.user_id, instance.author_id)
+    versions.bump(versions.scope('profile', instance.author_id))
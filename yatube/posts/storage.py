@@ -0,0 +1,57 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+HASHED_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+
+def file_digest(content):
+    '''sha256 содержимого файла, файл читается по частям.'''
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def content_key(name):
+    '''Ключ содержимого картинки: sha256 из имени файла в хранилище,
+    для загруженных до дедупликации — хэш имени.'''
+    stem = os.path.splitext(posixpath.basename(name))[0]
+    if HASHED_NAME.match(stem):
+        return stem
+    return hashlib.md5(name.encode()).hexdigest()
+
+
+def hashed_name(name, digest):
+    '''Имя файла в хранилище по хэшу содержимого:
+    {каталог}/ab/cd/{sha256}.{расширение}. Каталог и расширение
+    берутся из name, в том числе из уже хэшированного имени.'''
+    directory, filename = posixpath.split(name)
+    if HASHED_NAME.match(os.path.splitext(filename)[0]):
+        directory = posixpath.dirname(posixpath.dirname(directory))
+    extension = os.path.splitext(filename)[1].lower()
+    return posixpath.join(
+        directory, digest[:2], digest[2:4], digest + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    '''Файл хранится один раз под хэшем содержимого:
+    {каталог}/ab/cd/{sha256}.{расширение}. Повторная загрузка той же
+    картинки не пишет на диск ничего. Файл под этим именем
+    не переписывается: уменьшенный оригинал ложится под свой хэш
+    (posts.media.replace).
+    '''
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = hashed_name(name, file_digest(content))
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
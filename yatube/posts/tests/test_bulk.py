@@ -0,0 +1,164 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import bulk
+from posts.models import (BulkJob, Comment, Follow, Group, Post, Timeline,
+                          UserCounter)
+from posts.search import SearchResults
+from posts.versions import get_version
+
+User = get_user_model()
+
+
+class BulkTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        cls.spammer = User.objects.create_user(username='spammer')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.spam = Group.objects.create(
+            title='Спам', slug='spam', description='Описание')
+
+    def setUp(self):
+        cache.clear()
+        self.admin_client = Client()
+        self.admin_client.force_login(self.admin)
+        Follow.objects.create(user=self.reader, author=self.spammer)
+        self.posts = [
+            Post.objects.create(
+                author=self.spammer, group=self.group, text=f'Реклама {i}')
+            for i in range(6)
+        ]
+        self.comments = [
+            Comment.objects.create(
+                post=self.posts[0], author=self.spammer, text='Купи слона')
+            for _ in range(3)
+        ]
+
+    def action(self, model, action, objects, **data):
+        return self.admin_client.post(
+            reverse(f'admin:posts_{model}_changelist'),
+            {'action': action, '_selected_action': [o.pk for o in objects],
+             **data},
+        )
+
+    def test_move_to_group(self):
+        """Перенос в группу обновляет счётчики групп и версии кэша."""
+        version = get_version('group', self.group.pk)
+        self.action('post', 'move_to_group', self.posts[:4],
+                    group=self.spam.pk)
+        self.group.refresh_from_db()
+        self.spam.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 2)
+        self.assertEqual(self.spam.posts_count, 4)
+        self.assertEqual(self.spam.posts.count(), 4)
+        self.assertNotEqual(get_version('group', self.group.pk), version)
+
+    def test_move_to_invalid_group(self):
+        """Нечисловая или несуществующая группа не запускает перенос."""
+        for group in ('abc', 10 ** 6):
+            with self.subTest(group=group):
+                response = self.action('post', 'move_to_group',
+                                       self.posts[:4], group=group)
+                self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.group.posts.count(), 6)
+        self.assertFalse(BulkJob.objects.exists())
+
+    def test_delete_by_author_confirms_with_counts(self):
+        """Удаление по автору сначала показывает подтверждение числами
+        всех записей авторов."""
+        response = self.action('post', 'delete_by_author', self.posts[:1])
+        self.assertTemplateUsed(
+            response, 'admin/posts/bulk_delete_confirmation.html')
+        self.assertEqual(response.context['counts'], [
+            ('Посты', '6'), ('Комменты', '3')])
+        self.assertContains(
+            response, '<input type="hidden" name="action" '
+                      'value="delete_by_author">', html=True)
+        self.assertEqual(Post.objects.count(), 6)
+
+    def test_delete_by_author(self):
+        """Удаление по автору убирает посты, комментарии и записи лент."""
+        version = get_version('profile', self.spammer.pk)
+        self.action('post', 'delete_by_author', self.posts[:1], post='yes')
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Timeline.objects.exists())
+        self.assertEqual(
+            UserCounter.objects.get(user=self.spammer).posts_count, 0)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(list(SearchResults('реклама')[:10]), [])
+        self.assertNotEqual(get_version('profile', self.spammer.pk), version)
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Число запросов не зависит от числа удаляемых постов."""
+        def queries(posts):
+            with CaptureQueriesContext(connection) as context:
+                bulk.run('delete_posts', Post.objects.filter(
+                    pk__in=[post.pk for post in posts]))
+            return len(context)
+        self.assertEqual(queries(self.posts[:1]), queries(self.posts[1:]))
+
+    def test_delete_comments_by_author(self):
+        """Удаление комментариев по автору пересчитывает счётчик поста."""
+        self.action('comment', 'delete_by_author', self.comments[:1],
+                    post='yes')
+        self.assertFalse(Comment.objects.exists())
+        self.posts[0].refresh_from_db()
+        self.assertEqual(self.posts[0].comments_count, 0)
+        self.assertEqual(list(SearchResults('слона')[:10]), [])
+
+    @override_settings(POSTS_BULK_THRESHOLD=4, POSTS_BULK_CHUNK=4,
+                       POSTS_BULK_WORKERS=0)
+    def test_large_operation_runs_as_job(self):
+        """Большая операция идёт фоновой задачей с ходом выполнения."""
+        self.action('post', 'delete_by_author', self.posts[:1], post='yes')
+        job = BulkJob.objects.get()
+        self.assertEqual(job.status, BulkJob.DONE)
+        self.assertEqual((job.done, job.total), (6, 6))
+        self.assertEqual(job.user, self.admin)
+        self.assertFalse(Post.objects.exists())
+        self.assertNotIn('ids', job.params)
+
+    def test_delete_selected_confirms_with_counts(self):
+        """Удаление выбранных подтверждается числами, без списка
+        связанных объектов, и идёт массовой операцией."""
+        response = self.action('post', 'bulk_delete', self.posts[:2])
+        self.assertTemplateUsed(
+            response, 'admin/posts/bulk_delete_confirmation.html')
+        self.assertEqual(response.context['counts'], [
+            ('Посты', '2'), ('Комменты', '3')])
+        self.assertNotContains(response, 'Реклама 0')
+        self.assertTrue(Post.objects.filter(pk=self.posts[0].pk).exists())
+        self.action('post', 'bulk_delete', self.posts[:2], post='yes')
+        self.assertEqual(Post.objects.count(), 4)
+        self.assertFalse(Comment.objects.exists())
+
+    @override_settings(POSTS_BULK_THRESHOLD=4, POSTS_BULK_CHUNK=4,
+                       POSTS_BULK_WORKERS=0, POSTS_BULK_STALE=60)
+    def test_stale_jobs_failed(self):
+        """Задачи, оборванные перезапуском сервера, помечаются
+        ошибкой, живые не трогаются."""
+        stale = BulkJob.objects.create(
+            action='delete_posts', status=BulkJob.RUNNING,
+            updated=timezone.now() - timedelta(minutes=5))
+        alive = BulkJob.objects.create(
+            action='delete_posts', status=BulkJob.RUNNING)
+        self.admin_client.get(reverse('admin:posts_bulkjob_changelist'))
+        stale.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual(stale.status, BulkJob.FAILED)
+        self.assertIsNotNone(stale.finished)
+        self.assertEqual(alive.status, BulkJob.RUNNING)
@@ -0,0 +1,209 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import bulk
+from posts.models import Comment, Post, path_segment, thread_prefix
+from posts.threads import MAX_DEPTH, reply_parent, subtree
+from posts.views import comment_page, comments_pages, comments_replies
+
+User = get_user_model()
+
+
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Вирусный пост')
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'Коммент {i}')
+            for i in range(comments_pages * 2 + 5)
+        )
+        cls.ids = list(cls.post.comments.order_by(
+            '-created', '-pk').values_list('pk', flat=True))
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def detail(self, **params):
+        return self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            params)
+
+    def more(self, **params):
+        return self.guest_client.get(
+            reverse('posts:comments', kwargs={'post_id': self.post.pk}),
+            params)
+
+    def test_detail_shows_first_page(self):
+        """На странице поста только первая страница комментариев."""
+        response = self.detail()
+        comments = response.context['comments']
+        self.assertEqual([c.pk for c in comments], self.ids[:comments_pages])
+        self.assertContains(response, 'data-more-comments=')
+
+    def test_load_more_walks_all_comments(self):
+        """«Показать ещё» отдаёт следующие комментарии без повторов."""
+        page = self.detail().context['comments']
+        seen = [c.pk for c in page]
+        while page.has_next():
+            page = self.more(
+                cursor=page.paginator.next_cursor).context['comments']
+            seen.extend(c.pk for c in page)
+        self.assertEqual(seen, self.ids)
+
+    def test_json(self):
+        """Комментарии отдаются в JSON со ссылкой на продолжение."""
+        data = self.more(format='json').json()
+        self.assertEqual(len(data['comments']), comments_pages)
+        self.assertEqual(data['comments'][0]['id'], self.ids[0])
+        self.assertEqual(data['comments'][0]['author'], 'auth')
+        self.assertTrue(data['next'].startswith('?cursor='))
+
+    def test_queries_do_not_depend_on_comments(self):
+        """Число запросов не зависит от числа комментариев."""
+        def queries():
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.detail()
+            return len(context)
+        before = queries()
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.user, text='Ещё')
+            for _ in range(50)
+        )
+        self.assertEqual(queries(), before)
+
+    def test_missing_post(self):
+        """Комментарии несуществующего поста — 404."""
+        response = self.guest_client.get(
+            reverse('posts:comments', kwargs={'post_id': 10 ** 6}))
+        self.assertEqual(response.status_code, 404)
+
+
+class CommentThreadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def reply(self, parent, text='Ответ'):
+        return Comment.objects.create(
+            post=self.post, author=self.user, text=text, parent=parent)
+
+    def test_path_orders_thread_depth_first(self):
+        """Путь упорядочивает ветку обходом в глубину."""
+        root = self.reply(None, 'Корень')
+        first = self.reply(root)
+        second = self.reply(root)
+        nested = self.reply(first)
+        self.assertEqual(
+            list(subtree(root)), [first, nested, second])
+        self.assertEqual([c.depth for c in (root, first, nested)], [0, 1, 2])
+
+    def test_reply_path_set_before_insert(self):
+        """Путь ответа пишется той же вставкой, без второго UPDATE."""
+        root = self.reply(None, 'Корень')
+        first = self.reply(root)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.reply(root)
+        self.assertFalse(any(
+            query['sql'].startswith('UPDATE "posts_comment"')
+            for query in queries))
+        self.assertEqual(Comment.objects.get(pk=second.pk).path,
+                         thread_prefix(root) + path_segment(2))
+        self.assertEqual(first.path, thread_prefix(root) + path_segment(1))
+
+    def test_subtree_after_clamped_to_thread(self):
+        """Путь ?after= вне ветки не отдаёт чужие комментарии."""
+        other = self.reply(None, 'Раньше')
+        first = self.reply(other)
+        self.reply(other)
+        root = self.reply(None, 'Корень')
+        reply = self.reply(root)
+        self.assertEqual(list(subtree(root, after=first.path)), [reply])
+
+    def test_reply_via_form(self):
+        """Ответ через форму встаёт под родителем."""
+        root = self.reply(None, 'Корень')
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Ответ из формы', 'parent': root.pk})
+        reply = Comment.objects.get(text='Ответ из формы')
+        self.assertEqual(reply.parent, root)
+        self.assertTrue(reply.path.startswith(thread_prefix(root)))
+
+    def test_reply_to_invalid_parent(self):
+        """Ответ на нечисловой или слишком большой id родителя — 404."""
+        for parent in ('abc', '9' * 30, '0', str(10 ** 6)):
+            with self.subTest(parent=parent):
+                response = self.authorized_client.post(
+                    reverse('posts:add_comment',
+                            kwargs={'post_id': self.post.pk}),
+                    {'text': 'Ответ', 'parent': parent})
+                self.assertEqual(response.status_code, 404)
+        self.assertFalse(Comment.objects.filter(text='Ответ').exists())
+
+    def test_deep_replies_flattened(self):
+        """Ответы глубже MAX_DEPTH остаются на последнем уровне."""
+        comment = self.reply(None)
+        for _ in range(MAX_DEPTH + 3):
+            comment = self.reply(reply_parent(comment))
+        self.assertEqual(comment.depth, MAX_DEPTH)
+
+    def test_threads_load_in_two_queries(self):
+        """Ветки страницы с первыми ответами — два запроса
+        при любой ширине и глубине веток."""
+        for i in range(5):
+            root = self.reply(None, f'Ветка {i}')
+            parent = root
+            for _ in range(comments_replies * 2):
+                parent = self.reply(parent)
+            for _ in range(comments_replies * 2):
+                self.reply(root)
+        with self.assertNumQueries(2):
+            page = comment_page(RequestFactory().get('/'), self.post.pk)
+        for root in page:
+            self.assertEqual(len(root.first_replies), comments_replies)
+            self.assertTrue(root.more_replies)
+            self.assertTrue(all(
+                reply.path.startswith(thread_prefix(root))
+                for reply in root.first_replies))
+
+    def test_replies_endpoint_continues_thread(self):
+        """Продолжение ветки отдаётся по пути последнего ответа."""
+        root = self.reply(None)
+        replies = [self.reply(root) for _ in range(comments_replies + 2)]
+        page = self.detail_page()
+        last = page[0].first_replies[-1]
+        response = self.guest_client.get(
+            reverse('posts:replies', kwargs={
+                'post_id': self.post.pk, 'comment_id': root.pk}),
+            {'after': last.path})
+        self.assertEqual(
+            list(response.context['replies']),
+            replies[comments_replies:])
+
+    def detail_page(self):
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        return response.context['comments']
+
+    def test_bulk_delete_removes_replies(self):
+        """Массовое удаление комментария удаляет и ответы на него."""
+        root = self.reply(None)
+        self.reply(self.reply(root))
+        bulk.run('delete_comments', Comment.objects.filter(pk=root.pk))
+        self.assertFalse(Comment.objects.exists())
@@ -0,0 +1,115 @@
+import time
+from http import HTTPStatus
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.auth_client = Client()
+        self.auth_client.force_login(self.reader)
+
+    def pages(self):
+        return [
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        ]
+
+    def test_etag_not_modified_without_rendering(self):
+        """Совпавший ETag даёт 304: аноним — без запросов к базе,
+        пользователь — только сессия и сам пользователь."""
+        for client, queries in ((self.guest_client, 0),
+                                (self.auth_client, 2)):
+            for address in self.pages():
+                with self.subTest(address=address, queries=queries):
+                    etag = client.get(address)['ETag']
+                    with self.assertNumQueries(queries):
+                        response = client.get(
+                            address, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(
+                        response.status_code, HTTPStatus.NOT_MODIFIED)
+                    self.assertEqual(response.content, b'')
+
+    def test_etag_depends_on_user(self):
+        """Страницы разных пользователей имеют разные ETag."""
+        for address in self.pages():
+            with self.subTest(address=address):
+                self.assertNotEqual(
+                    self.guest_client.get(address)['ETag'],
+                    self.auth_client.get(address)['ETag'],
+                )
+
+    def test_last_modified(self):
+        """If-Modified-Since даёт 304, пока нет новых комментариев,
+        и не требует запросов к базе для даты."""
+        address = self.pages()[2]
+        modified = self.auth_client.get(address)['Last-Modified']
+        with self.assertNumQueries(2):
+            response = self.auth_client.get(
+                address, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        with mock.patch('posts.versions.time.time',
+                        return_value=time.time() + 60):
+            Comment.objects.create(
+                post=self.post, author=self.reader, text='Коммент')
+        response = self.auth_client.get(
+            address, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_login_changes_etag(self):
+        """После повторного входа CSRF-токен новый: старый ETag
+        не подходит, и форма не приходит со старым токеном."""
+        User.objects.create_user(username='login', password='pass-1234')
+        credentials = {'username': 'login', 'password': 'pass-1234'}
+        client = Client()
+        client.post(reverse('users:login'), credentials)
+        address = self.pages()[2]
+        etag = client.get(address)['ETag']
+        self.assertEqual(client.get(
+            address, HTTP_IF_NONE_MATCH=etag).status_code,
+            HTTPStatus.NOT_MODIFIED)
+        client.post(reverse('users:login'), credentials)
+        response = client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_change_invalidates_etag(self):
+        """Изменение контента меняет ETag."""
+        etags = [self.guest_client.get(address)['ETag']
+                 for address in self.pages()]
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Коммент')
+        Post.objects.create(
+            author=self.user, text='Новый пост', group=self.group)
+        for address, etag in zip(self.pages(), etags):
+            with self.subTest(address=address):
+                response = self.guest_client.get(
+                    address, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
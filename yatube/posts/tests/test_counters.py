@@ -0,0 +1,152 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, UserCounter
+
+User = get_user_model()
+
+
+class CounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group_1 = Group.objects.create(
+            title='Тестовая группа 1',
+            slug='test-slug-1',
+            description='Тестовое описание 1',
+        )
+        cls.group_2 = Group.objects.create(
+            title='Тестовая группа 2',
+            slug='test-slug-2',
+            description='Тестовое описание 2',
+        )
+
+    def setUp(self):
+        self.auth_client = Client()
+        self.auth_client.force_login(self.user)
+
+    def counter(self, user):
+        return UserCounter.objects.get(user=user)
+
+    def test_post_counters(self):
+        """Создание, перенос и удаление поста меняют счётчики."""
+        post = Post.objects.create(
+            author=self.user,
+            text='Тестовый пост',
+            group=self.group_1,
+        )
+        self.assertEqual(self.counter(self.user).posts_count, 1)
+        self.group_1.refresh_from_db()
+        self.assertEqual(self.group_1.posts_count, 1)
+        self.auth_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.id}),
+            data={'text': 'Тестовый пост', 'group': self.group_2.id},
+        )
+        self.group_1.refresh_from_db()
+        self.group_2.refresh_from_db()
+        self.assertEqual(self.group_1.posts_count, 0)
+        self.assertEqual(self.group_2.posts_count, 1)
+        Post.objects.get(pk=post.pk).delete()
+        self.group_2.refresh_from_db()
+        self.assertEqual(self.counter(self.user).posts_count, 0)
+        self.assertEqual(self.group_2.posts_count, 0)
+
+    def test_comment_and_follow_counters(self):
+        """Комментарии и подписки меняют счётчики."""
+        post = Post.objects.create(author=self.user, text='Тестовый пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Коммент')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        self.assertEqual(self.counter(self.user).followers_count, 1)
+        self.assertEqual(self.counter(self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.counter(self.user).followers_count, 0)
+        self.assertEqual(self.counter(self.reader).following_count, 0)
+
+    def test_post_delete_skips_comment_signals(self):
+        """Каскадное удаление комментариев вместе с постом не обновляет
+        счётчики, версии и поиск по каждому комментарию."""
+        post = Post.objects.create(author=self.user, text='Тестовый пост')
+        Comment.objects.bulk_create(
+            Comment(post=post, author=self.reader, text=f'Коммент {i}')
+            for i in range(5))
+        with mock.patch('posts.signals.counters.bump_post') as bump_post, \
+                self.assertNumQueries(8):
+            Post.objects.get(pk=post.pk).delete()
+        bump_post.assert_not_called()
+        self.assertFalse(Comment.objects.filter(post_id=post.pk).exists())
+        other = Post.objects.create(author=self.user, text='Другой пост')
+        comment = Comment.objects.create(
+            post=other, author=self.reader, text='Коммент')
+        comment.delete()
+        other.refresh_from_db()
+        self.assertEqual(other.comments_count, 0)
+
+    def test_drifted_counter_does_not_block_delete(self):
+        """Разошедшийся до нуля счётчик не мешает удалению: уменьшение
+        останавливается на нуле, repair_counters возвращает точное
+        значение."""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group_1)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Коммент')
+        UserCounter.objects.filter(user=self.user).update(posts_count=0)
+        Group.objects.filter(pk=self.group_1.pk).update(posts_count=0)
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        comment.delete()
+        Post.objects.get(pk=post.pk).delete()
+        self.group_1.refresh_from_db()
+        self.assertEqual(self.counter(self.user).posts_count, 0)
+        self.assertEqual(self.group_1.posts_count, 0)
+
+    def test_repair_counters(self):
+        """Команда repair_counters исправляет разошедшиеся счётчики."""
+        post = Post.objects.create(
+            author=self.user,
+            text='Тестовый пост',
+            group=self.group_1,
+        )
+        Comment.objects.create(post=post, author=self.reader, text='Коммент')
+        UserCounter.objects.filter(user=self.user).update(posts_count=7)
+        UserCounter.objects.filter(user=self.reader).delete()
+        Group.objects.update(posts_count=5)
+        Post.objects.update(comments_count=0)
+        call_command('repair_counters', stdout=StringIO())
+        self.group_1.refresh_from_db()
+        post.refresh_from_db()
+        self.assertEqual(self.counter(self.user).posts_count, 1)
+        self.assertEqual(self.counter(self.reader).posts_count, 0)
+        self.assertEqual(self.group_1.posts_count, 1)
+        self.assertEqual(post.comments_count, 1)
+
+    def test_profile_does_not_count_posts(self):
+        """Профиль берёт число постов из счётчика."""
+        Post.objects.create(author=self.user, text='Тестовый пост')
+        UserCounter.objects.filter(user=self.user).update(posts_count=42)
+        response = self.auth_client.get(
+            reverse('posts:profile', kwargs={'username': self.user.username})
+        )
+        self.assertEqual(response.context['count'], 42)
+
+    def test_group_page_count_is_fresh(self):
+        """Число постов группы на её странице не берётся из кэша."""
+        address = reverse('posts:group_list',
+                          kwargs={'slug': self.group_1.slug})
+        self.auth_client.get(address)
+        Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group_1)
+        response = self.auth_client.get(address)
+        self.assertEqual(response.context['group'].posts_count, 1)
+        self.assertContains(response, 'Всего постов: 1')
@@ -5,11 +5,19 @@ from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from posts.models import Group, Post, Comment
 from django.conf import settings
+import hashlib
 import tempfile
 import shutil
 
 User = get_user_model()
 
+
+def stored_name(content, extension):
+    '''Имя файла в хранилище с адресацией по содержимому.'''
+    digest = hashlib.sha256(content).hexdigest()
+    return f'posts/{digest[:2]}/{digest[2:4]}/{digest}.{extension}'
+
+
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
@@ -93,7 +101,7 @@ class PostCreateFormTests(TestCase):
                 text=form_data['text'],
                 group=form_data['group'],
                 author=self.user_auth,
-                image='posts/small_create.gif'
+                image=stored_name(small_gif, 'gif')
             ).exists()
         )
 
@@ -132,7 +140,7 @@ class PostCreateFormTests(TestCase):
         post_1.refresh_from_db()
         self.assertEqual(post_1.text, form_data['text'])
         self.assertEqual(post_1.group, group_edit)
-        self.assertEqual(post_1.image, 'posts/small_edit.gif')
+        self.assertEqual(post_1.image, stored_name(small_gif, 'gif'))
 
     def test_no_create_post(self):
         """Не авторизованный пользователь не может создать запись в Post."""
@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from posts.management.commands.loadtest import MIX, percentile
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class LoadTestCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug', description='Описание')
+        for number in range(3):
+            post = Post.objects.create(
+                author=cls.user, group=group, text=f'Тестовый пост {number}')
+            root = Comment.objects.create(
+                post=post, author=cls.reader, text='Комментарий')
+            Comment.objects.create(
+                post=post, author=cls.user, text='Ответ', parent=root)
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def run_command(self, *args, **options):
+        out = StringIO()
+        call_command('loadtest', *args, stdout=out, **options)
+        return out.getvalue()
+
+    def test_percentile(self):
+        """Перцентиль по рангу."""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+
+    def test_report_every_url(self):
+        """Отчёт по каждому адресу смеси: без ошибок и с числом
+        SQL-запросов; сессии нагрузки удаляются."""
+        path = os.path.join(self.directory.name, 'run.json')
+        output = self.run_command(requests=500, warmup=0, save=path)
+        with open(path) as file:
+            result = json.load(file)
+        self.assertEqual(set(result['views']), set(MIX))
+        for name, stats in result['views'].items():
+            self.assertEqual(stats['errors'], 0, name)
+            self.assertGreater(stats['queries'], 0, name)
+            self.assertLessEqual(stats['p50'], stats['p99'])
+            self.assertIn(name, output)
+        self.assertEqual(result['total']['requests'], 500)
+        self.assertFalse(Session.objects.exists())
+
+    def test_read_only(self):
+        """--read-only не пишет комментарии."""
+        comments = Comment.objects.count()
+        self.run_command(requests=50, warmup=0, read_only=True)
+        self.assertEqual(Comment.objects.count(), comments)
+
+    def test_compare(self):
+        """Два сохранённых прогона сравниваются по адресам."""
+        first = os.path.join(self.directory.name, 'first.json')
+        second = os.path.join(self.directory.name, 'second.json')
+        self.run_command(requests=30, warmup=0, only='index', save=first)
+        output = self.run_command(
+            requests=30, warmup=0, only='index', save=second,
+            compare=[first])
+        self.assertIn('index: p50', output)
+        output = self.run_command(compare=[first, second])
+        self.assertIn('всего: p50', output)
+
+    def test_unknown_url(self):
+        with self.assertRaises(CommandError):
+            self.run_command(only='nope')
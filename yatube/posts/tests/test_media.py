@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template.defaultfilters import filesizeformat
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts.models import MediaFile, Post
+from posts.storage import content_key
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(name, color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', (120, 80), color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name=name, content=buffer.getvalue())
+
+
+def run_now(callback):
+    callback()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POSTS_RENDITION_WORKERS=0)
+@mock.patch('posts.media.transaction.on_commit', run_now)
+class MediaStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.auth_client = Client()
+        self.auth_client.force_login(self.user)
+
+    def create(self, image):
+        self.auth_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': image},
+        )
+        return Post.objects.latest('pk')
+
+    def refs(self, name):
+        return MediaFile.objects.get(name=name).refs
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(TEMP_MEDIA_ROOT, name))
+
+    def test_same_image_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом с общими размерами."""
+        first = self.create(make_image('meme.png'))
+        with mock.patch('posts.renditions.imaging.process') as process:
+            second = self.create(make_image('repost.PNG'))
+        process.assert_not_called()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^posts/\w\w/\w\w/\w{64}\.png$')
+        self.assertEqual(self.refs(first.image.name), 2)
+        self.assertEqual(second.renditions, first.renditions)
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_last_reference_removes_files(self):
+        """Удаление последнего поста удаляет файл и его размеры."""
+        first = self.create(make_image('meme.png'))
+        second = self.create(make_image('meme.png'))
+        name = first.image.name
+        rendition = first.renditions['card']['formats']['JPEG'][0][0]
+        first.delete()
+        self.assertEqual(self.refs(name), 1)
+        self.assertTrue(self.exists(name))
+        second.delete()
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+        self.assertFalse(self.exists(name))
+        self.assertFalse(self.exists(rendition))
+
+    def test_replaced_image_released(self):
+        """Замена картинки в посте отпускает прежний файл."""
+        post = self.create(make_image('first.png'))
+        old = post.image.name
+        self.auth_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.id}),
+            data={'text': 'Пост с картинкой',
+                  'image': make_image('second.png', color='blue')},
+        )
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.name, old)
+        self.assertEqual(self.refs(post.image.name), 1)
+        self.assertFalse(MediaFile.objects.filter(name=old).exists())
+        self.assertFalse(self.exists(old))
+
+    def put(self, name):
+        path = os.path.join(TEMP_MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'x' * 10)
+        return name
+
+    def test_gc_media(self):
+        """Команда gc_media удаляет только файлы без ссылок."""
+        post = self.create(make_image('kept.png'))
+        kept = [post.image.name] + [
+            path for path, _ in post.renditions['card']['formats']['JPEG']]
+        key = post.image.name.split('/')[-1].split('.')[0]
+        orphans = [
+            self.put('posts/aa/bb/' + 'a' * 64 + '.png'),
+            self.put(f'renditions/{"b" * 64}/card-320.jpg'),
+            self.put(f'renditions/{key}/card-100.jpg'),
+        ]
+        sorl = self.put('cache/ab/cd/sorl.jpg')
+        out = StringIO()
+        call_command('gc_media', dry_run=True, min_age=0, stdout=out)
+        self.assertIn(
+            f'Будет удалено: 3, {filesizeformat(30)}', out.getvalue())
+        self.assertTrue(all(self.exists(name) for name in orphans))
+        call_command('gc_media', min_age=0, stdout=StringIO())
+        self.assertFalse(any(self.exists(name) for name in orphans))
+        self.assertTrue(all(self.exists(name) for name in kept))
+        self.assertTrue(self.exists(sorl))
+        call_command('gc_media', '--roots', 'cache', min_age=0,
+                     stdout=StringIO())
+        self.assertFalse(self.exists('cache'))
+
+    def test_gc_media_legacy_renditions(self):
+        """Размеры картинки, загруженной до дедупликации, ищутся
+        по индексу размеров поста."""
+        post = self.create(make_image('legacy.png'))
+        name = 'posts/legacy.png'
+        key = content_key(name)
+        kept = self.put(f'renditions/{key}/card-960.jpg')
+        orphan = self.put(f'renditions/{content_key("posts/gone.png")}'
+                          '/card-960.jpg')
+        Post.objects.filter(pk=post.pk).update(image=name, renditions={
+            'card': {'width': 960, 'height': 339,
+                     'formats': {'JPEG': [[kept, 960]]}}})
+        call_command('gc_media', '--roots', 'renditions', min_age=0,
+                     stdout=StringIO())
+        self.assertTrue(self.exists(kept))
+        self.assertFalse(self.exists(orphan))
+
+    def test_gc_media_skips_fresh_files(self):
+        """Свежие файлы не удаляются: пост мог ещё не сохраниться."""
+        name = self.put('posts/aa/bb/' + 'c' * 64 + '.png')
+        call_command('gc_media', stdout=StringIO())
+        self.assertTrue(self.exists(name))
@@ -0,0 +1,127 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts import versions
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.auth_client = Client()
+        self.auth_client.force_login(self.reader)
+
+    def pages(self):
+        return [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        ]
+
+    def test_anonymous_page_served_without_queries(self):
+        """Повторный запрос анонима отдаётся из кэша без запросов к базе."""
+        for address in self.pages():
+            with self.subTest(address=address):
+                response = self.guest_client.get(address)
+                self.assertEqual(response['X-Page-Cache'], 'miss')
+                with self.assertNumQueries(0):
+                    cached = self.guest_client.get(address)
+                self.assertEqual(cached['X-Page-Cache'], 'hit')
+                self.assertEqual(cached.content, response.content)
+
+    def test_query_string_is_part_of_key(self):
+        """Разные строки запроса кэшируются отдельно."""
+        address = reverse('posts:index')
+        self.guest_client.get(address)
+        response = self.guest_client.get(address + '?page=1')
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+
+    def test_authorized_user_bypasses_cache(self):
+        """Авторизованный пользователь получает страницу мимо кэша."""
+        for address in self.pages():
+            with self.subTest(address=address):
+                self.auth_client.get(address)
+                response = self.auth_client.get(address)
+                self.assertFalse(response.has_header('X-Page-Cache'))
+                self.assertContains(response, 'Выйти')
+
+    def test_changes_invalidate_pages(self):
+        """Новый пост, комментарий и подписка сбрасывают страницы."""
+        for address in self.pages():
+            self.guest_client.get(address)
+        Post.objects.create(
+            author=self.user, text='Новый пост', group=self.group)
+        for address in self.pages()[:3]:
+            with self.subTest(address=address):
+                response = self.guest_client.get(address)
+                self.assertContains(response, 'Новый пост')
+        detail = self.pages()[3]
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Новый коммент')
+        self.assertContains(self.guest_client.get(detail), 'Новый коммент')
+        profile = self.pages()[2]
+        self.guest_client.get(profile)
+        Follow.objects.create(user=self.reader, author=self.user)
+        response = self.guest_client.get(profile)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+
+    def test_group_rename_invalidates_post_pages(self):
+        """Новый slug группы попадает во все страницы с её постами."""
+        for address in self.pages():
+            self.auth_client.get(address)
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'renamed-slug'
+        group.save()
+        new_link = reverse('posts:group_list', kwargs={'slug': group.slug})
+        pages = self.pages()
+        pages[1] = new_link
+        for address in pages:
+            with self.subTest(address=address):
+                self.assertContains(self.auth_client.get(address), new_link)
+
+    def test_user_rename_invalidates_pages(self):
+        """Новое имя автора попадает во все страницы с его постами,
+        вход пользователя версии не меняет."""
+        for address in self.pages():
+            self.auth_client.get(address)
+        version = versions.get_version('index')
+        self.guest_client.force_login(self.user)
+        self.assertEqual(versions.get_version('index'), version)
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name, user.last_name = 'Новое', 'Имя'
+        user.save()
+        for address in self.pages():
+            with self.subTest(address=address):
+                self.assertContains(self.auth_client.get(address),
+                                    'Новое Имя')
+
+    def test_missing_page_is_not_cached(self):
+        """Страница 404 не попадает в кэш."""
+        address = reverse('posts:post_detail', kwargs={'post_id': 10 ** 6})
+        self.guest_client.get(address)
+        response = self.guest_client.get(address)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('X-Page-Cache'))
@@ -0,0 +1,83 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ListingQueriesTest(TestCase):
+    """Число запросов страниц со списками постов не зависит
+    от числа постов, авторов и групп на странице."""
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.group = Group.objects.create(
+            title='Общая группа', slug='common', description='Описание')
+        self.author = User.objects.create_user(username='author')
+
+    def fill(self, start, count):
+        '''Посты разных авторов в разных группах, с комментариями.'''
+        for number in range(start, start + count):
+            author = User.objects.create_user(
+                username=f'author{number}', first_name='Имя',
+                last_name=f'Фамилия {number}')
+            group = Group.objects.create(
+                title=f'Группа {number}', slug=f'group-{number}',
+                description='Описание')
+            Follow.objects.create(user=self.reader, author=author)
+            for post_group, post_author in ((group, author),
+                                            (self.group, self.author)):
+                post = Post.objects.create(
+                    author=post_author, group=post_group,
+                    text=f'Искомый пост {number}')
+                Comment.objects.create(post=post, author=author, text='Ответ')
+
+    def queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'q': 'искомый'})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertQueriesPerPage(self, url, expected):
+        self.fill(0, 1)
+        self.assertEqual(self.queries(url), expected)
+        self.fill(1, 7)
+        self.assertEqual(self.queries(url), expected)
+
+    def test_index(self):
+        """Главная страница."""
+        self.assertQueriesPerPage(reverse('posts:index'), 3)
+
+    def test_group(self):
+        """Страница группы."""
+        self.assertQueriesPerPage(
+            reverse('posts:group_list', kwargs={'slug': 'common'}), 5)
+
+    def test_profile(self):
+        """Профиль автора."""
+        self.assertQueriesPerPage(
+            reverse('posts:profile', kwargs={'username': 'author'}), 6)
+
+    def test_follow(self):
+        """Лента подписок."""
+        self.assertQueriesPerPage(reverse('posts:follow_index'), 4)
+
+    def test_search(self):
+        """Выдача поиска."""
+        self.assertQueriesPerPage(reverse('posts:search'), 5)
+
+    def test_post_detail(self):
+        """Страница поста: автор, группа и счётчик — одним запросом."""
+        self.fill(0, 8)
+        post = Post.objects.filter(author=self.author).latest('pk')
+        self.assertEqual(self.queries(reverse(
+            'posts:post_detail', kwargs={'post_id': post.pk})), 6)
@@ -0,0 +1,153 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import Future
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from posts import renditions
+from posts.models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(name, size=(1200, 800), color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return SimpleUploadedFile(
+        name=name, content=buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POSTS_RENDITION_WORKERS=0)
+class RenditionTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.auth_client = Client()
+        self.auth_client.force_login(self.user)
+
+    def create(self, name):
+        self.auth_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': make_image(name)},
+        )
+        return Post.objects.latest('pk')
+
+    def test_renditions_made_on_upload(self):
+        """Сохранение формы нарезает картинку и пишет размеры в пост."""
+        post = self.create('big.png')
+        card = post.renditions['card']
+        self.assertEqual((card['width'], card['height']), (960, 339))
+        files = card['formats']['JPEG']
+        self.assertEqual([width for _, width in files], [320, 480, 640, 960])
+        path = os.path.join(TEMP_MEDIA_ROOT, files[0][0])
+        with Image.open(path) as image:
+            self.assertEqual(image.size, (320, 113))
+        response = self.auth_client.get(reverse('posts:index'))
+        self.assertContains(response, post.images['card']['url'])
+        self.assertContains(response, post.images['card']['srcset'])
+        self.assertContains(response, 'width="960" height="339"')
+
+    @override_settings(POSTS_RENDITION_FORMATS=('NOPE', 'PNG', 'JPEG'))
+    def test_picture_sources(self):
+        """Каждый поддерживаемый формат, кроме последнего, идёт в <source>,
+        неподдерживаемые пропускаются."""
+        post = self.create('formats.png')
+        self.assertEqual(
+            list(post.renditions['card']['formats']), ['PNG', 'JPEG'])
+        response = self.auth_client.get(reverse('posts:index'))
+        self.assertContains(response, '<source type="image/png"', count=1)
+        self.assertContains(response, '.jpg 960w')
+
+    def test_listing_has_no_per_image_queries(self):
+        """Размеры картинок приходят вместе с постами: число запросов
+        страницы не зависит от числа картинок."""
+        index = {'card': {'width': 960, 'height': 339, 'formats': {
+            'JPEG': [['renditions/card.jpg', 960]]}}}
+        address = reverse('posts:index')
+
+        def queries(count):
+            Post.objects.bulk_create(
+                Post(author=self.user, text='Пост', image='posts/card.png',
+                     renditions=index)
+                for _ in range(count)
+            )
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                response = self.auth_client.get(address)
+            return response, len(context)
+
+        _, single = queries(1)
+        response, page = queries(9)
+        self.assertEqual(page, single)
+        self.assertContains(response, 'renditions/card.jpg 960w', count=10)
+
+    def test_backfill_command(self):
+        """Команда make_renditions нарезает картинки старых постов."""
+        post = Post.objects.create(
+            author=self.user, text='Старый пост',
+            image=make_image('old.png'))
+        Post.objects.create(author=self.user, text='Пост без картинки')
+        out = StringIO()
+        call_command('make_renditions', workers=1, stdout=out)
+        post.refresh_from_db()
+        self.assertTrue(renditions.is_complete(post))
+        self.assertIn('Готово постов: 1, ошибок: 0', out.getvalue())
+        out = StringIO()
+        call_command('make_renditions', workers=1, stdout=out)
+        self.assertIn('Готово постов: 0', out.getvalue())
+
+    def test_new_image_gets_new_renditions(self):
+        """Новая картинка поста получает новые файлы размеров."""
+        post = self.create('first.png')
+        first = post.renditions['card']['formats']
+        self.auth_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.id}),
+            data={'text': 'Пост с картинкой',
+                  'image': make_image('second.png', color='blue')},
+        )
+        post.refresh_from_db()
+        self.assertNotEqual(post.renditions['card']['formats'], first)
+
+    def test_original_shown_until_ready(self):
+        """Пока размеры не готовы, шаблон показывает оригинал."""
+        with override_settings(POSTS_RENDITION_WORKERS=2), mock.patch(
+                'posts.renditions.transaction.on_commit') as on_commit:
+            post = self.create('pending.png')
+        self.assertEqual(post.renditions, {})
+        on_commit.assert_called_once()
+        response = self.auth_client.get(reverse('posts:index'))
+        self.assertContains(response, post.image.url)
+
+    def test_stale_result_ignored(self):
+        """Результат воркера для заменённой картинки не записывается."""
+        post = self.create('current.png')
+        names, _ = renditions.plan(post)
+        future = Future()
+        future.set_result((None, {key: (10, 10) for key in names}))
+        with mock.patch('posts.renditions.connection'):
+            renditions._finished(post.pk, 'posts/old.png', names, future)
+        post.refresh_from_db()
+        self.assertEqual(post.renditions['card']['width'], 960)
@@ -0,0 +1,129 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Post
+from posts.search import BaseBackend, SearchResults, SimpleBackend
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.user, text='Котики спасут мир')
+        self.other = Post.objects.create(
+            author=self.user, text='Про собак и прогулки')
+        self.guest_client = Client()
+
+    def found(self, query):
+        return [post.pk for post in SearchResults(query)[:10]]
+
+    def test_post_text_found_by_prefix(self):
+        """Пост находится по началу слова без учёта регистра."""
+        self.assertEqual(self.found('КОТИК'), [self.post.pk])
+        self.assertEqual(self.found('кот мир'), [self.post.pk])
+        self.assertEqual(self.found('кот собак'), [])
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при правке, комментарии и удалении."""
+        self.post.text = 'Кошки'
+        self.post.save()
+        self.assertEqual(self.found('котики'), [])
+        comment = Comment.objects.create(
+            post=self.other, author=self.user, text='Мой котик против')
+        self.assertEqual(self.found('котик'), [self.other.pk])
+        comment.delete()
+        self.assertEqual(self.found('котик'), [])
+        self.other.delete()
+        self.assertEqual(self.found('собак'), [])
+
+    def test_post_text_ranked_above_comments(self):
+        """Совпадение в тексте поста выше совпадения в комментарии."""
+        Comment.objects.create(
+            post=self.other, author=self.user, text='котики')
+        self.assertEqual(self.found('котики'), [self.post.pk, self.other.pk])
+
+    def test_query_syntax_is_escaped(self):
+        """Операторы FTS5 в запросе не ломают поиск."""
+        self.assertEqual(self.found('"кот" OR NEAR(*'), [])
+        self.assertEqual(self.found('"котики" AND'), [])
+        self.assertEqual(self.found(''), [])
+
+    def test_search_page_paginated(self):
+        """Страница поиска делится на страницы и сохраняет запрос."""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'котики {i}') for i in range(12))
+        SearchResults('').backend.rebuild()
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': 'котики'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.paginator.count, 13)
+        self.assertEqual(len(page_obj), 10)
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%82%D0%B8%D0%BA%D0%B8'
+                                      '&amp;page=2')
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': 'котики', 'page': 2})
+        self.assertEqual(len(response.context['page_obj']), 3)
+
+    def test_simple_backend(self):
+        """Запасной бэкенд ищет тем же интерфейсом."""
+        backend = SimpleBackend()
+        self.assertEqual(backend.count('спасут мир'), 1)
+        self.assertEqual(backend.ids('спасут мир', 0, 10), [self.post.pk])
+
+    def test_simple_backend_searches_comments(self):
+        """Запасной бэкенд ищет и в комментариях, совпадения в тексте
+        поста выше, слова ищутся в одном комментарии."""
+        backend = SimpleBackend()
+        newer = Post.objects.create(author=self.user, text='Про ежей')
+        Comment.objects.create(post=newer, author=self.user, text='мир')
+        Comment.objects.create(post=newer, author=self.user, text='мир')
+        Comment.objects.create(post=self.other, author=self.user, text='мир')
+        Comment.objects.create(
+            post=self.other, author=self.user, text='спасут')
+        self.assertEqual(backend.count('мир'), 3)
+        self.assertEqual(backend.ids('мир', 0, 10),
+                         [self.post.pk, newer.pk, self.other.pk])
+        self.assertEqual(backend.ids('спасут мир', 0, 10), [self.post.pk])
+        self.assertEqual(
+            list(backend.filter(Post.objects.all(), 'мир', 'comments')),
+            [newer, self.other])
+        self.assertEqual(backend.ids('', 0, 10), [])
+
+    def test_comments_indexed_as_rows(self):
+        """Комментарий — своя строка индекса: новый комментарий
+        не переиндексирует пост, удаление убирает только его строку."""
+        first = Comment.objects.create(
+            post=self.other, author=self.user, text='Кормим котиков')
+        with CaptureQueriesContext(connection) as queries:
+            Comment.objects.create(
+                post=self.other, author=self.user, text='Выгуливаем ежа')
+        indexed = [query['sql'] for query in queries
+                   if 'posts_search' in query['sql']]
+        self.assertEqual(len(indexed), 2)
+        self.assertFalse(any('posts_post' in sql for sql in indexed))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT count(*) FROM posts_search '
+                'WHERE rowid >> 32 = %s', [self.other.pk])
+            self.assertEqual(cursor.fetchone()[0], 3)
+        self.assertEqual(self.found('ежа'), [self.other.pk])
+        self.assertEqual(self.found('кормим ежа'), [])
+        first.delete()
+        self.assertEqual(self.found('кормим'), [])
+        self.assertEqual(self.found('ежа'), [self.other.pk])
+
+    def test_backend_is_abstract(self):
+        """Бэкенд без методов выдачи не создаётся."""
+        with self.assertRaises(TypeError):
+            BaseBackend()
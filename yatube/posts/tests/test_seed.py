@@ -0,0 +1,85 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db.models import Count
+from django.test import TestCase, override_settings
+
+from posts import counters
+from posts.models import Comment, Follow, MediaFile, Post, Timeline
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SIZES = {
+    'users': 40, 'authors': 8, 'groups': 3, 'posts': 120, 'comments': 200,
+    'follows': 4, 'images': 2, 'timeline': 20, 'chunk': 50,
+}
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SeedCommandTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def seed(self, prefix='seed', **options):
+        call_command('seed', '--until=2026-01-01', prefix=prefix,
+                     stdout=StringIO(),
+                     **{**SIZES, 'workers': 0, **options})
+
+    def posts(self, prefix):
+        posts = Post.objects.filter(
+            author__username__startswith=f'{prefix}_').order_by('pk')
+        return list(posts.values_list(
+            'text', 'image', 'pub_date', 'group__title', 'comments_count'))
+
+    def test_seed(self):
+        """Команда создаёт согласованный набор данных."""
+        self.seed()
+        self.assertEqual(User.objects.count(), SIZES['users'])
+        self.assertEqual(Post.objects.count(), SIZES['posts'])
+        self.assertTrue(Follow.objects.exists())
+        self.assertTrue(Timeline.objects.exists())
+        self.assertEqual(counters.repair_users(), 0)
+        self.assertEqual(counters.repair_groups(), 0)
+        self.assertEqual(counters.repair_posts(), 0)
+        for reply in Comment.objects.exclude(parent=None).select_related(
+                'parent'):
+            self.assertTrue(reply.path.startswith(reply.parent.path))
+            self.assertEqual(reply.post_id, reply.parent.post_id)
+        images = Post.objects.exclude(image='').order_by().values(
+            'image').annotate(total=Count('pk'))
+        for row in images:
+            self.assertEqual(
+                MediaFile.objects.get(name=row['image']).refs, row['total'])
+        user = User.objects.get(username='seed_0')
+        self.assertTrue(user.check_password('seed-password'))
+
+    def test_zipf(self):
+        """Первые по рангу авторы популярнее последних."""
+        self.seed()
+        followers = list(User.objects.filter(
+            username__in=['seed_0', f'seed_{SIZES["authors"] - 1}']
+        ).order_by('pk').values_list('counter__followers_count', flat=True))
+        self.assertGreater(followers[0], followers[1])
+
+    def test_reproducible(self):
+        """Одинаковое зерно даёт одинаковые данные при любом числе
+        процессов."""
+        self.seed('first')
+        self.seed('second', workers=2)
+        self.assertEqual(self.posts('first'), self.posts('second'))
+        self.seed('third', seed=1)
+        self.assertNotEqual(self.posts('first'), self.posts('third'))
+
+    def test_prefix_taken(self):
+        """Повторный запуск с тем же префиксом не пишет дубликаты."""
+        self.seed()
+        with self.assertRaises(CommandError):
+            self.seed()
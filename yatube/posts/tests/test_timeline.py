@@ -0,0 +1,222 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import timeline
+from posts.models import Follow, Post, Timeline
+
+User = get_user_model()
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.old_post = Post.objects.create(
+            author=cls.author,
+            text='Пост до подписки',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.follower)
+
+    def follow(self):
+        return Follow.objects.create(
+            user=self.follower,
+            author=self.author,
+        )
+
+    def test_follow_backfills_timeline(self):
+        """Подписка добавляет в ленту старые посты автора."""
+        self.follow()
+        self.assertTrue(
+            Timeline.objects.filter(
+                user=self.follower,
+                post=TimelineTest.old_post,
+            ).exists()
+        )
+
+    def test_new_post_pushed_to_followers(self):
+        """Новый пост попадает в ленту подписчика."""
+        self.follow()
+        new_post = Post.objects.create(
+            author=self.author,
+            text='Пост после подписки',
+        )
+        self.assertTrue(
+            Timeline.objects.filter(
+                user=self.follower,
+                post=new_post,
+                pub_date=new_post.pub_date,
+            ).exists()
+        )
+
+    def test_unfollow_cleans_timeline(self):
+        """Отписка удаляет посты автора из ленты."""
+        self.follow().delete()
+        self.assertFalse(
+            Timeline.objects.filter(user=self.follower).exists()
+        )
+
+    @override_settings(POSTS_TIMELINE_LENGTH=3)
+    def test_timeline_length_is_capped(self):
+        """Длина ленты ограничена, остаются самые новые посты."""
+        self.follow()
+        posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            for i in range(5)
+        ]
+        call_command('trim_timelines', stdout=StringIO())
+        ids = set(Timeline.objects.filter(
+            user=self.follower).values_list('post', flat=True))
+        self.assertEqual(ids, {post.id for post in posts[-3:]})
+
+    def test_follow_index_reads_timeline(self):
+        """Лента подписок читается одним запросом к Timeline."""
+        self.follow()
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        ids = [post.id for post in response.context['page_obj']]
+        self.assertEqual(ids, [TimelineTest.old_post.id])
+
+    @override_settings(POSTS_FANOUT_LIMIT=1)
+    def test_popular_author_not_pushed(self):
+        """Посты популярного автора не рассылаются по лентам."""
+        self.follow()
+        new_post = Post.objects.create(
+            author=self.author,
+            text='Пост популярного автора',
+        )
+        self.assertFalse(
+            Timeline.objects.filter(user=self.follower).exists()
+        )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        ids = [post.id for post in response.context['page_obj']]
+        self.assertEqual(ids, [new_post.id, TimelineTest.old_post.id])
+
+    @override_settings(POSTS_FANOUT_LIMIT=2)
+    def test_popular_posts_merged_into_page_window(self):
+        """Посты популярного автора подмешиваются по окну страницы
+        без пропусков и повторов."""
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.author)
+        self.follow()
+        ordinary = User.objects.create_user(username='ordinary')
+        Follow.objects.create(user=self.follower, author=ordinary)
+        created = []
+        for i in range(15):
+            created.append(Post.objects.create(author=ordinary, text='О'))
+            created.append(Post.objects.create(author=self.author, text='П'))
+        expected = [post.id for post in reversed(created)]
+        expected.append(TimelineTest.old_post.id)
+        seen = []
+        url = reverse('posts:follow_index')
+        while url:
+            response = self.authorized_client.get(url)
+            page_obj = response.context['page_obj']
+            seen.extend(post.id for post in page_obj)
+            token = page_obj.paginator.next_cursor
+            url = token and reverse('posts:follow_index') + f'?cursor={token}'
+        self.assertEqual(seen, expected)
+
+    def walk(self, cursor=None, direction='next_cursor'):
+        """Страницы ленты от курсора cursor в направлении direction:
+        список id постов каждой страницы и курсор последней назад."""
+        pages, previous = [], None
+        while True:
+            url = reverse('posts:follow_index')
+            if cursor:
+                url += f'?cursor={cursor}'
+            page_obj = self.authorized_client.get(url).context['page_obj']
+            pages.append([post.id for post in page_obj])
+            previous = page_obj.paginator.previous_cursor
+            cursor = getattr(page_obj.paginator, direction)
+            if not cursor:
+                return pages, previous
+
+    @override_settings(POSTS_FANOUT_LIMIT=1)
+    def test_merged_page_size_bounded(self):
+        """Подмешанные посты не раздувают страницу: лишние переходят
+        на соседние страницы без пропусков и повторов."""
+        self.follow()
+        ordinary = User.objects.create_user(username='ordinary')
+        Follow.objects.create(user=self.follower, author=ordinary)
+        created = []
+        for i in range(12):
+            created.append(Post.objects.create(author=ordinary, text='О'))
+            created.append(Post.objects.create(author=self.author, text='П'))
+        expected = [post.id for post in reversed(created)]
+        expected.append(TimelineTest.old_post.id)
+        pages, previous = self.walk()
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), expected)
+        back, _ = self.walk(previous, 'previous_cursor')
+        self.assertEqual(back, pages[-2::-1])
+
+    @override_settings(POSTS_FANOUT_LIMIT=2)
+    def test_demoted_author_posts_spread(self):
+        """Посты, написанные автором в статусе популярного, попадают
+        в ленты командой demote_authors, когда подписчиков становится
+        меньше порога; до неё они подмешиваются при чтении."""
+        reader = User.objects.create_user(username='reader')
+        reader_follow = Follow.objects.create(user=reader, author=self.author)
+        self.follow()
+        new_post = Post.objects.create(author=self.author, text='Пост')
+        self.assertFalse(Timeline.objects.filter(post=new_post).exists())
+        reader_follow.delete()
+        self.assertFalse(Timeline.objects.filter(post=new_post).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        ids = [post.id for post in response.context['page_obj']]
+        self.assertEqual(ids, [new_post.id, TimelineTest.old_post.id])
+        call_command('demote_authors', stdout=StringIO())
+        self.assertTrue(Timeline.objects.filter(
+            user=self.follower, post=new_post).exists())
+        self.assertFalse(timeline.is_popular(self.author.pk))
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        ids = [post.id for post in response.context['page_obj']]
+        self.assertEqual(ids, [new_post.id, TimelineTest.old_post.id])
+
+    @override_settings(POSTS_FANOUT_LIMIT=4, POSTS_DEMOTE_SHARE=0.5)
+    def test_demotion_hysteresis(self):
+        """Автор у порога остаётся популярным: понижение только ниже
+        доли POSTS_DEMOTE_SHARE от порога."""
+        self.follow()
+        follows = [
+            Follow.objects.create(
+                user=User.objects.create_user(username=f'reader{i}'),
+                author=self.author)
+            for i in range(3)
+        ]
+        self.assertTrue(timeline.is_popular(self.author.pk))
+        follows.pop().delete()
+        call_command('demote_authors', stdout=StringIO())
+        self.assertTrue(timeline.is_popular(self.author.pk))
+        follows.pop().delete()
+        call_command('demote_authors', stdout=StringIO())
+        self.assertTrue(timeline.is_popular(self.author.pk))
+        follows.pop().delete()
+        call_command('demote_authors', stdout=StringIO())
+        self.assertFalse(timeline.is_popular(self.author.pk))
+
+    def test_remember_post_keeps_concurrent_posts(self):
+        """Параллельная запись в кэш последних постов не теряет посты."""
+        timeline.recent_posts(self.author.pk)
+        first = Post.objects.create(author=self.author, text='Первый')
+        second = Post.objects.create(author=self.author, text='Второй')
+        # второй писатель успел сменить поколение, но не список
+        cache.add(timeline.RECENT_GENERATION_KEY.format(self.author.pk), 0)
+        cache.incr(timeline.RECENT_GENERATION_KEY.format(self.author.pk))
+        timeline.remember_post(first)
+        ids = [pk for pk, _ in timeline.recent_posts(self.author.pk)]
+        self.assertEqual(ids[:2], [second.id, first.id])
+        third = Post.objects.create(author=self.author, text='Третий')
+        timeline.remember_post(third)
+        cached = cache.get(timeline.RECENT_KEY.format(self.author.pk))
+        self.assertEqual(cached[1][0][0], third.id)
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts.models import MediaFile, Post
+from posts.storage import file_digest
+from posts.uploads import LimitedUploadHandler
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(name, size=(60, 40), fmt='PNG'):
+    buffer = BytesIO()
+    Image.effect_noise(size, 64).convert('RGB').save(buffer, fmt)
+    return SimpleUploadedFile(name=name, content=buffer.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POSTS_RENDITION_WORKERS=0)
+class UploadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.auth_client = Client()
+        self.auth_client.force_login(self.user)
+
+    def upload(self, image):
+        return self.auth_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': image},
+        )
+
+    def assertRejected(self, response, message):
+        self.assertFalse(Post.objects.exists())
+        self.assertIn(message, response.context['form'].errors['image'][0])
+
+    @override_settings(POSTS_IMAGE_MAX_BYTES=1000)
+    def test_large_file_rejected(self):
+        """Файл больше предела отклоняется."""
+        self.assertRejected(self.upload(make_image('big.png')), 'Файл больше')
+
+    def test_wrong_signature_rejected(self):
+        """Картинка не разрешённого формата отклоняется по сигнатуре."""
+        response = self.upload(make_image('picture.png', fmt='BMP'))
+        self.assertRejected(response, 'Загрузите картинку')
+
+    @override_settings(POSTS_IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels_rejected(self):
+        """Картинка с числом точек больше предела отклоняется."""
+        self.assertRejected(
+            self.upload(make_image('wide.png')), 'слишком большая')
+
+    @override_settings(POSTS_IMAGE_MAX_SIDE=100)
+    def test_original_downscaled(self):
+        """Большой оригинал уменьшается при нарезке размеров
+        и сохраняется под хэшем уменьшенного файла."""
+        upload = make_image('large.jpg', size=(400, 300), fmt='JPEG')
+        original = file_digest(upload)
+        self.upload(upload)
+        post = Post.objects.get()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (100, 75))
+            self.assertEqual(image.format, 'JPEG')
+        with post.image.open() as file:
+            digest = file_digest(file)
+        self.assertEqual(post.image.name,
+                         f'posts/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertNotEqual(digest, original)
+        self.assertEqual(MediaFile.objects.get().name, post.image.name)
+        for entry in post.renditions.values():
+            for files in entry['formats'].values():
+                self.assertTrue(all(
+                    f'/{digest}/' in path for path, _ in files))
+
+    @override_settings(POSTS_IMAGE_MAX_BYTES=100000)
+    def test_admin_rejects_oversized(self):
+        """Файл, обрезанный обработчиком загрузки, не сохраняется
+        и через админку."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        client = Client()
+        client.force_login(admin)
+        response = client.post(reverse('admin:posts_post_add'), data={
+            'text': 'Пост из админки',
+            'author': admin.pk,
+            'image': make_image('big.jpg', size=(600, 400), fmt='JPEG'),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Post.objects.exists())
+        self.assertIn('Файл больше',
+                      str(response.context['adminform'].form.errors))
+
+    @override_settings(POSTS_IMAGE_MAX_BYTES=10)
+    def test_handler_stops_writing(self):
+        """Обработчик загрузки не пишет на диск больше предела."""
+        handler = LimitedUploadHandler()
+        handler.new_file('image', 'big.png', 'image/png', 100)
+        for start in range(0, 100, 8):
+            handler.receive_data_chunk(b'x' * 8, start)
+        upload = handler.file_complete(100)
+        self.assertTrue(upload.oversized)
+        self.assertEqual(upload.size, 100)
+        self.assertLessEqual(
+            os.path.getsize(upload.temporary_file_path()), 10)
+        upload.close()
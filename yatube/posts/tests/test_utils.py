@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.paginator import Page
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from posts.models import Post
+from posts.utils import CursorPaginator, decode_cursor
+
+User = get_user_model()
+
+
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Тестовый пост {i}')
+            for i in range(25)
+        )
+        cls.ids = list(
+            Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def walk(self, token):
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        return paginator, paginator.get_page(token)
+
+    def test_pages_follow_key_order(self):
+        """Курсор проходит всю выдачу без пропусков и повторов."""
+        paginator, page = self.walk(None)
+        seen = [post.pk for post in page]
+        numbers = [page.number]
+        while page.has_next():
+            paginator, page = self.walk(paginator.next_cursor)
+            seen.extend(post.pk for post in page)
+            numbers.append(page.number)
+        self.assertEqual(seen, CursorPaginatorTest.ids)
+        self.assertEqual(numbers, [1, 2, 3])
+        self.assertIsInstance(page, Page)
+
+    def test_previous_cursor_returns_previous_page(self):
+        """Курсор назад возвращает предыдущую страницу."""
+        paginator, page = self.walk(None)
+        first_ids = [post.pk for post in page]
+        paginator, page = self.walk(paginator.next_cursor)
+        paginator, page = self.walk(paginator.previous_cursor)
+        self.assertEqual([post.pk for post in page], first_ids)
+        self.assertEqual(page.number, 1)
+        self.assertFalse(page.has_previous())
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный токен даёт первую страницу."""
+        self.assertIsNone(decode_cursor('broken'))
+        paginator, page = self.walk('broken')
+        self.assertEqual(page.number, 1)
+        self.assertEqual(len(page), 10)
+
+    def test_out_of_range_cursor_returns_first_page(self):
+        """Токен с числами вне 64-битного диапазона даёт первую
+        страницу, а не ошибку сервера."""
+        for payload in ('["n", "2026-01-01T00:00:00+00:00", 1e400, 2]',
+                        f'["n", "2026-01-01T00:00:00+00:00", {10 ** 30}, 2]',
+                        f'["n", "2026-01-01T00:00:00+00:00", 1, {2 ** 63}]'):
+            token = urlsafe_base64_encode(force_bytes(payload))
+            self.assertIsNone(decode_cursor(token))
+            response = self.guest_client.get(
+                reverse('posts:index'), {'cursor': token})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['page_obj'].number, 1)
+
+    def test_cursor_page_query_count(self):
+        """Страница по курсору не выполняет COUNT и OFFSET."""
+        paginator, page = self.walk(None)
+        paginator, page = self.walk(paginator.next_cursor)
+        token = paginator.next_cursor
+        with self.assertNumQueries(1):
+            paginator, page = self.walk(token)
+            list(page)
+
+    def test_index_cursor_link(self):
+        """Главная страница отдаёт ссылку на следующую страницу."""
+        response = self.guest_client.get(reverse('posts:index'))
+        token = response.context['page_obj'].paginator.next_cursor
+        self.assertContains(response, f'?cursor={token}')
+        response = self.guest_client.get(
+            reverse('posts:index') + f'?cursor={token}')
+        self.assertEqual(response.context['page_obj'].number, 2)
@@ -1,7 +1,6 @@
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
 from django.conf import settings
 from django.urls import reverse
 from django import forms
@@ -341,14 +340,44 @@ class PostWiewsTests(TestCase):
         )
         response = self.guest_client.get(reverse('posts:index'))
         new_post_content = response.content
-        new_post.delete()
+        Post.objects.filter(pk=new_post.pk).update(text='Изменён в обход')
         response = self.guest_client.get(reverse('posts:index'))
         posts_cache_new_post = response.content
         self.assertEqual(new_post_content, posts_cache_new_post)
-        cache.clear()
+        new_post.delete()
         response = self.guest_client.get(reverse('posts:index'))
-        posts_cache_clear = response.content
-        self.assertNotEqual(posts_cache_new_post, posts_cache_clear)
+        posts_cache_delete = response.content
+        self.assertNotEqual(posts_cache_new_post, posts_cache_delete)
+
+    def test_cache_invalidated_by_changes(self):
+        '''Новый пост и комментарий сразу сбрасывают кэш страниц'''
+        group_1 = PostWiewsTests.group_1
+        addresses = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': group_1.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.user_auth_1.username}),
+        ]
+        for address in addresses:
+            self.guest_client.get(address)
+        new_post = Post.objects.create(
+            author=self.user_auth_1,
+            text='Пост после кэша',
+            group=group_1,
+        )
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.guest_client.get(address)
+                self.assertContains(response, 'Пост после кэша')
+        Comment.objects.create(
+            author=self.user_auth_2,
+            text='Коммент',
+            post=new_post,
+        )
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.guest_client.get(address)
+                self.assertContains(response, 'Комментариев: 1')
 
     def test_profile_follow_user_authorized(self):
         """Авторизованный пользователь может подписыватся на автора."""
@@ -0,0 +1,57 @@
+from .models import PATH_END, PATH_SEGMENT, Comment, thread_prefix
+
+MAX_DEPTH = 30  # ответы глубже становятся ответами на родителя
+
+
+def reply_parent(parent):
+    '''Комментарий, под которым встанет ответ на parent.'''
+    while parent.depth >= MAX_DEPTH:
+        parent = parent.parent
+    return parent
+
+
+def subtree(comment, after=None):
+    '''Все ответы в ветке comment по порядку обхода (один запрос
+    по индексу path); after — путь, после которого продолжить,
+    путь вне ветки не выводит за её начало.'''
+    prefix = thread_prefix(comment)
+    return Comment.objects.filter(
+        post_id=comment.post_id,
+        path__gt=max(after or prefix, prefix),
+        path__lt=prefix + PATH_END,
+    ).select_related('author').order_by('path')
+
+
+def attach_replies(roots, limit):
+    '''Первые limit ответов каждой ветки страницы одним запросом:
+    на каждую ветку — чтение диапазона индекса path с LIMIT,
+    ветки склеены UNION ALL. У корня появляются first_replies
+    и more_replies (есть ли ответы дальше).
+    '''
+    roots = list(roots)
+    if not roots:
+        return roots
+    parts, params = [], []
+    for number, root in enumerate(roots):
+        prefix = thread_prefix(root)
+        parts.append(
+            f'SELECT id FROM (SELECT id FROM {Comment._meta.db_table} '
+            'WHERE path > %s AND path < %s ORDER BY path LIMIT %s) '
+            f'AS thread_{number}'
+        )
+        params.extend([prefix, prefix + PATH_END, limit + 1])
+    table = Comment._meta.db_table
+    # RawSQL в pk__in попадает в скобки второй раз: IN ((...)) читается
+    # как одно скалярное значение, поэтому условие задаётся через extra
+    replies = Comment.objects.extra(
+        where=[f'{table}.id IN ({" UNION ALL ".join(parts)})'],
+        params=params,
+    ).select_related('author').order_by('path')
+    threads = {thread_prefix(root): [] for root in roots}
+    for reply in replies:
+        threads[reply.path[:PATH_SEGMENT]].append(reply)
+    for root in roots:
+        found = threads[thread_prefix(root)]
+        root.first_replies = found[:limit]
+        root.more_replies = len(found) > limit
+    return roots
@@ -0,0 +1,283 @@
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Count, Subquery
+
+from .models import Follow, Post, PostQuerySet, Timeline, UserCounter
+from .utils import CursorPaginator
+
+RECENT_KEY = 'posts:recent:{}'  # последние посты популярного автора
+RECENT_GENERATION_KEY = 'posts:recent-generation:{}'
+
+
+def popular_authors(authors):
+    '''Популярные авторы из authors (id или подзапрос): их посты не
+    рассылаются по лентам, а подмешиваются при чтении. Автор становится
+    популярным, набрав settings.POSTS_FANOUT_LIMIT подписчиков, и перестаёт
+    им быть, только опустившись ниже доли POSTS_DEMOTE_SHARE от порога:
+    подписки и отписки у порога не гоняют рассылку туда и обратно.
+    '''
+    return UserCounter.objects.filter(
+        user__in=authors, popular=True).values_list('user', flat=True)
+
+
+def is_popular(author_id):
+    return popular_authors([author_id]).exists()
+
+
+def recent_posts(author_id):
+    '''Последние посты автора [(pk, pub_date), ...], новые первыми.
+    Список в кэше помечен поколением автора: remember_post меняет
+    поколение через incr, и список чужого поколения собирается заново.
+    '''
+    key = RECENT_KEY.format(author_id)
+    generation_key = RECENT_GENERATION_KEY.format(author_id)
+    found = cache.get_many([key, generation_key])
+    generation = found.get(generation_key, 0)
+    cached = found.get(key)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    recent = list(
+        Post.objects.filter(author_id=author_id).order_by(
+            '-pub_date').values_list('pk', 'pub_date')[
+                :settings.POSTS_RECENT_LENGTH]
+    )
+    cache.set(key, (generation, recent), None)
+    return recent
+
+
+def remember_post(post):
+    '''Добавление нового поста в кэш последних постов автора после
+    коммита. Поколение растёт атомарно; пост дописывается, только если
+    в кэше список предыдущего поколения. Иначе список уже устарел
+    (его собрал читатель до коммита или дописал параллельный пост)
+    и будет собран заново при чтении, так что записи не теряются.
+    '''
+    key = RECENT_KEY.format(post.author_id)
+    generation_key = RECENT_GENERATION_KEY.format(post.author_id)
+    cache.add(generation_key, 0, None)
+    generation = cache.incr(generation_key)
+    cached = cache.get(key)
+    if cached is None or cached[0] != generation - 1:
+        return
+    recent = [(post.pk, post.pub_date)] + cached[1]
+    cache.set(key, (generation, recent[:settings.POSTS_RECENT_LENGTH]), None)
+
+
+def forget_post(post):
+    cache.delete(RECENT_KEY.format(post.author_id))
+
+
+def trim_timeline(user_id):
+    '''Обрезка ленты до settings.POSTS_TIMELINE_LENGTH записей.
+    Граница считается один раз по индексу (user, pub_date).
+    '''
+    length = settings.POSTS_TIMELINE_LENGTH
+    cutoff = Timeline.objects.filter(user_id=user_id).order_by(
+        '-pub_date', '-pk').values('pub_date')[length:length + 1]
+    Timeline.objects.filter(
+        user_id=user_id, pub_date__lte=Subquery(cutoff)).delete()
+
+
+def overflowed_timelines():
+    '''Пользователи, ленты которых длиннее POSTS_TIMELINE_LENGTH.'''
+    return Timeline.objects.order_by().values('user').annotate(
+        size=Count('pk')).filter(
+            size__gt=settings.POSTS_TIMELINE_LENGTH).values_list(
+                'user', flat=True)
+
+
+def push_post(post):
+    '''Рассылка нового поста в ленты подписчиков автора.
+    Посты популярных авторов только запоминаются в кэше.
+    Ленты при рассылке не обрезаются: это делает команда trim_timelines,
+    а чтение ленты и так берёт только самые новые записи.
+    '''
+    if is_popular(post.author_id):
+        transaction.on_commit(partial(remember_post, post))
+        return
+    fan_out(post.author_id, [(post.pk, post.pub_date)])
+
+
+def fan_out(author_id, posts):
+    '''Записи постов [(pk, pub_date), ...] в ленты подписчиков автора.'''
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list('user', flat=True)
+    Timeline.objects.bulk_create(
+        (
+            Timeline(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for user_id in followers.iterator()
+            for pk, pub_date in posts
+        ),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def author_promoted(author_id):
+    '''Автор набрал POSTS_FANOUT_LIMIT подписчиков: новые посты больше
+    не рассылаются, уже разосланные остаются в лентах.'''
+    UserCounter.objects.filter(user_id=author_id, popular=False).update(
+        popular=True)
+
+
+def demoted_authors():
+    '''Популярные авторы, у которых подписчиков стало меньше
+    POSTS_FANOUT_LIMIT * POSTS_DEMOTE_SHARE.'''
+    return UserCounter.objects.filter(
+        popular=True,
+        followers_count__lt=(settings.POSTS_FANOUT_LIMIT
+                             * settings.POSTS_DEMOTE_SHARE),
+    ).values_list('user', flat=True)
+
+
+def author_demoted(author_id):
+    '''Понижение автора из demoted_authors (команда demote_authors):
+    его посты больше не подмешиваются при чтении, поэтому последние
+    из них (столько же, сколько подмешивалось) рассылаются по лентам,
+    а кэш последних постов сбрасывается: новые посты в него не пишутся.
+    До понижения посты по-прежнему подмешиваются, ничего не теряется.
+    '''
+    with transaction.atomic():
+        fan_out(author_id, recent_posts(author_id))
+        UserCounter.objects.filter(user_id=author_id).update(popular=False)
+    cache.delete(RECENT_KEY.format(author_id))
+
+
+def mark_popular(authors):
+    '''Популярность авторов authors прямо по числу подписчиков, без
+    рассылки постов: для наборов данных, которые собираются заново.'''
+    counters = UserCounter.objects.filter(user__in=authors)
+    limit = settings.POSTS_FANOUT_LIMIT
+    counters.filter(followers_count__gte=limit).update(popular=True)
+    counters.filter(followers_count__lt=limit).update(popular=False)
+
+
+def backfill(user_id, author_id):
+    '''Добавление последних постов автора в ленту нового подписчика.'''
+    if is_popular(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date').values_list('pk', 'pub_date')
+    Timeline.objects.bulk_create(
+        (
+            Timeline(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts[:settings.POSTS_TIMELINE_LENGTH]
+        ),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    trim_timeline(user_id)
+
+
+def drop_author(user_id, author_id):
+    '''Удаление постов автора из ленты отписавшегося пользователя.'''
+    Timeline.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def timeline_for(user):
+    '''Лента подписок пользователя: одно чтение по индексу (user, pub_date).'''
+    return Timeline.objects.filter(user=user).select_related(
+        'post__author', 'post__group').only(
+            'pub_date', 'post', *PostQuerySet.fields(
+                PostQuerySet.LISTING, 'post__'))
+
+
+def page_window(page_obj):
+    '''Окно страницы ленты по позициям (pub_date, id поста):
+    lower <= позиция < upper, None — без границы. Окна соседних страниц
+    не пересекаются и вместе покрывают всю ленту. У страницы, полученной
+    по курсору назад, нижняя граница — сам курсор, он не входит в окно.
+    '''
+    paginator = page_obj.paginator
+    if getattr(paginator, 'newer', False):
+        return paginator.lower, paginator.upper
+    lower = position(page_obj[-1]) if page_obj.has_next() else None
+    if getattr(paginator, 'keyset', False):
+        return lower, paginator.upper
+    upper = None
+    if page_obj.has_previous():
+        upper = position(paginator.object_list[page_obj.start_index() - 2])
+    return lower, upper
+
+
+def position(entry):
+    return entry.pub_date, entry.post_id
+
+
+def post_position(post):
+    return post.pub_date, post.pk
+
+
+def in_window(position, lower, upper, newer=False):
+    if upper is not None and position >= upper:
+        return False
+    if lower is None:
+        return True
+    return position > lower if newer else position >= lower
+
+
+def merge_recent(page_obj, popular):
+    '''Посты страницы ленты вместе с постами популярных авторов
+    popular, попавшими в окно страницы, новые первыми.
+    '''
+    paginator = page_obj.paginator
+    posts = [entry.post for entry in page_obj]
+    lower, upper = page_window(page_obj)
+    seen = {post.pk for post in posts}
+    ids = [
+        pk
+        for author_id in popular
+        for pk, pub_date in recent_posts(author_id)
+        if pk not in seen and in_window(
+            (pub_date, pk), lower, upper, getattr(paginator, 'newer', False))
+    ]
+    if ids:
+        posts.extend(Post.objects.filter(pk__in=ids).for_listing())
+        posts.sort(key=post_position, reverse=True)
+    return posts
+
+
+def fill_page(page_obj, posts):
+    '''На странице остаётся не больше per_page постов, вытесненные
+    переходят на соседнюю страницу: курсоры считаются по показанным.
+    На страницах по номеру (старые ссылки) соседние окна фиксированы,
+    и вытесненные посты видны только в выдаче по курсору.
+    '''
+    paginator = page_obj.paginator
+    has_next = page_obj.has_next() or len(posts) > paginator.per_page
+    if getattr(paginator, 'newer', False):
+        # назад: остаются посты, ближайшие к курсору
+        posts = posts[-paginator.per_page:]
+    else:
+        posts = posts[:paginator.per_page]
+    page_obj.object_list = posts
+    if getattr(paginator, 'keyset', False):
+        paginator.set_cursors(page_obj, has_next, post_position)
+
+
+def follow_page(user, per_page, cursor=None, page=None):
+    '''Страница ленты подписок с постами популярных авторов:
+    по курсору cursor или, для старых ссылок, по номеру page.'''
+    entries = timeline_for(user)
+    if page is not None:
+        paginator = Paginator(entries.order_by('-pub_date', '-post_id'),
+                              per_page)
+        page_obj = paginator.get_page(page)
+    else:
+        paginator = CursorPaginator(
+            entries, per_page, tiebreak='post_id', fill_head=False)
+        page_obj = paginator.get_page(cursor)
+    popular = list(popular_authors(
+        Follow.objects.filter(user=user).values('author')))
+    posts = merge_recent(page_obj, popular)
+    if getattr(paginator, 'newer', False) and paginator.upper is None \
+            and len(posts) <= per_page:
+        # курсор назад дошёл до начала ленты
+        return follow_page(user, per_page)
+    fill_page(page_obj, posts)
+    return page_obj
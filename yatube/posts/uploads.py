@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+
+# начальные байты разрешённых форматов картинок
+SIGNATURES = {
+    'JPEG': (b'\xff\xd8\xff',),
+    'PNG': (b'\x89PNG\r\n\x1a\n',),
+    'GIF': (b'GIF87a', b'GIF89a'),
+    'WEBP': (b'RIFF',),
+}
+HEADER_SIZE = 16
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    '''Загрузка пишется во временный файл на диске по мере приёма,
+    в памяти воркера не бывает больше одного фрагмента.
+    Всё сверх settings.POSTS_IMAGE_MAX_BYTES отбрасывается,
+    а файл помечается как слишком большой: такой файл не пропустит
+    validate_upload у поля Post.image, в какой бы форме его ни прислали.
+    '''
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.oversized = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POSTS_IMAGE_MAX_BYTES:
+            self.oversized = True
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        upload.oversized = self.oversized
+        return upload
+
+
+def too_large():
+    return f'Файл больше {filesizeformat(settings.POSTS_IMAGE_MAX_BYTES)}.'
+
+
+def validate_upload(value):
+    '''Валидатор поля модели: обрезанная обработчиком загрузка
+    не сохраняется ни через PostForm, ни через админку.'''
+    # у ещё не сохранённого FieldFile file — сама загрузка
+    if getattr(value, '_committed', True):
+        return
+    if getattr(value.file, 'oversized', False):
+        raise ValidationError(too_large(), code='oversized')
+
+
+def image_format(upload):
+    '''Формат картинки по первым байтам файла, None — если не разрешён.'''
+    upload.seek(0)
+    header = upload.read(HEADER_SIZE)
+    upload.seek(0)
+    for name, signatures in SIGNATURES.items():
+        if name not in settings.POSTS_IMAGE_FORMATS:
+            continue
+        if any(header.startswith(signature) for signature in signatures):
+            if name == 'WEBP' and header[8:12] != b'WEBP':
+                continue
+            return name
+    return None
+
+
+def screen(upload):
+    '''Проверка загрузки до того, как её откроет Pillow:
+    размер файла и формат по сигнатуре. Возвращает текст ошибки или None.
+    '''
+    if (getattr(upload, 'oversized', False)
+            or upload.size > settings.POSTS_IMAGE_MAX_BYTES):
+        return too_large()
+    if image_format(upload) is None:
+        formats = ', '.join(settings.POSTS_IMAGE_FORMATS)
+        return f'Загрузите картинку в одном из форматов: {formats}.'
+    return None
+
+
+def check_pixels(image):
+    '''Проверка размеров по заголовку, без декодирования картинки.'''
+    width, height = image.size
+    if width * height > settings.POSTS_IMAGE_MAX_PIXELS:
+        return (f'Картинка {width}×{height} слишком большая: '
+                f'не больше {settings.POSTS_IMAGE_MAX_PIXELS:,} точек.')
+    return None
@@ -1,10 +1,209 @@
-from django.core.paginator import Paginator
+import json
 
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 
-def paginator_utils(request, queryset, posts_pages):
+from .models import Group, Post
+
+User = get_user_model()
+
+CURSOR_NEXT = 'n'  # курсор на более старые записи
+CURSOR_PREV = 'p'  # курсор на более новые записи
+GROUP_KEY = 'posts:group-id:{}'  # slug -> id
+GROUP_TIMEOUT = 60 * 5
+AUTHOR_KEY = 'posts:author:{}'  # username -> id
+POST_AUTHOR_KEY = 'posts:post-author:{}'  # id поста -> id автора
+MAX_INT = 2 ** 63 - 1  # целые в курсоре — не шире 64-битного поля
+
+
+def encode_cursor(direction, value, pk, number):
+    '''Упаковка позиции ключа (value, pk) в непрозрачный токен.'''
+    payload = json.dumps([direction, value.isoformat(), pk, number])
+    return urlsafe_base64_encode(force_bytes(payload))
+
+
+def decode_cursor(token):
+    '''Распаковка токена курсора.
+    Для испорченного токена возвращается None.
+    '''
+    try:
+        direction, value, pk, number = json.loads(
+            urlsafe_base64_decode(token).decode()
+        )
+        value = parse_datetime(value)
+        pk, number = int(pk), int(number)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if direction not in (CURSOR_NEXT, CURSOR_PREV) or value is None:
+        return None
+    if not (-MAX_INT <= pk <= MAX_INT and -MAX_INT <= number <= MAX_INT):
+        return None
+    return direction, value, pk, max(number, 1)
+
+
+def parse_id(value):
+    '''id записи из параметра запроса: не целое или вне диапазона
+    поля — 404, как для несуществующей записи.'''
+    try:
+        value = int(value)
+    except ValueError:
+        raise Http404
+    if not 0 < value <= MAX_INT:
+        raise Http404
+    return value
+
+
+class CursorPaginator(Paginator):
+    '''Пажинатор по ключу (key, pk) без COUNT и OFFSET.
+    key      - поле даты, по убыванию которого идёт выдача;
+    tiebreak - поле, различающее записи с одинаковой датой;
+    fill_head - курсор назад, за которым меньше страницы записей, даёт
+               первую страницу; иначе — эти записи (решает вызывающий).
+    Страницы запрашиваются по токену курсора, а не по номеру, поэтому
+    стоимость запроса не зависит от глубины страницы. Состояние окна
+    (next_cursor, previous_cursor) хранится в пажинаторе, сама страница
+    остаётся обычным Page.
+    '''
+    keyset = True
+
+    def __init__(self, object_list, per_page, key='pub_date',
+                 tiebreak='pk', fill_head=True, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.key = key
+        self.tiebreak = tiebreak
+        self.fill_head = fill_head
+        self.cursor = None
+        self.next_cursor = None
+        self.previous_cursor = None
+        # позиция (key, tiebreak), с которой начинается более новая
+        # выдача (None для первой страницы)
+        self.upper = None
+        # страница получена по курсору назад от позиции lower
+        self.newer = False
+        self.lower = None
+        # известные границы выдачи вместо COUNT(*)
+        self.count = 0
+        self.num_pages = 1
+
+    def _seek(self, value, pk, newer):
+        if newer:
+            lookup, ordering = 'gt', (self.key, self.tiebreak)
+        else:
+            lookup, ordering = 'lt', ('-' + self.key, '-' + self.tiebreak)
+        seek = (
+            Q(**{f'{self.key}__{lookup}': value})
+            | Q(**{self.key: value, f'{self.tiebreak}__{lookup}': pk})
+        )
+        return self.object_list.filter(seek).order_by(*ordering)
+
+    def _head(self):
+        return self.object_list.order_by('-' + self.key, '-' + self.tiebreak)
+
+    def position(self, obj):
+        '''Позиция записи в выдаче: (key, tiebreak).'''
+        return getattr(obj, self.key), getattr(obj, self.tiebreak)
+
+    def get_page(self, cursor):
+        '''Страница по токену курсора.
+        Пустой или испорченный токен даёт первую страницу.
+        '''
+        position = decode_cursor(cursor) if cursor else None
+        limit = self.per_page + 1
+        if position is None:
+            rows, number, has_next = list(self._head()[:limit]), 1, None
+        else:
+            direction, value, pk, number = position
+            newer = direction == CURSOR_PREV
+            rows = list(self._seek(value, pk, newer)[:limit])
+            if newer:
+                if len(rows) < limit and self.fill_head:
+                    # впереди ничего нет: это начало выдачи
+                    rows = list(self._head()[:limit])
+                    number, has_next = 1, None
+                else:
+                    if len(rows) == limit:
+                        self.upper = self.position(rows[self.per_page])
+                    self.newer, self.lower = True, (value, pk)
+                    rows = rows[:self.per_page][::-1]
+                    number, has_next = max(number, 2), True
+            else:
+                self.upper, has_next = (value, pk), None
+            self.cursor = cursor
+        if has_next is None:
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        self.count = (number - 1) * self.per_page + len(rows)
+        page = Page(rows, number, self)
+        self.set_cursors(page, has_next)
+        return page
+
+    def set_cursors(self, page, has_next, position=None):
+        '''Курсоры соседних страниц от первой и последней записи
+        страницы: после подмены page.object_list их можно пересчитать,
+        передав position — позицию (key, tiebreak) новых записей.'''
+        position = position or self.position
+        number, rows = page.number, list(page.object_list)
+        self.num_pages = number + 1 if has_next else number
+        self.previous_cursor = self.next_cursor = None
+        if not rows:
+            return
+        if number > 1:
+            self.previous_cursor = encode_cursor(
+                CURSOR_PREV, *position(rows[0]), number - 1)
+        if has_next:
+            self.next_cursor = encode_cursor(
+                CURSOR_NEXT, *position(rows[-1]), number + 1)
+
+
+def paginator_utils(request, queryset, posts_pages, key='pub_date',
+                    tiebreak='pk'):
     '''Утилита пажинатора
-    posts_pages - количество выводимых постов пажинатором
+    posts_pages - количество выводимых постов пажинатором;
+    key         - поле даты для постраничного вывода по курсору,
+                  None — выдача не по дате (поиск), только по номерам;
+    tiebreak    - поле для порядка записей с одинаковой датой.
+    Явный ?page= обслуживается классическим Paginator (старые ссылки),
+    во всех остальных случаях выдача идёт по курсору ?cursor=.
     '''
-    paginator = Paginator(queryset, posts_pages)
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    if page_number is not None or key is None:
+        paginator = Paginator(queryset, posts_pages)
+        return paginator.get_page(page_number)
+    paginator = CursorPaginator(queryset, posts_pages, key=key,
+                                tiebreak=tiebreak)
+    return paginator.get_page(request.GET.get('cursor'))
+
+
+def _cached_value(key, queryset, field):
+    value = cache.get(key)
+    if value is None:
+        value = queryset.values_list(field, flat=True).first()
+        if value is None:
+            raise Http404
+        cache.set(key, value, GROUP_TIMEOUT)
+    return value
+
+
+def author_id_by_username(username):
+    '''id пользователя по username без запроса к базе для горячих профилей.'''
+    return _cached_value(AUTHOR_KEY.format(username),
+                         User.objects.filter(username=username), 'pk')
+
+
+def group_id_by_slug(slug):
+    '''id группы по slug без запроса к базе для горячих групп. Сама группа
+    не кэшируется: счётчик постов в ней меняется без сигналов.'''
+    return _cached_value(GROUP_KEY.format(slug),
+                         Group.objects.filter(slug=slug), 'pk')
+
+
+def post_author_id(post_id):
+    '''id автора поста: автор у поста не меняется, ключ живёт до удаления.'''
+    return _cached_value(POST_AUTHOR_KEY.format(post_id),
+                         Post.objects.filter(pk=post_id), 'author_id')
@@ -0,0 +1,83 @@
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY = 'posts:version:{}'
+MODIFIED_KEY = 'posts:modified:{}'  # время последней смены версии
+
+
+def scope(name, pk=None):
+    '''Имя области кэша: index, group:<id>, profile:<id>, post:<id>.'''
+    return name if pk is None else f'{name}:{pk}'
+
+
+def initial():
+    # после вытеснения ключа версия не должна повториться
+    return int(time.time() * 1000)
+
+
+def _start(key):
+    cache.add(key, initial(), None)
+    return cache.get(key) or initial()
+
+
+def get_version(name, pk=None):
+    '''Текущая версия содержимого области для ключей фрагментов кэша.'''
+    key = VERSION_KEY.format(scope(name, pk))
+    version = cache.get(key)
+    if version is None:
+        version = _start(key)
+    return version
+
+
+def get_versions(*scopes):
+    '''Версии нескольких областей одним обращением к кэшу.'''
+    keys = [VERSION_KEY.format(name) for name in scopes]
+    found = cache.get_many(keys)
+    return tuple(found.get(key) or _start(key) for key in keys)
+
+
+def bump(*scopes):
+    '''Смена версий областей: закэшированные фрагменты перестают читаться.'''
+    for name in scopes:
+        key = VERSION_KEY.format(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, initial(), None)
+    now = time.time()
+    cache.set_many({MODIFIED_KEY.format(name): now for name in scopes}, None)
+
+
+def last_modified(*scopes):
+    '''Время последнего изменения областей (timestamp) одним обращением
+    к кэшу. Области без отметки (ещё не менялись или ключ вытеснен)
+    получают текущее время: оно не раньше настоящего изменения.'''
+    keys = [MODIFIED_KEY.format(name) for name in scopes]
+    found = cache.get_many(keys)
+    now = time.time()
+    for key in keys:
+        if key not in found:
+            cache.add(key, now, None)
+            found[key] = now
+    return max(found.values())
+
+
+def reset(*scopes):
+    '''Сброс версий многих областей одним обращением к кэшу:
+    следующее чтение заведёт версию заново от текущего времени,
+    как после вытеснения ключа.'''
+    cache.delete_many([key.format(name) for name in scopes
+                       for key in (VERSION_KEY, MODIFIED_KEY)])
+
+
+def post_scopes(author_id, *group_ids, post_id=None):
+    '''Области, в которых показывается пост.'''
+    scopes = [scope('index'), scope('profile', author_id)]
+    if post_id is not None:
+        scopes.append(scope('post', post_id))
+    scopes.extend(
+        scope('group', group_id)
+        for group_id in set(group_ids) if group_id is not None
+    )
+    return scopes
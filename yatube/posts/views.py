@@ -1,10 +1,22 @@
+from urllib.parse import urlencode
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
+from .counters import counter_for
 from .forms import PostForm, CommentForm
-from .models import Group, Post, Follow
-from .utils import paginator_utils
+from .models import Comment, Group, Post
+from .pagecache import (cache_for_anonymous, conditional_page,
+                        detail_scopes, group_scopes, index_scopes,
+                        profile_scopes, thread_scopes)
+from .search import SearchResults
+from .threads import attach_replies, reply_parent, subtree
+from .timeline import follow_page
+from .utils import (CursorPaginator, paginator_utils, parse_id,
+                    post_author_id)
+from .versions import get_version
 
 User = get_user_model()
 
@@ -12,52 +24,68 @@ index_posts_pages: int = 10  # количество выводимых пост
 group_posts_pages: int = 10  # количество выводимых постов в сообществе
 authr_posts_pages: int = 10  # количество выводимых постов в профайле
 follow_index_pages: int = 10  # количество выводимых постов в подписках
+search_posts_pages: int = 10  # количество выводимых постов в поиске
+comments_pages: int = 20  # количество веток комментариев на странице поста
+comments_replies: int = 3  # первых ответов в ветке на странице поста
+replies_pages: int = 50  # ответов в ветке за одну подгрузку
 
 
+@cache_for_anonymous(index_scopes)
 def index(request):
     '''Главная страница.'''
-    post_list = Post.objects.select_related()
+    post_list = Post.objects.for_listing()
     page_obj = paginator_utils(request, post_list, index_posts_pages)
     context = {
         'page_obj': page_obj,
+        'version': get_version('index'),
     }
     return render(request, 'posts/index.html', context)
 
 
+@cache_for_anonymous(group_scopes)
+@conditional_page(group_scopes)
 def group_posts(request, slug):
     '''Страницы сообщества.'''
     group = get_object_or_404(Group, slug=slug)
-    group_list = group.posts.select_related()
+    group_list = group.posts.for_listing()
     page_obj = paginator_utils(request, group_list, group_posts_pages)
     context = {
         'group': group,
         'page_obj': page_obj,
+        'version': get_version('group', group.pk),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@cache_for_anonymous(profile_scopes)
+@conditional_page(profile_scopes)
 def profile(request, username):
     '''Страницы профайла.'''
-    user_obj = get_object_or_404(User, username=username)
-    authr_posts = user_obj.posts.select_related()
-    count = authr_posts.count()
+    user_obj = get_object_or_404(
+        User.objects.select_related('counter'), username=username)
+    authr_posts = user_obj.posts.for_listing()
+    counter = counter_for(user_obj)
     page_obj = paginator_utils(request, authr_posts, authr_posts_pages)
     following = user_obj.following.select_related(
         'user').filter(user=request.user.id)
     context = {
         'user_obj': user_obj,
-        'count': count,
+        'count': counter.posts_count,
+        'counter': counter,
         'page_obj': page_obj,
         'following': following,
+        'version': get_version('profile', user_obj.pk),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@cache_for_anonymous(detail_scopes)
+@conditional_page(detail_scopes)
 def post_detail(request, post_id):
     '''Страницы просмотра записи поста.'''
-    post = get_object_or_404(Post, id=post_id)
-    count = Post.objects.filter(author=post.author).count()
-    comments = post.comments.all()
+    post = get_object_or_404(Post.objects.for_detail(), id=post_id)
+    count = counter_for(post.author).posts_count
+    comments = comment_page(request, post.pk)
     form = CommentForm()
     context = {
         'post': post,
@@ -68,6 +96,84 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+@cache_for_anonymous(index_scopes)
+def search(request):
+    '''Страница поиска по постам и комментариям.'''
+    query = request.GET.get('q', '').strip()
+    results = SearchResults(query, Post.objects.for_listing())
+    page_obj = paginator_utils(request, results, search_posts_pages, key=None)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        # ссылки пажинатора сохраняют запрос
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def comment_page(request, post_id):
+    '''Страница веток комментариев поста по курсору с первыми ответами:
+    два запроса (корни веток по индексу (post, parent, created) и ответы
+    по индексу path), сколько бы комментариев ни было у поста.'''
+    paginator = CursorPaginator(
+        Comment.objects.filter(
+            post_id=post_id, parent=None).select_related('author'),
+        comments_pages, key='created')
+    page = paginator.get_page(request.GET.get('cursor'))
+    attach_replies(page.object_list, comments_replies)
+    return page
+
+
+def comment_json(comment):
+    return {
+        'id': comment.pk,
+        'parent': comment.parent_id,
+        'depth': comment.depth,
+        'author': comment.author.username,
+        'text': comment.text,
+        'created': comment.created,
+    }
+
+
+@cache_for_anonymous(detail_scopes)
+def comments(request, post_id):
+    '''Следующие ветки комментариев поста для кнопки «Показать ещё»:
+    фрагмент HTML или JSON (?format=json).'''
+    post_author_id(post_id)
+    page = comment_page(request, post_id)
+    if request.GET.get('format') == 'json':
+        more = page.paginator.next_cursor
+        return JsonResponse({
+            'comments': [
+                dict(comment_json(comment), replies=[
+                    comment_json(reply) for reply in comment.first_replies
+                ], more_replies=comment.more_replies)
+                for comment in page
+            ],
+            'next': f'?cursor={more}&format=json' if more else None,
+        })
+    context = {
+        'comments': page,
+        'post_id': post_id,
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
+@cache_for_anonymous(thread_scopes)
+def replies(request, post_id, comment_id):
+    '''Продолжение ветки комментария: ответы после пути ?after=
+    по порядку обхода, не больше replies_pages за раз.'''
+    root = get_object_or_404(Comment, pk=comment_id, post_id=post_id)
+    found = list(subtree(root, request.GET.get('after'))[:replies_pages + 1])
+    context = {
+        'root': root,
+        'replies': found[:replies_pages],
+        'more': len(found) > replies_pages,
+        'post_id': post_id,
+    }
+    return render(request, 'posts/includes/reply_list.html', context)
+
+
 @login_required
 def post_create(request):
     '''Страница создания записи поста.'''
@@ -77,9 +183,8 @@ def post_create(request):
     )
     if request.method == "POST":
         if form.is_valid():
-            form_buf = form.save(commit=False)
-            form_buf.author_id = request.user.pk
-            form_buf.save()
+            form.instance.author_id = request.user.pk
+            form.save()
             return redirect('posts:profile', username=request.user)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -116,6 +221,10 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
+        parent_id = request.POST.get('parent')
+        if parent_id:
+            comment.parent = reply_parent(get_object_or_404(
+                Comment, pk=parse_id(parent_id), post=post))
         comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
@@ -123,11 +232,8 @@ def add_comment(request, post_id):
 @login_required
 def follow_index(request):
     '''Страница просмотра постов авторов в подписке.'''
-    follow = Follow.objects.values_list('author',
-                                        flat=True
-                                        ).filter(user=request.user)
-    follow_list = Post.objects.filter(author__in=follow)
-    page_obj = paginator_utils(request, follow_list, follow_index_pages)
+    page_obj = follow_page(request.user, follow_index_pages,
+                           request.GET.get('cursor'), request.GET.get('page'))
     context = {
         'page_obj': page_obj,
     }
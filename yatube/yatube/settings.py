@@ -36,7 +36,6 @@ ALLOWED_HOSTS = [
 # Application definition
 
 INSTALLED_APPS = [
-    'sorl.thumbnail',
     'about.apps.AboutConfig',
     'core.apps.CoreConfig',
     'users.apps.UsersConfig',
@@ -51,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,6 +59,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'posts.pagecache.PageCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -67,7 +68,7 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backend.InstrumentedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -157,14 +158,128 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 
 # CACHE
+# Бэкенд выбирается переменной окружения YATUBE_CACHE:
+# memcached — общий кэш в продакшене,
+# sqlite    — общий для всех воркеров кэш в файле на одной машине,
+# locmem    — отдельный кэш в каждом процессе (по умолчанию).
+# Перед общим кэшем (shared) стоит короткоживущий кэш процесса (L1):
+# самые горячие фрагменты и объекты читаются без обращения к сети.
+
+CACHE_BACKENDS = {
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.getenv('MEMCACHED_LOCATION', '127.0.0.1:11211'),
+    },
+    'sqlite': {
+        'BACKEND': 'core.cache.sqlite.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'MAX_SIZE': 64 * 1024 * 1024,
+        },
+    },
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.tiered.TieredCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'MAX_ENTRIES': 500,
+            'L1_TIMEOUT': 5,
+            'SYNC_INTERVAL': 1,
+        },
+    },
+    'shared': CACHE_BACKENDS[os.getenv('YATUBE_CACHE', 'locmem')],
+    # {% cache %} берёт этот алиас сам: те же записи default плюс счёт
+    # попаданий и промахов для метрик
+    'template_fragments': {
+        'BACKEND': 'core.cache.fragments.FragmentCache',
+        'OPTIONS': {'CACHE': 'default'},
+    },
+}
+
+# Лента подписок: сколько последних постов хранится у пользователя
+
+POSTS_TIMELINE_LENGTH = 1000
+
+# Посты авторов с таким числом подписчиков не рассылаются по лентам,
+# а подмешиваются при чтении из кэша последних постов автора.
+# Обратно к рассылке автор переходит ниже доли POSTS_DEMOTE_SHARE
+# от порога (команда demote_authors)
+
+POSTS_FANOUT_LIMIT = 5000
+POSTS_DEMOTE_SHARE = 0.9
+POSTS_RECENT_LENGTH = 200
+
+# Размеры картинок постов, которые готовятся при загрузке:
+# size   — основной размер, картинка обрезается по центру,
+# widths — уменьшенные копии для srcset,
+# sizes  — атрибут sizes тега <img>.
+# Нарезкой заняты процессы-воркеры; 0 — нарезка прямо в запросе.
+
+POSTS_RENDITIONS = {
+    'card': {
+        'size': (960, 339),
+        'widths': (320, 480, 640),
+        'sizes': '(min-width: 992px) 720px, 100vw',
+    },
 }
+POSTS_RENDITION_WORKERS = 2
+
+# Форматы в порядке предпочтения, последний — для старых браузеров;
+# форматы, которые не умеет сохранять Pillow, пропускаются
+
+POSTS_RENDITION_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+
+# Загрузка картинок: файл пишется на диск по мере приёма,
+# проверяется по сигнатуре и заголовку без декодирования,
+# а оригинал больше POSTS_IMAGE_MAX_SIDE уменьшается в воркере
+
+FILE_UPLOAD_HANDLERS = ['posts.uploads.LimitedUploadHandler']
+POSTS_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+POSTS_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+POSTS_IMAGE_MAX_SIDE = 2560
+POSTS_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+# Страницы для анонимных читателей: предельное время жизни ответа в кэше
+
+PAGE_CACHE_TIMEOUT = 60 * 10
 
 #  DjDT
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
+
+# Поиск по постам: бэкенд выбирается по базе (SQLite — FTS5,
+# остальные — LIKE), здесь можно указать свой класс posts.search
+
+POSTS_SEARCH_BACKEND = None
+
+# Массовые операции админки: выполняются частями по POSTS_BULK_CHUNK
+# объектов, от POSTS_BULK_THRESHOLD — фоновой задачей в пуле потоков
+# (0 воркеров — прямо в запросе). Задача, которая не продвигалась
+# POSTS_BULK_STALE секунд, считается оборванной перезапуском сервера
+
+POSTS_BULK_CHUNK = 500
+POSTS_BULK_THRESHOLD = 1000
+POSTS_BULK_WORKERS = 1
+POSTS_BULK_STALE = 15 * 60
+
+# Метрики запросов по представлениям для Prometheus (/metrics/):
+# доступны сотрудникам и по токену YATUBE_METRICS_TOKEN
+# (Authorization: Bearer <токен>). Гистограммы у каждого процесса свои.
+# Дампы cProfile: доля запросов METRICS_PROFILE_RATE (0 — только
+# по заявке POST /metrics/profiles/ с view и count), хранятся последние
+# METRICS_PROFILE_KEEP
+
+METRICS_TOKEN = os.getenv('YATUBE_METRICS_TOKEN', '')
+METRICS_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+METRICS_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+METRICS_PROFILE_RATE = 0
+METRICS_PROFILE_KEEP = 50
@@ -23,6 +23,7 @@ urlpatterns = [
     path('auth/', include('users.urls', namespace='users')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('metrics/', include('core.urls', namespace='core')),
     path('', include('posts.urls', namespace='posts')),
 ]
 